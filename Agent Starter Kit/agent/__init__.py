@@ -1,10 +1,67 @@
-from .agent import build_agent, get_agent_tools
-from .factory import get_llm_for
+import importlib
+from typing import TYPE_CHECKING
 
-__all__ = [
-	"build_agent",
-	"get_agent_tools",
-	"get_llm_for",
-]
+# Exports are imported from their submodule on first use, so `import agent` does not load LangChain,
+# the provider SDKs or SQLAlchemy until something needs them
+_EXPORTS = {
+	"build_agent": "agent",
+	"get_agent_tools": "agent",
+	"ParallelAgentExecutor": "executor",
+	"AgentSession": "sessions",
+	"SessionManager": "sessions",
+	"PromptTokenTracker": "scratchpad",
+	"ScratchpadCompactor": "scratchpad",
+	"StreamTiming": "streaming",
+	"astream_agent": "streaming",
+	"astream_structured": "streaming",
+	"astream_text": "streaming",
+	"get_llm_for": "factory",
+	"get_structured_llm_for": "factory",
+	"get_model_pool_stats": "factory",
+	"get_rate_limiter_stats": "ratelimit",
+	"get_response_cache_stats": "cache",
+	"get_image_cache_stats": "images",
+	"get_retrieval_stats": "retrieval",
+	"get_routing_stats": "routing",
+	"get_singleflight_stats": "singleflight",
+	"get_fetch_cache_stats": "http_client",
+	"get_fetch_strategy_stats": "fetch_strategy",
+	"HistogramSink": "metrics",
+	"JsonlSink": "metrics",
+	"PrometheusSink": "metrics",
+	"add_metrics_sink": "metrics",
+	"format_metrics_summary": "metrics",
+	"get_metrics_summary": "metrics",
+}
 
+__all__ = list(_EXPORTS)
 
+def __getattr__(name: str):
+	module = _EXPORTS.get(name)
+	if module is None:
+		raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+	value = getattr(importlib.import_module(f".{module}", __name__), name)
+	globals()[name] = value
+	return value
+
+
+def __dir__():
+	return sorted({*globals(), *__all__})
+
+
+if TYPE_CHECKING:
+	from .agent import build_agent, get_agent_tools
+	from .executor import ParallelAgentExecutor
+	from .sessions import AgentSession, SessionManager
+	from .scratchpad import PromptTokenTracker, ScratchpadCompactor
+	from .streaming import StreamTiming, astream_agent, astream_structured, astream_text
+	from .factory import get_llm_for, get_structured_llm_for, get_model_pool_stats
+	from .ratelimit import get_rate_limiter_stats
+	from .cache import get_response_cache_stats
+	from .images import get_image_cache_stats
+	from .retrieval import get_retrieval_stats
+	from .routing import get_routing_stats
+	from .singleflight import get_singleflight_stats
+	from .http_client import get_fetch_cache_stats
+	from .fetch_strategy import get_fetch_strategy_stats
+	from .metrics import HistogramSink, JsonlSink, PrometheusSink, add_metrics_sink, format_metrics_summary, get_metrics_summary
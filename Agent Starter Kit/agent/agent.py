@@ -2,7 +2,10 @@ from typing import List, Optional
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
+from agent.executor import ParallelAgentExecutor
 from agent.factory import get_llm_for
+from agent.scratchpad import AGENT_MODEL_TAG, build_scratchpad_compactor
+from agent.settings import AGENT_CONFIG
 from agent.tools import (
 	read_webpage,
 	analyze_image,
@@ -10,6 +13,7 @@ from agent.tools import (
 	text_summary,
 	internet_search,
 	safe_calculate,
+	recall_observation,
 )
 
 
@@ -24,12 +28,36 @@ def get_agent_tools():
 	]
 
 
-def build_agent(system_prompt: Optional[str] = None) -> AgentExecutor:
+def build_agent(
+	system_prompt: Optional[str] = None,
+	parallel_tools: Optional[bool] = None,
+	max_parallel_tools: Optional[int] = None,
+	verbose: Optional[bool] = None,
+	compact_scratchpad: Optional[bool] = None,
+) -> AgentExecutor:
 	"""
 	Create a tool-calling agent with the configured central model and the toolkit from this package.
+	With parallel_tools (default from models.yaml `agent_executor`), tool calls requested in the same step
+	run concurrently, at most max_parallel_tools at a time.
+	The executor is stateless (conversation history is passed in as `chat_history`), so one instance can
+	serve many concurrent runs; see agent.sessions.SessionManager.
+	With compact_scratchpad (default from models.yaml `scratchpad`), older tool results are compacted once
+	the scratchpad exceeds its token budget, and the agent gets recall_observation to read them back.
+	verbose (default from models.yaml `agent_executor`) prints LangChain's step trace; timings, tokens and cost
+	of every model call and tool run are recorded by agent.metrics either way.
 	"""
+	executor_cfg = AGENT_CONFIG.get("agent_executor") or {}
+	if parallel_tools is None:
+		parallel_tools = executor_cfg.get("parallel_tools", True)
+	if max_parallel_tools is None:
+		max_parallel_tools = executor_cfg.get("max_parallel_tools", 4)
+	if verbose is None:
+		verbose = executor_cfg.get("verbose", False)
 	tools = get_agent_tools()
 	llm = get_llm_for("agent-core")
+	compactor = build_scratchpad_compactor(llm.model_name, enabled=compact_scratchpad)
+	if compactor is not None:
+		tools = [*tools, recall_observation]
 
 	prompt = ChatPromptTemplate.from_messages([
 		("system", system_prompt or (
@@ -38,11 +66,20 @@ def build_agent(system_prompt: Optional[str] = None) -> AgentExecutor:
 			"always include an 'instruction' argument that clearly describes what to extract or produce. "
 			"Think step-by-step. Be concise and cite sources when browsing URLs."
 		)),
+		MessagesPlaceholder(variable_name="chat_history", optional=True),
 		("human", "{input}"),
 		MessagesPlaceholder(variable_name="agent_scratchpad"),
 	])
 
-	agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt)
-	return AgentExecutor(agent=agent, tools=tools, verbose=True)
+	# The tag marks the agent's own model calls (see scratchpad.PromptTokenTracker); llm_task labels their metrics
+	agent = create_tool_calling_agent(llm=llm, tools=tools, prompt=prompt).with_config(
+		tags=[AGENT_MODEL_TAG], metadata={"llm_task": "agent-core"}
+	)
+	executor_kwargs = {"agent": agent, "tools": tools, "verbose": verbose}
+	if compactor is not None:
+		executor_kwargs["trim_intermediate_steps"] = compactor
+	if parallel_tools:
+		return ParallelAgentExecutor(**executor_kwargs, max_parallel_tools=max_parallel_tools)
+	return AgentExecutor(**executor_kwargs)
 
 
@@ -0,0 +1,217 @@
+import hashlib
+import os
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+from pydantic import BaseModel
+from sqlalchemy import Column, Float, Integer, String, Text, create_engine, delete, func, select
+from sqlalchemy.orm import Session, declarative_base
+
+from agent.settings import AGENT_CONFIG
+
+_Base = declarative_base()
+
+
+class _CacheRow(_Base):
+	__tablename__ = "llm_response_cache"
+	key = Column(String(64), primary_key=True)
+	value = Column(Text, nullable=False)
+	created_at = Column(Float, nullable=False, index=True)
+	accessed_at = Column(Float, nullable=False, index=True)
+	size = Column(Integer, nullable=False)
+
+
+def _serializable(generations: Sequence[Generation]) -> list:
+	# Native structured output leaves the parsed Pydantic object in additional_kwargs; store it as a dict
+	out = []
+	for generation in generations:
+		message = getattr(generation, "message", None)
+		parsed = getattr(message, "additional_kwargs", {}).get("parsed")
+		if isinstance(parsed, BaseModel):
+			message = message.model_copy(update={"additional_kwargs": {**message.additional_kwargs, "parsed": parsed.model_dump()}})
+			generation = generation.model_copy(update={"message": message})
+		out.append(generation)
+	return out
+
+
+class ResponseCache(BaseCache):
+	"""
+	Two-tier LangChain response cache: an in-process LRU in front of a SQLite table.
+
+	Keys are sha256(llm_string + prompt), where llm_string covers the model config and bound kwargs
+	(tools, structured-output schema) and prompt is the serialized message list. Entries older than
+	ttl_seconds are ignored and purged; the table is trimmed to max_entries by least-recent access.
+	"""
+
+	def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_entries: int = 10000, memory_entries: int = 512):
+		self.ttl_seconds = ttl_seconds
+		self.max_entries = max_entries
+		self.memory_entries = memory_entries
+		self._engine = create_engine(f"sqlite:///{path}")
+		_Base.metadata.create_all(self._engine)
+		self._memory: "OrderedDict[str, tuple[float, list]]" = OrderedDict()
+		self._lock = threading.Lock()
+		self._writes_since_prune = 0
+		self.memory_hits = 0
+		self.disk_hits = 0
+		self.misses = 0
+		self.writes = 0
+		self.evictions = 0
+
+	@staticmethod
+	def _key(prompt: str, llm_string: str) -> str:
+		return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+	def _expired(self, created_at: float, now: float) -> bool:
+		return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+	def _remember(self, key: str, created_at: float, generations: list) -> None:
+		with self._lock:
+			self._memory[key] = (created_at, generations)
+			self._memory.move_to_end(key)
+			while len(self._memory) > self.memory_entries:
+				self._memory.popitem(last=False)
+
+	def _lookup_memory(self, key: str, now: float) -> Optional[list]:
+		with self._lock:
+			entry = self._memory.get(key)
+			if entry is None:
+				return None
+			if self._expired(entry[0], now):
+				del self._memory[key]
+				return None
+			self._memory.move_to_end(key)
+			self.memory_hits += 1
+			return entry[1]
+
+	def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+		key = self._key(prompt, llm_string)
+		now = time.time()
+		generations = self._lookup_memory(key, now)
+		if generations is not None:
+			return generations
+		with Session(self._engine) as session:
+			row = session.get(_CacheRow, key)
+			if row is None or self._expired(row.created_at, now):
+				if row is not None:
+					session.delete(row)
+					session.commit()
+				with self._lock:
+					self.misses += 1
+				return None
+			row.accessed_at = now
+			created_at, value = row.created_at, row.value
+			session.commit()
+		with warnings.catch_warnings():
+			warnings.simplefilter("ignore", LangChainBetaWarning)
+			generations = loads(value)
+		self._remember(key, created_at, generations)
+		with self._lock:
+			self.disk_hits += 1
+		return generations
+
+	async def alookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+		# Memory hits are answered on the event loop; only SQLite access goes to a thread
+		generations = self._lookup_memory(self._key(prompt, llm_string), time.time())
+		if generations is not None:
+			return generations
+		return await super().alookup(prompt, llm_string)
+
+	def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+		key = self._key(prompt, llm_string)
+		now = time.time()
+		generations = _serializable(return_val)
+		value = dumps(generations)
+		with Session(self._engine) as session:
+			session.merge(_CacheRow(key=key, value=value, created_at=now, accessed_at=now, size=len(value)))
+			session.commit()
+		self._remember(key, now, generations)
+		with self._lock:
+			self.writes += 1
+			self._writes_since_prune += 1
+			prune = self._writes_since_prune >= max(1, self.max_entries // 100)
+			if prune:
+				self._writes_since_prune = 0
+		if prune:
+			self.prune()
+
+	def prune(self) -> int:
+		"""Delete expired rows and trim the table to max_entries (least recently accessed first)."""
+		removed = 0
+		with Session(self._engine) as session:
+			if self.ttl_seconds:
+				removed += session.execute(
+					delete(_CacheRow).where(_CacheRow.created_at < time.time() - self.ttl_seconds)
+				).rowcount or 0
+			count = session.scalar(select(func.count()).select_from(_CacheRow)) or 0
+			excess = count - self.max_entries
+			if excess > 0:
+				oldest = select(_CacheRow.key).order_by(_CacheRow.accessed_at).limit(excess)
+				removed += session.execute(delete(_CacheRow).where(_CacheRow.key.in_(oldest))).rowcount or 0
+			session.commit()
+		with self._lock:
+			self.evictions += removed
+		return removed
+
+	def clear(self, **kwargs: Any) -> None:
+		with Session(self._engine) as session:
+			session.execute(delete(_CacheRow))
+			session.commit()
+		with self._lock:
+			self._memory.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			hits = self.memory_hits + self.disk_hits
+			lookups = hits + self.misses
+			return {
+				"memory_hits": self.memory_hits,
+				"disk_hits": self.disk_hits,
+				"misses": self.misses,
+				"hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+				"writes": self.writes,
+				"evictions": self.evictions,
+				"memory_size": len(self._memory),
+			}
+
+
+# Shared cache, created on first use
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache(temperature: Any) -> Optional[ResponseCache]:
+	"""
+	Return the shared response cache if caching is enabled and the model is deterministic (temperature 0).
+	"""
+	global _RESPONSE_CACHE
+	cfg = AGENT_CONFIG.get("response_cache") or {}
+	if not cfg.get("enabled") or temperature is None or float(temperature) != 0.0:
+		return None
+	with _RESPONSE_CACHE_LOCK:
+		if _RESPONSE_CACHE is None:
+			path = cfg.get("path", ".llm_cache.sqlite")
+			if not os.path.isabs(path):
+				path = os.path.join(os.path.dirname(__file__), path)
+			_RESPONSE_CACHE = ResponseCache(
+				path,
+				ttl_seconds=cfg.get("ttl_seconds"),
+				max_entries=cfg.get("max_entries", 10000),
+				memory_entries=cfg.get("memory_entries", 512),
+			)
+		return _RESPONSE_CACHE
+
+
+def get_response_cache_stats() -> dict:
+	"""
+	Return hit/miss counters and hit rate for the response cache (empty if it was never used).
+	"""
+	with _RESPONSE_CACHE_LOCK:
+		return _RESPONSE_CACHE.stats() if _RESPONSE_CACHE is not None else {}
@@ -0,0 +1,229 @@
+import re
+from typing import Any, Callable, List, Optional
+
+from agent.settings import AGENT_CONFIG
+from agent.tokens import count_tokens, split_tokens
+
+_CHUNKING_CONFIG = AGENT_CONFIG.get("chunking") or {}
+
+# Longest input (in characters) read from a source before chunking; bounds cost for huge pages
+MAX_INPUT_CHARS = int(_CHUNKING_CONFIG.get("max_input_chars", 400000))
+
+# Tokens kept free per call for the prompt template around each chunk (instructions, labels, role overhead)
+_PROMPT_MARGIN_TOKENS = 256
+
+
+def get_model_limits(model_name: Optional[str]) -> tuple[int, int]:
+	"""
+	Return (context_window, max_output_tokens) for a model from available_models, with chunking defaults.
+	"""
+	model_cfg = AGENT_CONFIG.get("available_models", {}).get(model_name or "", {}) or {}
+	context_window = model_cfg.get("context_window") or _CHUNKING_CONFIG.get("default_context_window", 128000)
+	max_output = model_cfg.get("max_output_tokens") or _CHUNKING_CONFIG.get("default_max_output_tokens", 16384)
+	return int(context_window), int(max_output)
+
+
+def chunk_budget(model_name: Optional[str], overhead_tokens: int = 0) -> int:
+	"""
+	Tokens of input that fit in one call: the context window minus the reserved output and prompt overhead,
+	capped at max_chunk_tokens (smaller chunks run in parallel and return faster).
+	"""
+	context_window, max_output = get_model_limits(model_name)
+	reserved = min(max_output, int(_CHUNKING_CONFIG.get("reserve_output_tokens", 4096)))
+	available = context_window - reserved - overhead_tokens - _PROMPT_MARGIN_TOKENS
+	return max(256, min(available, int(_CHUNKING_CONFIG.get("max_chunk_tokens", 12000))))
+
+
+def _units(text: str, max_tokens: int, model_name: Optional[str]) -> List[tuple[str, int]]:
+	# Paragraphs, falling back to lines, sentences and finally raw token slices for oversized pieces
+	units: List[tuple[str, int]] = []
+
+	def add(piece: str, separators: List[str]) -> None:
+		piece = piece.strip()
+		if not piece:
+			return
+		tokens = count_tokens(piece, model_name)
+		if tokens <= max_tokens:
+			units.append((piece, tokens))
+			return
+		if separators:
+			for part in re.split(separators[0], piece):
+				add(part, separators[1:])
+			return
+		for part in split_tokens(piece, max_tokens, model_name):
+			units.append((part, count_tokens(part, model_name)))
+
+	add(text, [r"\n\s*\n", r"\n", r"(?<=[.!?])\s+"])
+	return units
+
+
+def split_text(text: str, max_tokens: int, model_name: Optional[str] = None, overlap_tokens: int = 0) -> List[str]:
+	"""
+	Split text into chunks of at most max_tokens tokens, breaking at paragraph, line or sentence boundaries
+	where possible. Consecutive chunks share up to overlap_tokens of trailing context.
+	"""
+	if count_tokens(text, model_name) <= max_tokens:
+		return [text]
+	chunks: List[str] = []
+	current: List[tuple[str, int]] = []
+	size = 0
+	for unit in _units(text, max_tokens, model_name):
+		if current and size + unit[1] + 1 > max_tokens:
+			chunks.append("\n\n".join(piece for piece, _ in current))
+			# Carry the tail of the previous chunk forward as overlap
+			carried: List[tuple[str, int]] = []
+			carried_size = 0
+			for piece in reversed(current):
+				if carried_size + piece[1] > overlap_tokens or carried_size + piece[1] + unit[1] > max_tokens:
+					break
+				carried.insert(0, piece)
+				carried_size += piece[1] + 1
+			current, size = carried, carried_size
+		current.append(unit)
+		size += unit[1] + 1
+	if current:
+		chunks.append("\n\n".join(piece for piece, _ in current))
+	return chunks
+
+
+def split_for_model(text: str, model_name: Optional[str], overhead_tokens: int = 0) -> List[str]:
+	"""
+	Split text into chunks sized for one call to model_name (see chunk_budget), using the configured overlap.
+	"""
+	budget = chunk_budget(model_name, overhead_tokens)
+	overlap = min(int(_CHUNKING_CONFIG.get("overlap_tokens", 200)), budget // 4)
+	return split_text(text, budget, model_name, overlap)
+
+
+# The part (or partial results) comes first and the instruction last: a provider's prompt cache matches on
+# prefixes, so the same part asked about with another instruction is served from the cache
+def map_prompt(instruction: str, chunk: str, index: int, total: int, label: str = "Text") -> str:
+	return (
+		f"{label} (part {index + 1} of {total}):\n{chunk}\n\n"
+		f"The input is too long for one pass, so it is split into {total} parts. The above is part {index + 1} of {total}. "
+		f"Apply the instruction to this part only and keep every detail that may matter for the final answer; "
+		f"your output will be combined with the results for the other parts.\n\n"
+		f"Instruction:\n{instruction}"
+	)
+
+
+def reduce_prompt(instruction: str, partials: List[str]) -> str:
+	parts = "\n\n".join(f"--- Partial result {i + 1} ---\n{partial}" for i, partial in enumerate(partials))
+	return (
+		f"{parts}\n\n"
+		f"The input was processed in consecutive parts. Combine the partial results above into a single answer "
+		f"to the instruction, merging duplicates and keeping the original order.\n\n"
+		f"Instruction:\n{instruction}"
+	)
+
+
+def text_of(result: Any) -> str:
+	"""
+	Return the text of a chat model result (AIMessage content, list-of-parts content, or anything else as str).
+	"""
+	content = getattr(result, "content", result)
+	if isinstance(content, list):
+		return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+	return content if isinstance(content, str) else str(content)
+
+
+def _group(partials: List[str], budget_tokens: int, model_name: Optional[str]) -> List[List[str]]:
+	# Pack consecutive partials into groups that fit one reduce call (at least two per group, so each level shrinks)
+	groups: List[List[str]] = []
+	size = 0
+	for partial in partials:
+		tokens = count_tokens(partial, model_name)
+		if groups and (len(groups[-1]) < 2 or size + tokens <= budget_tokens):
+			groups[-1].append(partial)
+			size += tokens
+		else:
+			groups.append([partial])
+			size = tokens
+	return groups
+
+
+def _reduce_plan(llm: Any, max_concurrency: Optional[int], overhead_tokens: int) -> tuple[Optional[str], int, dict]:
+	model_name = getattr(llm, "model_name", None)
+	config = {"max_concurrency": max_concurrency or int(_CHUNKING_CONFIG.get("max_concurrency", 8))}
+	return model_name, chunk_budget(model_name, overhead_tokens), config
+
+
+def map_reduce_messages(
+	llm: Any,
+	chunks: List[str],
+	map_messages: Callable[[str, int, int], list],
+	reduce_messages: Callable[[List[str]], list],
+	max_concurrency: Optional[int] = None,
+	overhead_tokens: int = 0,
+) -> list:
+	"""
+	Run map_messages(chunk, index, total) for every chunk concurrently, then reduce the text results with
+	reduce_messages(partials) until they fit one call. Partials that do not fit are reduced in a tree (groups
+	in parallel, level by level). Returns the messages for the final reduce call, e.g. to stream it.
+	"""
+	model_name, budget, config = _reduce_plan(llm, max_concurrency, overhead_tokens)
+	total = len(chunks)
+	results = llm.batch([map_messages(chunk, i, total) for i, chunk in enumerate(chunks)], config=config)
+	partials = [text_of(result) for result in results]
+	while True:
+		groups = _group(partials, budget, model_name)
+		if len(groups) == 1:
+			return reduce_messages(groups[0])
+		results = llm.batch([reduce_messages(group) for group in groups], config=config)
+		partials = [text_of(result) for result in results]
+
+
+async def amap_reduce_messages(
+	llm: Any,
+	chunks: List[str],
+	map_messages: Callable[[str, int, int], list],
+	reduce_messages: Callable[[List[str]], list],
+	max_concurrency: Optional[int] = None,
+	overhead_tokens: int = 0,
+) -> list:
+	"""
+	Async variant of map_reduce_messages().
+	"""
+	model_name, budget, config = _reduce_plan(llm, max_concurrency, overhead_tokens)
+	total = len(chunks)
+	results = await llm.abatch([map_messages(chunk, i, total) for i, chunk in enumerate(chunks)], config=config)
+	partials = [text_of(result) for result in results]
+	while True:
+		groups = _group(partials, budget, model_name)
+		if len(groups) == 1:
+			return reduce_messages(groups[0])
+		results = await llm.abatch([reduce_messages(group) for group in groups], config=config)
+		partials = [text_of(result) for result in results]
+
+
+def map_reduce(
+	llm: Any,
+	chunks: List[str],
+	map_messages: Callable[[str, int, int], list],
+	reduce_messages: Callable[[List[str]], list],
+	final_llm: Any = None,
+	max_concurrency: Optional[int] = None,
+	overhead_tokens: int = 0,
+) -> Any:
+	"""
+	Map-reduce chunks (see map_reduce_messages) and run the last reduce on final_llm (e.g. a
+	structured-output runnable) if given, else on llm. Returns that call's raw result.
+	"""
+	messages = map_reduce_messages(llm, chunks, map_messages, reduce_messages, max_concurrency, overhead_tokens)
+	return (final_llm or llm).invoke(messages)
+
+
+async def amap_reduce(
+	llm: Any,
+	chunks: List[str],
+	map_messages: Callable[[str, int, int], list],
+	reduce_messages: Callable[[List[str]], list],
+	final_llm: Any = None,
+	max_concurrency: Optional[int] = None,
+	overhead_tokens: int = 0,
+) -> Any:
+	"""
+	Async variant of map_reduce().
+	"""
+	messages = await amap_reduce_messages(llm, chunks, map_messages, reduce_messages, max_concurrency, overhead_tokens)
+	return await (final_llm or llm).ainvoke(messages)
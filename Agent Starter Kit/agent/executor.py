@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+from functools import partial
+from typing import AsyncIterator, Iterator, List, Optional, Union
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+
+# Slots of the async step being run: set around the base class's gather, so only that step's tool calls share them
+_STEP_SLOTS: "contextvars.ContextVar[Optional[asyncio.Semaphore]]" = contextvars.ContextVar("agent_step_slots", default=None)
+
+
+class _DeferredAction(partial):
+	"""A tool call whose execution has been deferred so a whole step can be dispatched at once."""
+
+
+class ParallelAgentExecutor(AgentExecutor):
+	"""
+	AgentExecutor that runs the independent tool calls of one agent step concurrently: sync runs (invoke)
+	dispatch them to a thread pool, async runs (ainvoke) gather them on the event loop. At most
+	max_parallel_tools calls of a step run at a time; the cap is per run, not shared by concurrent runs.
+	Observations are added to the scratchpad in the order the model requested the calls, so a step takes about
+	as long as its slowest tool.
+	"""
+
+	max_parallel_tools: int = 4
+
+	def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+		# Called by the base class for each action of a step; hand back the call so _iter_next_step can batch it
+		return _DeferredAction(super()._perform_agent_action, name_to_tool_map, color_mapping, agent_action, run_manager)
+
+	def _iter_next_step(
+		self,
+		name_to_tool_map,
+		color_mapping,
+		inputs,
+		intermediate_steps,
+		run_manager=None,
+	) -> Iterator[Union[AgentFinish, AgentAction, AgentStep]]:
+		deferred: List[_DeferredAction] = []
+		for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+			if isinstance(item, _DeferredAction):
+				deferred.append(item)
+			else:
+				yield item
+		if len(deferred) <= 1 or self.max_parallel_tools <= 1:
+			for call in deferred:
+				yield call()
+			return
+		# Context-propagating pool so callbacks and tracing see the parent run
+		with ContextThreadPoolExecutor(max_workers=min(self.max_parallel_tools, len(deferred))) as pool:
+			futures = [pool.submit(call) for call in deferred]
+			for future in futures:
+				yield future.result()
+
+	async def _aiter_next_step(
+		self,
+		name_to_tool_map,
+		color_mapping,
+		inputs,
+		intermediate_steps,
+		run_manager=None,
+	) -> AsyncIterator[Union[AgentFinish, AgentAction, AgentStep]]:
+		# A fresh budget per step, like the sync pool: concurrent runs on this executor don't share it. It is set
+		# only while the base class runs (not while the caller holds an item), so each step sees its own
+		steps = super()._aiter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager)
+		slots = asyncio.Semaphore(max(1, self.max_parallel_tools))
+		try:
+			while True:
+				token = _STEP_SLOTS.set(slots)
+				try:
+					item = await steps.__anext__()
+				except StopAsyncIteration:
+					return
+				finally:
+					_STEP_SLOTS.reset(token)
+				yield item
+		finally:
+			await steps.aclose()
+
+	async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None) -> AgentStep:
+		# The base class already gathers a step's actions; cap how many of them run at once
+		slots = _STEP_SLOTS.get()
+		if slots is None:
+			return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+		async with slots:
+			return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
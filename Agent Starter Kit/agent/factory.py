@@ -1,56 +1,182 @@
+import logging
 import os
+from typing import TYPE_CHECKING, Any, Callable, List
 from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
 from agent.settings import AGENT_CONFIG
+from agent.pool import ModelPool
+from agent.ratelimit import get_rate_limiter
+
+if TYPE_CHECKING:
+	from agent.routing import RoutedChatModel
 
 load_dotenv()
 
-def get_llm_for(task: str = "default", **overrides):
+_logger = logging.getLogger(__name__)
+
+# Constructed models are pooled so tool calls reuse provider clients and their connections
+_MODEL_POOL = ModelPool(max_size=AGENT_CONFIG.get("model_pool_size", 32))
+
+# Task settings an override may change; everything else about a model comes from available_models
+_OVERRIDABLE = ("model_name", "max_retries", "fallbacks")
+
+
+def _resolve_model_config(task: str, overrides: dict) -> tuple[tuple, dict]:
 	"""
-	Return a configured LangChain chat model for a given task using the agent's model config.
+	Resolve a task (plus overrides) into a hashable pool key and the init_chat_model arguments.
 	"""
-	max_retries = AGENT_CONFIG.get("max_retries", 3)
+	unknown = sorted(set(overrides) - set(_OVERRIDABLE))
+	if unknown:
+		raise ValueError(f"Unsupported override(s) {unknown} for task '{task}'; supported: {list(_OVERRIDABLE)}")
 
 	# Resolve task config, allowing overrides
 	task_cfg = AGENT_CONFIG.get(task, AGENT_CONFIG["default"]).copy()
 	task_cfg.update(overrides)
 	model_name = task_cfg["model_name"]
+	max_retries = task_cfg.get("max_retries", AGENT_CONFIG.get("max_retries", 3))
 
 	# Lookup provider parameters for the model
-	provider = (
-		AGENT_CONFIG
-			.get("available_models", {})
-			.get(model_name, {})
-			.get("provider")
-	)
-	temperature = (
-		AGENT_CONFIG
-			.get("available_models", {})
-			.get(model_name, {})
-			.get("temperature")
-	)
-	reasoning_effort = (
-		AGENT_CONFIG
-			.get("available_models", {})
-			.get(model_name, {})
-			.get("reasoning_effort")
-	)
+	model_cfg = AGENT_CONFIG.get("available_models", {}).get(model_name, {})
+	provider = model_cfg.get("provider")
+	temperature = model_cfg.get("temperature")
+	reasoning_effort = model_cfg.get("reasoning_effort")
 	assert provider is not None, f"No provider configured for model '{model_name}'"
 
+	init_kwargs = {
+		"model_provider": provider,
+		"temperature": temperature,
+		"max_retries": max_retries,
+	}
 	if reasoning_effort:
-		return init_chat_model(
-			model_name,
-			model_provider=provider,
-			reasoning_effort=reasoning_effort,
-			temperature=temperature,
-			max_retries=max_retries,
-		)
-	else:
-		return init_chat_model(
-			model_name,
-			model_provider=provider,
-			temperature=temperature,
-			max_retries=max_retries,
-		)
+		init_kwargs["reasoning_effort"] = reasoning_effort
+	# OpenAI-compatible models only report token usage (and its cached part) on streams when asked to
+	if provider in ("openai", "xai"):
+		init_kwargs["stream_usage"] = True
+
+	# Covers every init_chat_model argument, so equal keys build the same model (fallbacks are keyed by _resolve)
+	key = (model_name, provider, temperature, reasoning_effort, max_retries)
+	return key, {"model": model_name, **init_kwargs}
+
+
+def init_chat_model(**kwargs):
+	"""
+	LangChain's init_chat_model, imported on first use: it loads the provider integration and its SDK.
+	(Benchmarks replace this function to swap in stub models.)
+	"""
+	from langchain.chat_models import init_chat_model as _init_chat_model
+
+	return _init_chat_model(**kwargs)
+
+
+def _deterministic(temperature: Any) -> bool:
+	# Only temperature-0 answers may be shared between callers (response cache, single-flight); other
+	# callers expect independent samples
+	return temperature is not None and float(temperature) == 0.0
+
+
+def _response_cache(temperature: Any):
+	# The cache module (SQLAlchemy) is only loaded when the response cache is enabled
+	if not (AGENT_CONFIG.get("response_cache") or {}).get("enabled"):
+		return None
+	from agent.cache import get_response_cache
+
+	return get_response_cache(temperature)
+
+
+def _build_model(init_kwargs: dict):
+	"""
+	Construct a chat model wrapped with the kit's call management (rate limiting, retries, response cache, single-flight).
+	"""
+	from agent.managed import ManagedChatModel
+
+	# The wrapper owns retries so that every 429 reaches the rate limiter
+	inner = init_chat_model(**{**init_kwargs, "max_retries": 0})
+	return ManagedChatModel(
+		model=inner,
+		model_name=init_kwargs["model"],
+		limiter=get_rate_limiter(init_kwargs["model_provider"], init_kwargs["model"]),
+		max_retries=init_kwargs["max_retries"],
+		cache=_response_cache(init_kwargs["temperature"]),
+		single_flight=AGENT_CONFIG.get("single_flight", True) and _deterministic(init_kwargs["temperature"]),
+	)
 
 
+def _fallback_chain(task: str, overrides: dict) -> List[str]:
+	"""
+	Return the task's fallback models (models.yaml `fallbacks`, after the primary), or [] when routing is off.
+	"""
+	if not (AGENT_CONFIG.get("routing") or {}).get("enabled", True):
+		return []
+	task_cfg = {**AGENT_CONFIG.get(task, AGENT_CONFIG["default"]), **overrides}
+	primary = task_cfg["model_name"]
+	return [name for name in task_cfg.get("fallbacks") or [] if name != primary]
+
+
+def _build_router(members: List[tuple]) -> "RoutedChatModel":
+	"""
+	Construct a RoutedChatModel over pooled members, given as (pool key, init_kwargs) in chain order.
+	"""
+	from agent.routing import RoutedChatModel, routing_settings
+
+	models, built = [], []
+	for i, (key, kwargs) in enumerate(members):
+		try:
+			models.append(_MODEL_POOL.get(key, lambda kwargs=kwargs: _build_model(kwargs)))
+		except Exception as e:
+			# A fallback whose provider isn't set up (e.g. no API key) is left out rather than failing the task
+			if i == 0:
+				raise
+			_logger.warning("Fallback model '%s' is unavailable and was left out of the chain: %s", kwargs["model"], e)
+			continue
+		built.append(kwargs)
+	available = AGENT_CONFIG.get("available_models", {})
+	# The router answers from any member, so it may only cache when every member is deterministic
+	deterministic = all(_deterministic(kwargs["temperature"]) for kwargs in built)
+	return RoutedChatModel(
+		models=models,
+		model_name=models[0].model_name,
+		multimodal=[(available.get(m.model_name) or {}).get("multimodal") for m in models],
+		cache=_response_cache(0.0) if deterministic else None,
+		**routing_settings(),
+	)
+
+
+def _resolve(task: str, overrides: dict) -> tuple[tuple, Callable[[], Any]]:
+	"""
+	Resolve a task into a pool key and a factory: a single managed model, or a router over its fallback chain.
+	"""
+	key, init_kwargs = _resolve_model_config(task, overrides)
+	fallbacks = _fallback_chain(task, overrides)
+	if not fallbacks:
+		return key, lambda: _build_model(init_kwargs)
+	# Members retry less: a failing call moves on to the next model instead of waiting out backoffs
+	retries = (AGENT_CONFIG.get("routing") or {}).get("member_max_retries", 1)
+	members = [
+		_resolve_model_config(task, {**overrides, "model_name": name, "max_retries": retries})
+		for name in [init_kwargs["model"], *fallbacks]
+	]
+	return ("routed", tuple(member_key for member_key, _ in members)), lambda: _build_router(members)
+
+
+def get_llm_for(task: str = "default", **overrides):
+	"""
+	Return a configured LangChain chat model for a given task using the agent's model config.
+	Models are pooled by resolved configuration, so repeated calls return the same instance.
+	Tasks with `fallbacks` get a RoutedChatModel that hedges and fails over along the chain.
+	"""
+	key, factory = _resolve(task, overrides)
+	return _MODEL_POOL.get(key, factory)
+
+
+def get_structured_llm_for(task: str, schema, **overrides):
+	"""
+	Return the pooled model for a task wrapped with structured output for the given schema.
+	"""
+	key, factory = _resolve(task, overrides)
+	return _MODEL_POOL.get_structured(key, factory, schema)
+
+
+def get_model_pool_stats() -> dict:
+	"""
+	Return hit/miss/eviction counters for the model pool.
+	"""
+	return _MODEL_POOL.stats()
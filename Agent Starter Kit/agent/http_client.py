@@ -0,0 +1,583 @@
+import asyncio
+import base64
+import codecs
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from agent.settings import AGENT_CONFIG
+
+_HTTP_CONFIG = AGENT_CONFIG.get("http") or {}
+
+
+def _limits() -> httpx.Limits:
+	return httpx.Limits(
+		max_connections=_HTTP_CONFIG.get("max_connections", 100),
+		max_keepalive_connections=_HTTP_CONFIG.get("max_keepalive_connections", 20),
+		keepalive_expiry=_HTTP_CONFIG.get("keepalive_expiry", 30.0),
+	)
+
+
+def _http2_enabled() -> bool:
+	# HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it
+	return bool(_HTTP_CONFIG.get("http2", True)) and importlib.util.find_spec("h2") is not None
+
+
+# Shared clients
+_sync_client: Optional[httpx.Client] = None
+_sync_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_client() -> httpx.Client:
+	"""
+	Return the process-wide sync HTTP client (pooled, keep-alive, HTTP/2 when available).
+	"""
+	global _sync_client
+	with _sync_lock:
+		if _sync_client is None or _sync_client.is_closed:
+			_sync_client = httpx.Client(limits=_limits(), http2=_http2_enabled(), follow_redirects=True)
+		return _sync_client
+
+
+def get_async_client() -> httpx.AsyncClient:
+	"""
+	Return the shared async HTTP client for the running event loop (async connections are loop-bound).
+	"""
+	loop = asyncio.get_running_loop()
+	client = _async_clients.get(loop)
+	if client is None or client.is_closed:
+		client = httpx.AsyncClient(limits=_limits(), http2=_http2_enabled(), follow_redirects=True)
+		_async_clients[loop] = client
+	return client
+
+
+async def aclose_async_client() -> None:
+	"""
+	Close the shared async client for the running event loop (call before the loop shuts down).
+	"""
+	client = _async_clients.pop(asyncio.get_running_loop(), None)
+	if client is not None:
+		await client.aclose()
+
+
+# Per-host connection caps
+_host_semaphores: dict = {}
+_host_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_host_lock = threading.Lock()
+
+
+def _host_of(url: str) -> str:
+	return urlsplit(url).netloc.lower()
+
+
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+	host = _host_of(url)
+	with _host_lock:
+		if host not in _host_semaphores:
+			_host_semaphores[host] = threading.BoundedSemaphore(_HTTP_CONFIG.get("max_connections_per_host", 8))
+		return _host_semaphores[host]
+
+
+def _host_async_semaphore(url: str) -> asyncio.Semaphore:
+	semaphores = _host_async_semaphores.setdefault(asyncio.get_running_loop(), {})
+	host = _host_of(url)
+	if host not in semaphores:
+		semaphores[host] = asyncio.Semaphore(_HTTP_CONFIG.get("max_connections_per_host", 8))
+	return semaphores[host]
+
+
+# On-disk conditional-GET cache
+class FetchCache:
+	"""
+	On-disk cache of GET responses keyed by URL, revalidated with ETag / Last-Modified.
+
+	Fresh entries (Cache-Control max-age / Expires) are served without a request; stale ones are revalidated
+	with a conditional GET so an unchanged page costs a 304. Responses marked no-store, or without any
+	validator or freshness information, are not stored.
+	"""
+
+	def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024, max_entry_bytes: int = 16 * 1024 * 1024):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.max_entry_bytes = max_entry_bytes
+		os.makedirs(path, exist_ok=True)
+		self._lock = threading.Lock()
+		self._stores_since_prune = 0
+		self.fresh_hits = 0
+		self.revalidated = 0
+		self.misses = 0
+
+	def _files(self, url: str) -> tuple[str, str]:
+		key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+		return os.path.join(self.path, f"{key}.json"), os.path.join(self.path, f"{key}.body")
+
+	def load(self, url: str) -> Optional[tuple[dict, bytes]]:
+		meta_path, body_path = self._files(url)
+		try:
+			with open(meta_path, "r") as f:
+				meta = json.load(f)
+			with open(body_path, "rb") as f:
+				body = f.read()
+		except (OSError, ValueError):
+			return None
+		return (meta, body) if meta.get("url") == url else None
+
+	@staticmethod
+	def is_fresh(meta: dict) -> bool:
+		return meta.get("expires_at", 0) > time.time()
+
+	@staticmethod
+	def conditional_headers(meta: dict) -> dict:
+		headers = {}
+		if meta.get("etag"):
+			headers["If-None-Match"] = meta["etag"]
+		if meta.get("last_modified"):
+			headers["If-Modified-Since"] = meta["last_modified"]
+		return headers
+
+	@staticmethod
+	def _expires_at(response: httpx.Response) -> Optional[float]:
+		cache_control = response.headers.get("cache-control", "").lower()
+		if "no-store" in cache_control:
+			return None
+		for directive in cache_control.split(","):
+			name, _, value = directive.strip().partition("=")
+			if name == "max-age" and value.isdigit():
+				return time.time() + int(value)
+		if "no-cache" not in cache_control and response.headers.get("expires"):
+			try:
+				return parsedate_to_datetime(response.headers["expires"]).timestamp()
+			except (TypeError, ValueError):
+				pass
+		return 0.0
+
+	def wants(self, response: httpx.Response) -> bool:
+		"""Whether a 200 response is cacheable (has a validator or freshness and is not no-store)."""
+		expires_at = self._expires_at(response)
+		if expires_at is None:
+			return False
+		return bool(response.headers.get("etag") or response.headers.get("last-modified") or expires_at > time.time())
+
+	def store(self, url: str, response: httpx.Response, body: bytes) -> None:
+		if not self.wants(response) or len(body) > self.max_entry_bytes:
+			return
+		expires_at = self._expires_at(response)
+		etag, last_modified = response.headers.get("etag"), response.headers.get("last-modified")
+		meta = {
+			"url": url,
+			"etag": etag,
+			"last_modified": last_modified,
+			"expires_at": expires_at,
+			"headers": {k: v for k, v in response.headers.items() if k.lower() in ("content-type", "etag", "last-modified")},
+		}
+		meta_path, body_path = self._files(url)
+		# Write body first; meta is the commit marker readers check
+		with open(body_path + ".tmp", "wb") as f:
+			f.write(body)
+		os.replace(body_path + ".tmp", body_path)
+		with open(meta_path + ".tmp", "w") as f:
+			json.dump(meta, f)
+		os.replace(meta_path + ".tmp", meta_path)
+		with self._lock:
+			self._stores_since_prune += 1
+			prune = self._stores_since_prune >= 100
+			if prune:
+				self._stores_since_prune = 0
+		if prune:
+			self.prune()
+
+	def refresh(self, url: str, meta: dict, response: httpx.Response) -> None:
+		"""Update freshness after a 304 so the next fetch may skip the request entirely."""
+		expires_at = self._expires_at(response)
+		if expires_at is None:
+			return
+		meta = {**meta, "expires_at": expires_at}
+		meta_path, _ = self._files(url)
+		with open(meta_path + ".tmp", "w") as f:
+			json.dump(meta, f)
+		os.replace(meta_path + ".tmp", meta_path)
+
+	def prune(self) -> None:
+		"""Delete least recently written entries until the cache fits in max_bytes."""
+		entries = []
+		for name in os.listdir(self.path):
+			if name.endswith(".body"):
+				full = os.path.join(self.path, name)
+				try:
+					stat = os.stat(full)
+				except OSError:
+					continue
+				entries.append((stat.st_mtime, stat.st_size, full))
+		total = sum(size for _, size, _ in entries)
+		for _, size, full in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			for path in (full, full[: -len(".body")] + ".json"):
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+			total -= size
+
+	@staticmethod
+	def content_type(meta: dict) -> Optional[str]:
+		return (meta.get("headers") or {}).get("content-type")
+
+	def stats(self) -> dict:
+		return {"fresh_hits": self.fresh_hits, "revalidated": self.revalidated, "misses": self.misses}
+
+
+_FETCH_CACHE: Optional[FetchCache] = None
+_fetch_cache_lock = threading.Lock()
+
+
+def get_fetch_cache() -> Optional[FetchCache]:
+	"""
+	Return the shared fetch cache, or None if disabled in models.yaml.
+	"""
+	global _FETCH_CACHE
+	cfg = _HTTP_CONFIG.get("fetch_cache") or {}
+	if not cfg.get("enabled"):
+		return None
+	with _fetch_cache_lock:
+		if _FETCH_CACHE is None:
+			path = cfg.get("path", ".fetch_cache")
+			if not os.path.isabs(path):
+				path = os.path.join(os.path.dirname(__file__), path)
+			_FETCH_CACHE = FetchCache(path, max_bytes=cfg.get("max_bytes", 256 * 1024 * 1024))
+		return _FETCH_CACHE
+
+
+def get_fetch_cache_stats() -> dict:
+	cache = get_fetch_cache()
+	return cache.stats() if cache is not None else {}
+
+
+# Streaming fetch helpers
+class DownloadRejected(Exception):
+	"""Raised when a response is refused before or while downloading (wrong type, or larger than the cap)."""
+
+
+class Download:
+	"""
+	A downloaded body held in memory when small, or spooled to a temporary file when large.
+	Spooled files are deleted once the Download is garbage-collected.
+	"""
+
+	def __init__(self, content_type: Optional[str], data: Optional[bytes] = None, path: Optional[str] = None, owned: bool = False):
+		self.content_type = content_type
+		self.data = data
+		self.path = path
+		if path is not None and owned:
+			weakref.finalize(self, _remove_quietly, path)
+
+	@property
+	def size(self) -> int:
+		return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+	def read(self) -> bytes:
+		if self.data is not None:
+			return self.data
+		with open(self.path, "rb") as f:
+			return f.read()
+
+	def base64(self) -> str:
+		"""Base64-encode the body without holding a second full copy of the raw bytes."""
+		if self.data is not None:
+			return base64.b64encode(self.data).decode("ascii")
+		parts = []
+		with open(self.path, "rb") as f:
+			# Multiple of 3 so chunk encodings concatenate without padding in the middle
+			for chunk in iter(lambda: f.read(3 * 256 * 1024), b""):
+				parts.append(base64.b64encode(chunk).decode("ascii"))
+		return "".join(parts)
+
+
+def _remove_quietly(path: str) -> None:
+	try:
+		os.remove(path)
+	except OSError:
+		pass
+
+
+class _Spool:
+	# Accumulates chunks in memory, moving to a temp file past the threshold
+	def __init__(self, threshold: int):
+		self.threshold = threshold
+		self.buffer = bytearray()
+		self.file = None
+		self.size = 0
+
+	def write(self, chunk: bytes) -> None:
+		self.size += len(chunk)
+		if self.file is None and len(self.buffer) + len(chunk) <= self.threshold:
+			self.buffer.extend(chunk)
+			return
+		if self.file is None:
+			self.file = tempfile.NamedTemporaryFile(prefix="download-", delete=False)
+			self.file.write(self.buffer)
+			self.buffer = bytearray()
+		self.file.write(chunk)
+
+	def finish(self, content_type: Optional[str]) -> Download:
+		if self.file is None:
+			return Download(content_type, data=bytes(self.buffer))
+		self.file.close()
+		return Download(content_type, path=self.file.name, owned=True)
+
+	def discard(self) -> None:
+		if self.file is not None:
+			self.file.close()
+			_remove_quietly(self.file.name)
+
+
+def max_bytes_for(content_type: Optional[str]) -> int:
+	"""
+	Hard byte cap for a content type from models.yaml http.max_bytes (exact type, then "major/*", then default).
+	"""
+	caps = _HTTP_CONFIG.get("max_bytes") or {}
+	major = (content_type or "").split(";")[0].strip().lower()
+	return int(caps.get(major) or caps.get(major.split("/")[0] + "/*") or caps.get("default", 10 * 1024 * 1024))
+
+
+def _check_type(content_type: Optional[str], accept: Optional[tuple], url) -> None:
+	if accept and content_type and not content_type.lower().startswith(tuple(accept)):
+		raise DownloadRejected(f"Unexpected content type '{content_type}' for {url}")
+
+
+def _check_response(response: httpx.Response, accept: Optional[tuple], max_bytes: Optional[int]) -> int:
+	# Reject on headers alone, before any of the body is read
+	content_type = response.headers.get("content-type", "")
+	_check_type(content_type, accept, response.url)
+	cap = max_bytes or max_bytes_for(content_type)
+	length = response.headers.get("content-length", "")
+	if length.isdigit() and int(length) > cap:
+		raise DownloadRejected(f"Response of {length} bytes exceeds the {cap} byte cap for {response.url}")
+	return cap
+
+
+def _cached_download(url: str, meta: dict, body: bytes, accept: Optional[tuple], max_bytes: Optional[int]) -> Download:
+	# A cached body was stored for whichever caller fetched it first; hold it to this caller's type and size limits
+	content_type = FetchCache.content_type(meta)
+	_check_type(content_type, accept, url)
+	cap = max_bytes or max_bytes_for(content_type)
+	if len(body) > cap:
+		raise DownloadRejected(f"Cached response of {len(body)} bytes exceeds the {cap} byte cap for {url}")
+	return Download(content_type, data=body)
+
+
+def _decode_cached(meta: dict, body: bytes) -> str:
+	return httpx.Response(200, headers=meta.get("headers") or {}, content=body).text
+
+
+class _TextReader:
+	# Incrementally decodes body chunks, tracking whether the whole body was read
+	def __init__(self, response: httpx.Response, max_chars: int, cap: int, keep_body: bool):
+		self.decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+		self.max_chars = max_chars
+		self.cap = cap
+		self.parts: list = []
+		self.chars = 0
+		self.bytes = 0
+		self.body = bytearray() if keep_body else None
+		self.complete = True
+
+	def feed(self, chunk: bytes) -> bool:
+		"""Consume a chunk; returns False once enough text (or the byte cap) has been reached."""
+		self.bytes += len(chunk)
+		if self.body is not None:
+			self.body.extend(chunk)
+		text = self.decoder.decode(chunk)
+		self.parts.append(text)
+		self.chars += len(text)
+		if self.chars >= self.max_chars or self.bytes >= self.cap:
+			self.complete = False
+			return False
+		return True
+
+	def text(self) -> str:
+		if self.complete:
+			self.parts.append(self.decoder.decode(b"", final=True))
+		return "".join(self.parts)[: self.max_chars]
+
+
+def fetch_text(
+	url: str,
+	max_chars: int,
+	headers: Optional[dict] = None,
+	timeout: float = 20.0,
+	max_bytes: Optional[int] = None,
+	accept: Optional[tuple] = None,
+	use_cache: bool = True,
+) -> str:
+	"""
+	GET a URL and return at most max_chars of decoded text, reading the body only until that much text
+	has been decoded (or the byte cap is reached). Goes through the shared client, the per-host cap and
+	the conditional-GET cache; only complete bodies are cached. Raises httpx.HTTPStatusError on errors.
+	"""
+	max_chars = max(0, max_chars)
+	cache = get_fetch_cache() if use_cache else None
+	cached = cache.load(url) if cache is not None else None
+	if cached is not None and cache.is_fresh(cached[0]):
+		cache.fresh_hits += 1
+		return _decode_cached(*cached)[:max_chars]
+	request_headers = dict(headers or {})
+	if cached is not None:
+		request_headers.update(cache.conditional_headers(cached[0]))
+	with _host_semaphore(url):
+		with get_client().stream("GET", url, headers=request_headers, timeout=timeout) as response:
+			if response.status_code == 304 and cached is not None:
+				cache.revalidated += 1
+				cache.refresh(url, cached[0], response)
+				return _decode_cached(*cached)[:max_chars]
+			response.raise_for_status()
+			cap = _check_response(response, accept, max_bytes)
+			reader = _TextReader(response, max_chars, cap, keep_body=cache is not None and cache.wants(response))
+			for chunk in response.iter_bytes():
+				if not reader.feed(chunk):
+					break
+	if cache is not None:
+		cache.misses += 1
+		if reader.complete and reader.body is not None:
+			cache.store(url, response, bytes(reader.body))
+	return reader.text()
+
+
+async def afetch_text(
+	url: str,
+	max_chars: int,
+	headers: Optional[dict] = None,
+	timeout: float = 20.0,
+	max_bytes: Optional[int] = None,
+	accept: Optional[tuple] = None,
+	use_cache: bool = True,
+) -> str:
+	"""
+	Async variant of fetch_text() using the event loop's shared AsyncClient; cache file I/O runs in a thread.
+	"""
+	max_chars = max(0, max_chars)
+	cache = get_fetch_cache() if use_cache else None
+	cached = await asyncio.to_thread(cache.load, url) if cache is not None else None
+	if cached is not None and cache.is_fresh(cached[0]):
+		cache.fresh_hits += 1
+		return _decode_cached(*cached)[:max_chars]
+	request_headers = dict(headers or {})
+	if cached is not None:
+		request_headers.update(cache.conditional_headers(cached[0]))
+	async with _host_async_semaphore(url):
+		async with get_async_client().stream("GET", url, headers=request_headers, timeout=timeout) as response:
+			if response.status_code == 304 and cached is not None:
+				cache.revalidated += 1
+				await asyncio.to_thread(cache.refresh, url, cached[0], response)
+				return _decode_cached(*cached)[:max_chars]
+			response.raise_for_status()
+			cap = _check_response(response, accept, max_bytes)
+			reader = _TextReader(response, max_chars, cap, keep_body=cache is not None and cache.wants(response))
+			async for chunk in response.aiter_bytes():
+				if not reader.feed(chunk):
+					break
+	if cache is not None:
+		cache.misses += 1
+		if reader.complete and reader.body is not None:
+			await asyncio.to_thread(cache.store, url, response, bytes(reader.body))
+	return reader.text()
+
+
+def fetch_download(
+	url: str,
+	headers: Optional[dict] = None,
+	timeout: float = 30.0,
+	max_bytes: Optional[int] = None,
+	accept: Optional[tuple] = None,
+	use_cache: bool = True,
+) -> Download:
+	"""
+	GET a binary URL into a Download, rejecting wrong content types and oversized bodies up front
+	(Content-Type / Content-Length) or as soon as the byte cap is crossed while streaming.
+	"""
+	cache = get_fetch_cache() if use_cache else None
+	cached = cache.load(url) if cache is not None else None
+	if cached is not None and cache.is_fresh(cached[0]):
+		cache.fresh_hits += 1
+		return _cached_download(url, cached[0], cached[1], accept, max_bytes)
+	request_headers = dict(headers or {})
+	if cached is not None:
+		request_headers.update(cache.conditional_headers(cached[0]))
+	spool = _Spool(_HTTP_CONFIG.get("spool_threshold_bytes", 1024 * 1024))
+	try:
+		with _host_semaphore(url):
+			with get_client().stream("GET", url, headers=request_headers, timeout=timeout) as response:
+				if response.status_code == 304 and cached is not None:
+					cache.revalidated += 1
+					cache.refresh(url, cached[0], response)
+					return _cached_download(url, cached[0], cached[1], accept, max_bytes)
+				response.raise_for_status()
+				cap = _check_response(response, accept, max_bytes)
+				for chunk in response.iter_bytes():
+					spool.write(chunk)
+					if spool.size > cap:
+						raise DownloadRejected(f"Response exceeds the {cap} byte cap for {url}")
+	except BaseException:
+		spool.discard()
+		raise
+	download = spool.finish(response.headers.get("content-type"))
+	if cache is not None:
+		cache.misses += 1
+		if download.data is not None:
+			cache.store(url, response, download.data)
+	return download
+
+
+async def afetch_download(
+	url: str,
+	headers: Optional[dict] = None,
+	timeout: float = 30.0,
+	max_bytes: Optional[int] = None,
+	accept: Optional[tuple] = None,
+	use_cache: bool = True,
+) -> Download:
+	"""
+	Async variant of fetch_download().
+	"""
+	cache = get_fetch_cache() if use_cache else None
+	cached = await asyncio.to_thread(cache.load, url) if cache is not None else None
+	if cached is not None and cache.is_fresh(cached[0]):
+		cache.fresh_hits += 1
+		return _cached_download(url, cached[0], cached[1], accept, max_bytes)
+	request_headers = dict(headers or {})
+	if cached is not None:
+		request_headers.update(cache.conditional_headers(cached[0]))
+	spool = _Spool(_HTTP_CONFIG.get("spool_threshold_bytes", 1024 * 1024))
+	try:
+		async with _host_async_semaphore(url):
+			async with get_async_client().stream("GET", url, headers=request_headers, timeout=timeout) as response:
+				if response.status_code == 304 and cached is not None:
+					cache.revalidated += 1
+					await asyncio.to_thread(cache.refresh, url, cached[0], response)
+					return _cached_download(url, cached[0], cached[1], accept, max_bytes)
+				response.raise_for_status()
+				cap = _check_response(response, accept, max_bytes)
+				async for chunk in response.aiter_bytes():
+					spool.write(chunk)
+					if spool.size > cap:
+						raise DownloadRejected(f"Response exceeds the {cap} byte cap for {url}")
+	except BaseException:
+		spool.discard()
+		raise
+	download = spool.finish(response.headers.get("content-type"))
+	if cache is not None:
+		cache.misses += 1
+		if download.data is not None:
+			await asyncio.to_thread(cache.store, url, response, download.data)
+	return download
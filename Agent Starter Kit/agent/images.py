@@ -0,0 +1,266 @@
+import base64
+import hashlib
+import importlib.util
+import io
+import math
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from agent.settings import AGENT_CONFIG
+
+# Pillow is optional (without it images are only sniffed, not resized) and is imported on first use
+_HAVE_PILLOW = importlib.util.find_spec("PIL") is not None
+
+_IMAGE_CONFIG = AGENT_CONFIG.get("image_preprocessing") or {}
+
+# Formats vision APIs accept as-is; anything else (BMP, TIFF, ...) is converted when Pillow can read it
+_PROVIDER_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+# Provider image sizing (OpenAI high detail): fit within max_long_side, then shrink the short side to
+# max_short_side, and bill base_tokens + tile_tokens per tile_size tile. "patches" models bill 32px patches.
+_DEFAULT_PROFILE = {
+	"scheme": "tiles",
+	"max_long_side": 2048,
+	"max_short_side": 768,
+	"tile_size": 512,
+	"base_tokens": 85,
+	"tile_tokens": 170,
+	"patch_size": 32,
+	"max_patches": 1536,
+	"token_multiplier": 1.0,
+}
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+	"""
+	Return the image MIME type from the file's magic bytes, or None if it is not a recognised image.
+	"""
+	head = data[:32]
+	if head.startswith(b"\xff\xd8\xff"):
+		return "image/jpeg"
+	if head.startswith(b"\x89PNG\r\n\x1a\n"):
+		return "image/png"
+	if head[:6] in (b"GIF87a", b"GIF89a"):
+		return "image/gif"
+	if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+		return "image/webp"
+	if head[:2] == b"BM":
+		return "image/bmp"
+	if head[:4] in (b"II*\x00", b"MM\x00*"):
+		return "image/tiff"
+	if head[4:8] == b"ftyp":
+		brand = head[8:12]
+		if brand in (b"avif", b"avis"):
+			return "image/avif"
+		if brand in (b"heic", b"heix", b"hevc", b"hevx", b"mif1", b"msf1"):
+			return "image/heic"
+	return None
+
+
+def image_profile(model_name: Optional[str]) -> dict:
+	"""
+	Return the image sizing profile for a model: defaults, then `image_preprocessing.default_profile`,
+	then the model's own `image:` block under available_models.
+	"""
+	model_cfg = AGENT_CONFIG.get("available_models", {}).get(model_name or "", {}) or {}
+	return {**_DEFAULT_PROFILE, **(_IMAGE_CONFIG.get("default_profile") or {}), **(model_cfg.get("image") or {})}
+
+
+def _provider_size(width: int, height: int, profile: dict) -> tuple[int, int]:
+	# The size the provider scales the image to before billing it
+	if profile["scheme"] == "patches":
+		patch = profile["patch_size"]
+		if math.ceil(width / patch) * math.ceil(height / patch) <= profile["max_patches"]:
+			return width, height
+		scale = math.sqrt(profile["max_patches"] * patch * patch / (width * height))
+		scale *= min(
+			math.floor(width * scale / patch) / (width * scale / patch),
+			math.floor(height * scale / patch) / (height * scale / patch),
+		)
+		return max(1, int(width * scale)), max(1, int(height * scale))
+	scale = min(1.0, profile["max_long_side"] / max(width, height))
+	if profile["scheme"] == "tiles":
+		scale = min(scale, profile["max_short_side"] / min(width, height))
+	return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int, profile: dict) -> int:
+	"""
+	Estimate the input tokens a provider bills for an image of this size.
+	"""
+	width, height = _provider_size(width, height, profile)
+	if profile["scheme"] == "patches":
+		patch = profile["patch_size"]
+		return math.ceil(math.ceil(width / patch) * math.ceil(height / patch) * profile["token_multiplier"])
+	if profile["scheme"] == "tiles":
+		tile = profile["tile_size"]
+		return profile["base_tokens"] + profile["tile_tokens"] * math.ceil(width / tile) * math.ceil(height / tile)
+	return 0
+
+
+def target_size(width: int, height: int, profile: dict, max_shrink: float = 0.1) -> tuple[int, int]:
+	"""
+	Size to send an image at: the provider's own downscaled size, shrunk by up to max_shrink more when that
+	drops a row or column of tiles (or patches) from the bill.
+	"""
+	width, height = _provider_size(width, height, profile)
+	unit = {"tiles": profile["tile_size"], "patches": profile["patch_size"]}.get(profile["scheme"])
+	if not unit:
+		return width, height
+	best, best_units = (width, height), math.ceil(width / unit) * math.ceil(height / unit)
+	for side in (width, height):
+		whole = (math.ceil(side / unit) - 1) * unit
+		scale = whole / side
+		if whole <= 0 or scale < 1.0 - max_shrink:
+			continue
+		size = (max(1, math.floor(width * scale)), max(1, math.floor(height * scale)))
+		units = math.ceil(size[0] / unit) * math.ceil(size[1] / unit)
+		if units < best_units:
+			best, best_units = size, units
+	return best
+
+
+class PreparedImage:
+	"""
+	An image ready to send: its bytes and real MIME type, plus sizes and token estimates before/after.
+	"""
+
+	def __init__(self, data: bytes, mime: str, width: int = 0, height: int = 0, original_bytes: int = 0, original_tokens: int = 0, tokens: int = 0):
+		self.data = data
+		self.mime = mime
+		self.width = width
+		self.height = height
+		self.original_bytes = original_bytes or len(data)
+		self.original_tokens = original_tokens
+		self.tokens = tokens
+
+	def base64(self) -> str:
+		return base64.b64encode(self.data).decode("ascii")
+
+
+class _ImageCache:
+	# LRU of prepared images keyed by content hash and sizing profile, bounded by total bytes
+	def __init__(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		self._entries: "OrderedDict[tuple, PreparedImage]" = OrderedDict()
+		self._size = 0
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	def get(self, key: tuple) -> Optional[PreparedImage]:
+		with self._lock:
+			image = self._entries.get(key)
+			if image is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return image
+
+	def put(self, key: tuple, image: PreparedImage) -> None:
+		with self._lock:
+			self.bytes_in += image.original_bytes
+			self.bytes_out += len(image.data)
+			if len(image.data) > self.max_bytes or key in self._entries:
+				return
+			self._entries[key] = image
+			self._size += len(image.data)
+			while self._size > self.max_bytes:
+				_, evicted = self._entries.popitem(last=False)
+				self._size -= len(evicted.data)
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"bytes": self._size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"bytes_in": self.bytes_in,
+				"bytes_out": self.bytes_out,
+			}
+
+
+_IMAGE_CACHE = _ImageCache(int(_IMAGE_CONFIG.get("cache_max_bytes", 64 * 1024 * 1024)))
+
+
+def _oriented_size(image) -> tuple[int, int]:
+	# EXIF orientations 5-8 are rotated by 90 degrees
+	orientation = image.getexif().get(0x0112, 1)
+	return (image.height, image.width) if orientation in (5, 6, 7, 8) else image.size
+
+
+def _prepare(data: bytes, mime: str, profile: dict) -> PreparedImage:
+	from PIL import Image, ImageOps, UnidentifiedImageError
+
+	try:
+		image = Image.open(io.BytesIO(data))
+		width, height = _oriented_size(image)
+	except (UnidentifiedImageError, OSError, ValueError):
+		return PreparedImage(data, mime)
+	original_tokens = estimate_image_tokens(width, height, profile)
+	size = target_size(width, height, profile, float(_IMAGE_CONFIG.get("max_tile_shrink", 0.1)))
+	resize = size != (width, height)
+	tokens = estimate_image_tokens(*size, profile)
+	if not resize and mime in _PROVIDER_TYPES and len(data) <= int(_IMAGE_CONFIG.get("passthrough_bytes", 1048576)):
+		return PreparedImage(data, mime, width, height, len(data), original_tokens, tokens)
+
+	# JPEG can decode straight to a smaller scale (1/2 .. 1/8), which is much faster for large photos
+	swapped = (width, height) != image.size
+	image.draft("RGB", (size[1], size[0]) if swapped else size)
+	image = ImageOps.exif_transpose(image)
+	alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+	image = image.convert("RGBA" if alpha else "RGB")
+	if image.size != size:
+		image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+	out = io.BytesIO()
+	if alpha:
+		image.save(out, "PNG", optimize=True)
+		out_mime = "image/png"
+	else:
+		image.save(out, "JPEG", quality=int(_IMAGE_CONFIG.get("jpeg_quality", 85)), optimize=True)
+		out_mime = "image/jpeg"
+	encoded = out.getvalue()
+	if not resize and mime in _PROVIDER_TYPES and len(encoded) >= len(data):
+		# Recompressing didn't help; keep the original
+		return PreparedImage(data, mime, width, height, len(data), original_tokens, tokens)
+	return PreparedImage(encoded, out_mime, size[0], size[1], len(data), original_tokens, tokens)
+
+
+def prepare_image(data: bytes, model_name: Optional[str] = None, declared_mime: Optional[str] = None) -> PreparedImage:
+	"""
+	Prepare image bytes for a vision model. The MIME type is sniffed from magic bytes (declared_mime is only
+	a fallback). With Pillow installed and preprocessing enabled, the image is resized to the size the model
+	would downscale it to anyway (tile-aligned where that saves image tokens) and recompressed, honouring
+	EXIF rotation. Results are cached by content hash. CPU-bound: call it from a thread in async code.
+	"""
+	mime = sniff_image_type(data) or (declared_mime if (declared_mime or "").startswith("image/") else None) or "image/jpeg"
+	if not _HAVE_PILLOW or not _IMAGE_CONFIG.get("enabled", True):
+		return PreparedImage(data, mime)
+	profile = image_profile(model_name)
+	key = (hashlib.sha256(data).hexdigest(), tuple(sorted(profile.items())))
+	prepared = _IMAGE_CACHE.get(key)
+	if prepared is None:
+		prepared = _prepare(data, mime, profile)
+		_IMAGE_CACHE.put(key, prepared)
+	return prepared
+
+
+def prepare_image_base64(image_base64: str, model_name: Optional[str] = None, declared_mime: Optional[str] = None) -> tuple[str, str]:
+	"""
+	prepare_image() for base64 input; returns (base64, mime). Unchanged images keep their original encoding.
+	"""
+	data = base64.b64decode(image_base64)
+	image = prepare_image(data, model_name, declared_mime)
+	return (image_base64 if image.data is data else image.base64()), image.mime
+
+
+def get_image_cache_stats() -> dict:
+	"""
+	Return hit/miss counters and bytes in/out for image preprocessing.
+	"""
+	return _IMAGE_CACHE.stats()
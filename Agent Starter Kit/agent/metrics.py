@@ -0,0 +1,646 @@
+import atexit
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+from agent.settings import AGENT_CONFIG
+
+_METRICS_CONFIG = AGENT_CONFIG.get("metrics") or {}
+
+# Phases recorded per call, in seconds: fetching sources, local preprocessing (extraction, retrieval, image and
+# PDF preparation), waiting for the rate limiter, time to first streamed token, time in model requests, and total
+PHASES = ("fetch", "preprocess", "queue", "ttft", "model", "total")
+
+# Latency histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_NULL = nullcontext()
+
+
+def model_prices(model_name: Optional[str]) -> dict:
+	"""
+	Return a model's prices in USD per million tokens (available_models.<model>.price_per_million:
+	input, cached_input, output), or {} when none are configured.
+	"""
+	model_cfg = AGENT_CONFIG.get("available_models", {}).get(model_name or "", {}) or {}
+	return model_cfg.get("price_per_million") or {}
+
+
+def estimate_cost(model_name: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+	"""
+	Estimated USD cost of a call from the model's configured prices, or None when the model has no prices.
+	Cached prompt tokens are billed at cached_input (input when not set).
+	"""
+	prices = model_prices(model_name)
+	if not prices:
+		return None
+	cached = min(cached_tokens, prompt_tokens)
+	return (
+		(prompt_tokens - cached) * float(prices.get("input", 0))
+		+ cached * float(prices.get("cached_input", prices.get("input", 0)))
+		+ completion_tokens * float(prices.get("output", 0))
+	) / 1_000_000
+
+
+class CallRecord:
+	"""
+	One instrumented call: a model request (kind "llm") or a tool / task function run ("tool", "task").
+	phases holds seconds per phase (see PHASES). Tool and task records also total the tokens, cost, retries,
+	queue and model time of the model requests made inside them (llm_calls counts those requests).
+	"""
+
+	def __init__(self, kind: str, name: str, task: Optional[str] = None, model: Optional[str] = None, parent: Optional["CallRecord"] = None):
+		self.kind = kind
+		self.name = name
+		self.task = task
+		self.model = model
+		self.parent = parent
+		self.started_at = time.time()
+		self._started = time.perf_counter()
+		self._request_started: Optional[float] = None
+		self.phases: Dict[str, float] = {}
+		self.prompt_tokens = 0
+		self.completion_tokens = 0
+		self.cached_tokens = 0
+		self.retries = 0
+		self.llm_calls = 0
+		self.cost_usd: Optional[float] = None
+		self.error: Optional[str] = None
+		self.extra: Dict[str, Any] = {}
+		self._lock = threading.Lock()
+		self._finished = False
+
+	def add_phase(self, name: str, seconds: float) -> None:
+		with self._lock:
+			self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+	def phase(self, name: str) -> "_Phase":
+		return _Phase(self, name)
+
+	# Model request timing (kind "llm")
+	def begin(self) -> None:
+		"""A request attempt starts (after any rate-limiter wait)."""
+		self._request_started = time.perf_counter()
+
+	def token(self) -> None:
+		"""A streamed chunk arrived; the first one sets ttft, here and on the enclosing tool or task."""
+		if "ttft" in self.phases or self._request_started is None:
+			return
+		now = time.perf_counter()
+		self.phases["ttft"] = now - self._request_started
+		parent = self.parent
+		if parent is not None and "ttft" not in parent.phases:
+			parent.add_phase("ttft", now - parent._started)
+
+	def end(self) -> None:
+		"""A request attempt ended."""
+		if self._request_started is not None:
+			self.add_phase("model", time.perf_counter() - self._request_started)
+			self._request_started = None
+
+	def retried(self) -> None:
+		self.retries += 1
+
+	def usage(self, usage_metadata: Optional[dict]) -> None:
+		"""Take token counts from a LangChain usage_metadata dict (input/output tokens, cache_read details)."""
+		if not usage_metadata:
+			return
+		self.prompt_tokens = int(usage_metadata.get("input_tokens") or 0)
+		self.completion_tokens = int(usage_metadata.get("output_tokens") or 0)
+		self.cached_tokens = int((usage_metadata.get("input_token_details") or {}).get("cache_read") or 0)
+
+	def _add_child(self, child: "CallRecord") -> None:
+		with self._lock:
+			self.llm_calls += 1
+			self.prompt_tokens += child.prompt_tokens
+			self.completion_tokens += child.completion_tokens
+			self.cached_tokens += child.cached_tokens
+			self.retries += child.retries
+			if child.cost_usd is not None:
+				self.cost_usd = (self.cost_usd or 0.0) + child.cost_usd
+			for name in ("queue", "model"):
+				if name in child.phases:
+					self.phases[name] = self.phases.get(name, 0.0) + child.phases[name]
+
+	def finish(self, error: Optional[BaseException] = None) -> None:
+		"""Close the record and send it to the sinks (and, for model requests, into the enclosing record)."""
+		if self._finished:
+			return
+		self._finished = True
+		self.end()
+		self.phases["total"] = time.perf_counter() - self._started
+		if isinstance(error, Exception):
+			self.error = f"{type(error).__name__}: {error}"
+		elif error is not None:
+			# Cancelled (a hedged request that lost) or a stream the consumer stopped reading
+			self.extra["cancelled"] = True
+		if self.kind == "llm":
+			self.cost_usd = estimate_cost(self.model, self.prompt_tokens, self.completion_tokens, self.cached_tokens)
+			if self.parent is not None:
+				self.parent._add_child(self)
+		_emit(self)
+
+	def as_dict(self) -> dict:
+		return {
+			"kind": self.kind,
+			"name": self.name,
+			"task": self.task,
+			"model": self.model,
+			"started_at": round(self.started_at, 3),
+			**{f"{name}_s": round(self.phases[name], 4) for name in PHASES if name in self.phases},
+			"prompt_tokens": self.prompt_tokens,
+			"completion_tokens": self.completion_tokens,
+			"cached_tokens": self.cached_tokens,
+			"retries": self.retries,
+			"llm_calls": self.llm_calls,
+			"cost_usd": None if self.cost_usd is None else round(self.cost_usd, 6),
+			"error": self.error,
+			**self.extra,
+		}
+
+
+class _Phase:
+	__slots__ = ("record", "name", "started")
+
+	def __init__(self, record: CallRecord, name: str):
+		self.record = record
+		self.name = name
+
+	def __enter__(self) -> "_Phase":
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		self.record.add_phase(self.name, time.perf_counter() - self.started)
+
+
+class _NullCall:
+	# Stands in for a CallRecord when metrics are disabled, so call sites need no checks
+	def phase(self, name: str):
+		return _NULL
+
+	def begin(self) -> None:
+		pass
+
+	def token(self) -> None:
+		pass
+
+	def end(self) -> None:
+		pass
+
+	def retried(self) -> None:
+		pass
+
+	def usage(self, usage_metadata: Optional[dict]) -> None:
+		pass
+
+	def finish(self, error: Optional[BaseException] = None) -> None:
+		pass
+
+
+_NULL_CALL = _NullCall()
+
+
+# Sinks
+class MetricsSink:
+	"""Receives every finished CallRecord. emit() runs on the caller's thread, so it must be cheap."""
+
+	def emit(self, record: CallRecord) -> None:
+		raise NotImplementedError
+
+	def flush(self) -> None:
+		pass
+
+
+class _Histogram:
+	def __init__(self):
+		self.counts = [0] * (len(BUCKETS) + 1)
+		self.total = 0.0
+		self.count = 0
+		self.min = float("inf")
+		self.max = 0.0
+
+	def observe(self, value: float) -> None:
+		self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+		self.total += value
+		self.count += 1
+		self.min = min(self.min, value)
+		self.max = max(self.max, value)
+
+	def quantile(self, q: float) -> Optional[float]:
+		# Linear interpolation inside the bucket holding the q-th observation, within the observed range
+		if not self.count:
+			return None
+		rank = q * self.count
+		seen = 0
+		for i, n in enumerate(self.counts):
+			if n and seen + n >= rank:
+				low = max(BUCKETS[i - 1] if i > 0 else 0.0, self.min)
+				high = min(BUCKETS[i] if i < len(BUCKETS) else self.max, self.max)
+				return low + (high - low) * (rank - seen) / n
+			seen += n
+		return self.max
+
+
+class HistogramSink(MetricsSink):
+	"""
+	In-memory aggregation: per (kind, name) phase latency histograms plus call, error, token, retry and
+	cost totals per (kind, name, model).
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._histograms: Dict[tuple, _Histogram] = {}
+		self._totals: Dict[tuple, Dict[str, float]] = {}
+
+	def emit(self, record: CallRecord) -> None:
+		key = (record.kind, record.name)
+		with self._lock:
+			for name, seconds in record.phases.items():
+				histogram = self._histograms.get((*key, name))
+				if histogram is None:
+					histogram = self._histograms[(*key, name)] = _Histogram()
+				histogram.observe(seconds)
+			totals = self._totals.setdefault((*key, record.model or ""), dict.fromkeys(
+				("calls", "errors", "prompt_tokens", "completion_tokens", "cached_tokens", "retries", "llm_calls", "cost_usd"), 0
+			))
+			totals["calls"] += 1
+			totals["errors"] += record.error is not None
+			totals["prompt_tokens"] += record.prompt_tokens
+			totals["completion_tokens"] += record.completion_tokens
+			totals["cached_tokens"] += record.cached_tokens
+			totals["retries"] += record.retries
+			totals["llm_calls"] += record.llm_calls
+			totals["cost_usd"] += record.cost_usd or 0.0
+
+	def summary(self) -> List[dict]:
+		"""One row per (kind, name): counts and totals, cache_hit_rate, plus p50/p95/p99 and mean seconds per phase."""
+		with self._lock:
+			rows: Dict[tuple, dict] = {}
+			for (kind, name, model), totals in self._totals.items():
+				row = rows.setdefault((kind, name), {"kind": kind, "name": name, "models": [], **dict.fromkeys(totals, 0)})
+				if model:
+					row["models"].append(model)
+				for field, value in totals.items():
+					row[field] += value
+			for (kind, name, phase), histogram in self._histograms.items():
+				row = rows.get((kind, name))
+				if row is None or not histogram.count:
+					continue
+				row[phase] = {
+					"p50": round(histogram.quantile(0.5), 4),
+					"p95": round(histogram.quantile(0.95), 4),
+					"p99": round(histogram.quantile(0.99), 4),
+					"mean": round(histogram.total / histogram.count, 4),
+				}
+			for row in rows.values():
+				row["cost_usd"] = round(row["cost_usd"], 6)
+				# Share of prompt tokens the provider served from its prompt cache
+				row["cache_hit_rate"] = round(row["cached_tokens"] / row["prompt_tokens"], 4) if row["prompt_tokens"] else 0.0
+			return sorted(rows.values(), key=lambda r: (r["kind"], r["name"]))
+
+	def reset(self) -> None:
+		with self._lock:
+			self._histograms.clear()
+			self._totals.clear()
+
+	def _snapshot(self) -> tuple[Dict[tuple, tuple], Dict[tuple, dict]]:
+		with self._lock:
+			histograms = {key: (list(h.counts), h.total, h.count) for key, h in self._histograms.items()}
+			return histograms, {key: dict(v) for key, v in self._totals.items()}
+
+
+class _BufferedFileSink(MetricsSink):
+	# Writes are batched: every flush_every records or flush_interval seconds, and at exit
+	def __init__(self, path: str, flush_every: int = 100, flush_interval: float = 5.0):
+		self.path = path
+		self.flush_every = max(1, int(flush_every))
+		self.flush_interval = flush_interval
+		self._lock = threading.Lock()
+		self._pending = 0
+		self._last_flush = time.monotonic()
+		directory = os.path.dirname(path)
+		if directory:
+			os.makedirs(directory, exist_ok=True)
+		atexit.register(self.flush)
+
+	def _due(self) -> bool:
+		self._pending += 1
+		return self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+
+
+class JsonlSink(_BufferedFileSink):
+	"""Appends one JSON line per record (CallRecord.as_dict()) to path."""
+
+	def __init__(self, path: str, flush_every: int = 100, flush_interval: float = 5.0):
+		super().__init__(path, flush_every, flush_interval)
+		self._lines: List[str] = []
+
+	def emit(self, record: CallRecord) -> None:
+		line = json.dumps(record.as_dict(), default=str)
+		with self._lock:
+			self._lines.append(line)
+			due = self._due()
+		if due:
+			self.flush()
+
+	def flush(self) -> None:
+		with self._lock:
+			lines, self._lines = self._lines, []
+			self._pending = 0
+			self._last_flush = time.monotonic()
+			if lines:
+				with open(self.path, "a", encoding="utf-8") as f:
+					f.write("\n".join(lines) + "\n")
+
+
+def _labels(**labels: Any) -> str:
+	return ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels.items())
+
+
+class PrometheusSink(_BufferedFileSink):
+	"""
+	Aggregates like HistogramSink and renders the Prometheus text exposition format: render() for a scrape
+	endpoint, or, with a path, the file is rewritten on flush (for the node_exporter textfile collector).
+	"""
+
+	def __init__(self, path: Optional[str] = None, flush_every: int = 100, flush_interval: float = 5.0, prefix: str = "llm"):
+		self.histogram = HistogramSink()
+		self.prefix = prefix
+		if path:
+			super().__init__(path, flush_every, flush_interval)
+		else:
+			self.path = None
+			self._lock = threading.Lock()
+
+	def emit(self, record: CallRecord) -> None:
+		self.histogram.emit(record)
+		if self.path is None:
+			return
+		with self._lock:
+			due = self._due()
+		if due:
+			self.flush()
+
+	def render(self) -> str:
+		histograms, totals = self.histogram._snapshot()
+		p = self.prefix
+		lines = [f"# HELP {p}_phase_seconds Seconds per phase of instrumented calls", f"# TYPE {p}_phase_seconds histogram"]
+		for (kind, name, phase), (counts, total, count) in sorted(histograms.items()):
+			labels = _labels(kind=kind, name=name, phase=phase)
+			cumulative = 0
+			for bound, n in zip(BUCKETS, counts):
+				cumulative += n
+				lines.append(f'{p}_phase_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+			lines.append(f'{p}_phase_seconds_bucket{{{labels},le="+Inf"}} {count}')
+			lines.append(f"{p}_phase_seconds_sum{{{labels}}} {total}")
+			lines.append(f"{p}_phase_seconds_count{{{labels}}} {count}")
+		counters = (
+			("calls_total", "calls", "Instrumented calls"),
+			("errors_total", "errors", "Instrumented calls that raised"),
+			("prompt_tokens_total", "prompt_tokens", "Prompt tokens"),
+			("completion_tokens_total", "completion_tokens", "Completion tokens"),
+			("cached_tokens_total", "cached_tokens", "Prompt tokens served from the provider's prompt cache"),
+			("retries_total", "retries", "Retried model requests"),
+			("cost_usd_total", "cost_usd", "Estimated cost in USD from models.yaml prices"),
+		)
+		for metric, field, help_text in counters:
+			lines.append(f"# HELP {p}_{metric} {help_text}")
+			lines.append(f"# TYPE {p}_{metric} counter")
+			for (kind, name, model), values in sorted(totals.items()):
+				lines.append(f"{p}_{metric}{{{_labels(kind=kind, name=name, model=model)}}} {values[field]}")
+		return "\n".join(lines) + "\n"
+
+	def flush(self) -> None:
+		if self.path is None:
+			return
+		with self._lock:
+			self._pending = 0
+			self._last_flush = time.monotonic()
+			text = self.render()
+			with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+				f.write(text)
+			os.replace(self.path + ".tmp", self.path)
+
+
+def _resolve_path(path: str) -> str:
+	return path if os.path.isabs(path) else os.path.join(os.path.dirname(__file__), path)
+
+
+def _configured_sinks() -> List[MetricsSink]:
+	if not _METRICS_CONFIG.get("enabled", True):
+		return []
+	flush_every = int(_METRICS_CONFIG.get("flush_every", 100))
+	flush_interval = float(_METRICS_CONFIG.get("flush_interval_seconds", 5.0))
+	sinks: List[MetricsSink] = []
+	for name in _METRICS_CONFIG.get("sinks", ["histogram"]) or []:
+		if name == "histogram":
+			sinks.append(HistogramSink())
+		elif name == "jsonl":
+			sinks.append(JsonlSink(_resolve_path(_METRICS_CONFIG.get("jsonl_path", ".metrics/calls.jsonl")), flush_every, flush_interval))
+		elif name == "prometheus":
+			sinks.append(PrometheusSink(_resolve_path(_METRICS_CONFIG.get("prometheus_path", ".metrics/metrics.prom")), flush_every, flush_interval))
+		else:
+			raise ValueError(f"Unknown metrics sink '{name}' (expected histogram, jsonl or prometheus)")
+	return sinks
+
+
+# Sinks are replaced, never mutated, so emitting reads the tuple without a lock
+_SINKS: tuple = tuple(_configured_sinks())
+_SINKS_LOCK = threading.Lock()
+
+
+def _emit(record: CallRecord) -> None:
+	for sink in _SINKS:
+		sink.emit(record)
+
+
+def add_metrics_sink(sink: MetricsSink) -> MetricsSink:
+	"""Send records to another sink as well (enables metrics if none were configured)."""
+	global _SINKS
+	with _SINKS_LOCK:
+		_SINKS = (*_SINKS, sink)
+	return sink
+
+
+def remove_metrics_sink(sink: MetricsSink) -> None:
+	global _SINKS
+	with _SINKS_LOCK:
+		_SINKS = tuple(s for s in _SINKS if s is not sink)
+	sink.flush()
+
+
+def metrics_enabled() -> bool:
+	return bool(_SINKS)
+
+
+def flush_metrics() -> None:
+	for sink in _SINKS:
+		sink.flush()
+
+
+# The tool or task record that model requests and phases on this context belong to
+_CURRENT: contextvars.ContextVar = contextvars.ContextVar("metrics_call", default=None)
+
+
+class _Instrument:
+	def __init__(self, kind: str, name: str, task: Optional[str]):
+		self.record = CallRecord(kind, name, task, parent=_CURRENT.get())
+		self._token = None
+
+	def __enter__(self) -> CallRecord:
+		self._token = _CURRENT.set(self.record)
+		return self.record
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		_CURRENT.reset(self._token)
+		self.record.finish(exc)
+
+
+def instrument(kind: str, name: str, task: Optional[str] = None):
+	"""
+	Context manager recording one tool or task run (yields its CallRecord, or None when metrics are
+	disabled). Model requests and phase() blocks inside it are attributed to it.
+	"""
+	if not _SINKS:
+		return _NULL
+	return _Instrument(kind, name, task)
+
+
+def phase(name: str):
+	"""Context manager adding the time spent inside it to a phase (see PHASES) of the current tool or task."""
+	record = _CURRENT.get()
+	return _NULL if record is None else record.phase(name)
+
+
+def annotate(**fields: Any) -> None:
+	"""Attach extra fields (chunk counts, pages sent, ...) to the current tool or task record."""
+	record = _CURRENT.get()
+	if record is not None:
+		record.extra.update(fields)
+
+
+def start_llm_call(model_name: str, run_manager: Any = None):
+	"""
+	Begin the record of one model request (see ManagedChatModel). Its task is the enclosing tool or task's,
+	or the llm_task metadata of the run. Returns a no-op stand-in when metrics are disabled.
+	"""
+	if not _SINKS:
+		return _NULL_CALL
+	parent = _CURRENT.get()
+	task = parent.task if parent is not None else (getattr(run_manager, "metadata", None) or {}).get("llm_task")
+	return CallRecord("llm", task or model_name, task, model_name, parent)
+
+
+def instrumented(kind: str = "task", name: Optional[str] = None, task: Optional[str] = None) -> Callable:
+	"""
+	Decorator recording every run of a function, coroutine function or async generator function with
+	instrument(). task defaults to the call's `task` argument (or its default), as used by llm tasks.
+	"""
+
+	def decorate(fn: Callable) -> Callable:
+		label = name or fn.__name__
+		signature = inspect.signature(fn)
+		takes_task = "task" in signature.parameters
+
+		def task_of(args, kwargs) -> Optional[str]:
+			if task is not None or not takes_task:
+				return task
+			bound = signature.bind_partial(*args, **kwargs)
+			bound.apply_defaults()
+			return bound.arguments.get("task")
+
+		if inspect.isasyncgenfunction(fn):
+			@functools.wraps(fn)
+			async def agen_wrapper(*args, **kwargs):
+				if not _SINKS:
+					async for item in fn(*args, **kwargs):
+						yield item
+					return
+				# The record is current only while the generator runs, not while the consumer holds an item,
+				# so calls the consumer makes between items aren't attributed to the stream
+				record = CallRecord(kind, label, task_of(args, kwargs), parent=_CURRENT.get())
+				agen = fn(*args, **kwargs)
+				error = None
+				try:
+					while True:
+						token = _CURRENT.set(record)
+						try:
+							item = await agen.__anext__()
+						except StopAsyncIteration:
+							break
+						finally:
+							_CURRENT.reset(token)
+						yield item
+				except BaseException as e:
+					error = e
+					raise
+				finally:
+					token = _CURRENT.set(record)
+					try:
+						await agen.aclose()
+					finally:
+						_CURRENT.reset(token)
+						record.finish(error)
+			return agen_wrapper
+
+		if inspect.iscoroutinefunction(fn):
+			@functools.wraps(fn)
+			async def async_wrapper(*args, **kwargs):
+				if not _SINKS:
+					return await fn(*args, **kwargs)
+				with _Instrument(kind, label, task_of(args, kwargs)):
+					return await fn(*args, **kwargs)
+			return async_wrapper
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			if not _SINKS:
+				return fn(*args, **kwargs)
+			with _Instrument(kind, label, task_of(args, kwargs)):
+				return fn(*args, **kwargs)
+		return wrapper
+
+	return decorate
+
+
+def get_metrics_summary() -> List[dict]:
+	"""
+	Return per tool / task / model-request rows (counts, tokens, cost, p50/p95/p99 per phase) from the first
+	HistogramSink or PrometheusSink, or [] when there is none.
+	"""
+	for sink in _SINKS:
+		if isinstance(sink, HistogramSink):
+			return sink.summary()
+		if isinstance(sink, PrometheusSink):
+			return sink.histogram.summary()
+	return []
+
+
+def format_metrics_summary(rows: Optional[List[dict]] = None) -> str:
+	"""A compact text table of get_metrics_summary(), one line per tool, task or model."""
+	rows = get_metrics_summary() if rows is None else rows
+	lines = []
+	for row in rows:
+		total = row.get("total") or {}
+		parts = [f"{row['kind']:<4} {row['name']:<26} {row['calls']:>5} calls"]
+		if total:
+			parts.append(f"p50 {total['p50']:.2f}s p95 {total['p95']:.2f}s")
+		for phase_name in ("fetch", "preprocess", "queue", "ttft"):
+			if phase_name in row:
+				parts.append(f"{phase_name} {row[phase_name]['mean']:.2f}s")
+		parts.append(f"{row['prompt_tokens']}+{row['completion_tokens']} tok ({row['cached_tokens']} cached, {row.get('cache_hit_rate', 0):.0%})")
+		if row["retries"]:
+			parts.append(f"{row['retries']} retries")
+		if row["errors"]:
+			parts.append(f"{row['errors']} errors")
+		parts.append(f"${row['cost_usd']:.4f}")
+		lines.append("  ".join(parts))
+	return "\n".join(lines)
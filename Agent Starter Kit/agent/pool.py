@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class _PoolEntry:
+	__slots__ = ("model", "structured")
+
+	def __init__(self, model: Any):
+		self.model = model
+		self.structured: dict = {}
+
+
+class ModelPool:
+	"""
+	Bounded LRU pool of constructed chat models, keyed by their resolved configuration.
+
+	Reusing a model instance reuses its provider client and HTTP connection pool.
+	Structured-output runnables are cached per model and schema, and are dropped with their model on eviction.
+	The lock is only held for dictionary bookkeeping and model construction (which does no I/O),
+	so it is safe to use from threads and from coroutines running on an event loop.
+	"""
+
+	def __init__(self, max_size: int = 32):
+		self.max_size = max(1, int(max_size))
+		self._entries: "OrderedDict[Hashable, _PoolEntry]" = OrderedDict()
+		self._lock = threading.RLock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.structured_hits = 0
+		self.structured_misses = 0
+
+	def _entry(self, key: Hashable, factory: Callable[[], Any]) -> _PoolEntry:
+		entry = self._entries.get(key)
+		if entry is not None:
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry
+		self.misses += 1
+		entry = _PoolEntry(factory())
+		self._entries[key] = entry
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+			self.evictions += 1
+		return entry
+
+	def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+		"""Return the pooled model for key, building it with factory() on a miss."""
+		with self._lock:
+			return self._entry(key, factory).model
+
+	def get_structured(self, key: Hashable, factory: Callable[[], Any], schema: Any, **kwargs) -> Any:
+		"""Return the cached model.with_structured_output(schema, **kwargs) runnable for key."""
+		structured_key = (schema, tuple(sorted(kwargs.items())))
+		with self._lock:
+			entry = self._entry(key, factory)
+			runnable = entry.structured.get(structured_key)
+			if runnable is not None:
+				self.structured_hits += 1
+				return runnable
+			self.structured_misses += 1
+			runnable = entry.model.with_structured_output(schema, **kwargs)
+			entry.structured[structured_key] = runnable
+			return runnable
+
+	def clear(self) -> None:
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"size": len(self._entries),
+				"max_size": self.max_size,
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"structured_hits": self.structured_hits,
+				"structured_misses": self.structured_misses,
+			}
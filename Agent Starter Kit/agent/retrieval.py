@@ -0,0 +1,206 @@
+import hashlib
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Optional
+
+from agent.chunking import split_text
+from agent.settings import AGENT_CONFIG
+from agent.tokens import count_tokens
+
+_RETRIEVAL_CONFIG = AGENT_CONFIG.get("retrieval") or {}
+
+# Words that say what to do with a text rather than what to look for; they are not searched for
+_STOPWORDS = frozenset(
+	"a about above after all also an analyze and any are as at be by describe detail details document does "
+	"each explain extract find for from give has have how in information into is it its key list main me "
+	"of on or page pages pdf please points provide report section summarize summary tell text that the "
+	"their them there these this to up was what when where which who why will with within".split()
+)
+
+# Instructions that need the whole text (summaries, translations, rewrites) are never narrowed
+_WHOLE_TEXT_WORDS = frozenset(
+	"summarize summarise summary summaries overview outline gist tldr translate translation rewrite rephrase "
+	"paraphrase proofread edit everything entire whole full".split()
+)
+
+
+def _words(text: str) -> List[str]:
+	return re.findall(r"\w+", text.lower())
+
+
+def query_terms(text: str) -> List[str]:
+	"""
+	The searchable terms of a text: lowercased words of 3+ characters, minus stopwords.
+	"""
+	return [t for t in _words(text) if len(t) > 2 and t not in _STOPWORDS]
+
+
+def wants_whole_text(instruction: str) -> bool:
+	"""
+	True for instructions that need the whole text (summarize, translate, rewrite, ...).
+	"""
+	return any(word in _WHOLE_TEXT_WORDS for word in _words(instruction))
+
+
+class BM25Index:
+	"""
+	In-memory Okapi BM25 index over a document's passages, with each passage's token count for budgeting.
+	"""
+
+	def __init__(self, passages: List[str], model_name: Optional[str] = None, k1: float = 1.5, b: float = 0.75):
+		self.passages = passages
+		self.k1 = k1
+		self.b = b
+		self.tokens = [count_tokens(p, model_name) for p in passages]
+		self._tf = [Counter(query_terms(p)) for p in passages]
+		self._lengths = [sum(tf.values()) for tf in self._tf]
+		self._avg_length = (sum(self._lengths) / len(passages) if passages else 0) or 1.0
+		self._df = Counter(term for tf in self._tf for term in tf)
+
+	def idf(self, term: str) -> float:
+		df = self._df.get(term, 0)
+		return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+	def scores(self, query: str) -> List[float]:
+		terms = [t for t in set(query_terms(query)) if t in self._df]
+		weights = {t: self.idf(t) for t in terms}
+		out = []
+		for tf, length in zip(self._tf, self._lengths):
+			norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+			out.append(sum(weights[t] * tf[t] * (self.k1 + 1) / (tf[t] + norm) for t in terms if t in tf))
+		return out
+
+	def top(self, query: str, k: Optional[int] = None) -> List[tuple[int, float]]:
+		"""(passage index, score) of passages matching the query, best first."""
+		ranked = sorted(((i, s) for i, s in enumerate(self.scores(query)) if s > 0), key=lambda x: (-x[1], x[0]))
+		return ranked[:k] if k else ranked
+
+	def select(self, query: str, budget_tokens: int, top_k: Optional[int] = None) -> List[int]:
+		"""
+		Indexes of the best-matching passages (at most top_k) that fit within budget_tokens, in document order.
+		The best passage is always included.
+		"""
+		chosen, used = [], 0
+		for i, _ in self.top(query, top_k):
+			if chosen and used + self.tokens[i] > budget_tokens:
+				continue
+			chosen.append(i)
+			used += self.tokens[i]
+		return sorted(chosen)
+
+
+class _IndexCache:
+	# LRU of document indexes keyed by content hash, so follow-up questions about a page skip re-chunking
+	def __init__(self, max_entries: int):
+		self.max_entries = max_entries
+		self._entries: "OrderedDict[tuple, BM25Index]" = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.focused = 0
+		self.passthrough = 0
+		self.tokens_in = 0
+		self.tokens_out = 0
+
+	def get(self, key: tuple) -> Optional[BM25Index]:
+		with self._lock:
+			index = self._entries.get(key)
+			if index is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return index
+
+	def put(self, key: tuple, index: BM25Index) -> None:
+		with self._lock:
+			self._entries[key] = index
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+	def record(self, tokens_in: int, tokens_out: int) -> None:
+		with self._lock:
+			if tokens_out < tokens_in:
+				self.focused += 1
+			else:
+				self.passthrough += 1
+			self.tokens_in += tokens_in
+			self.tokens_out += tokens_out
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				"entries": len(self._entries),
+				"hits": self.hits,
+				"misses": self.misses,
+				"focused": self.focused,
+				"passthrough": self.passthrough,
+				"tokens_in": self.tokens_in,
+				"tokens_out": self.tokens_out,
+			}
+
+
+_INDEX_CACHE = _IndexCache(int(_RETRIEVAL_CONFIG.get("cache_entries", 64)))
+
+
+def get_document_index(text: str, model_name: Optional[str] = None) -> BM25Index:
+	"""
+	Return the BM25 index over text split into passages of about chunk_tokens tokens, cached by content hash.
+	"""
+	chunk_tokens = int(_RETRIEVAL_CONFIG.get("chunk_tokens", 256))
+	key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), chunk_tokens, model_name)
+	index = _INDEX_CACHE.get(key)
+	if index is None:
+		index = BM25Index(
+			split_text(text, chunk_tokens, model_name),
+			model_name,
+			float(_RETRIEVAL_CONFIG.get("k1", 1.5)),
+			float(_RETRIEVAL_CONFIG.get("b", 0.75)),
+		)
+		_INDEX_CACHE.put(key, index)
+	return index
+
+
+def focus_text(text: str, instruction: str, model_name: Optional[str] = None) -> str:
+	"""
+	Return only the passages of text most relevant to the instruction (BM25, at most top_k passages within
+	budget_tokens), in document order with "[...]" marking omitted text. The text is returned unchanged when
+	retrieval is disabled, the text is under min_document_tokens, the instruction needs the whole text
+	(summaries, translations) or has no searchable terms, nothing matches, or the excerpts would not be much
+	shorter. CPU-bound: call it from a thread in async code.
+	"""
+	min_tokens = int(_RETRIEVAL_CONFIG.get("min_document_tokens", 3000))
+	# Cheap pre-check: a token is at least one character
+	if not _RETRIEVAL_CONFIG.get("enabled", True) or len(text) < min_tokens:
+		return text
+	if wants_whole_text(instruction) or not query_terms(instruction):
+		return text
+	index = get_document_index(text, model_name)
+	total = sum(index.tokens)
+	chosen = []
+	if total >= min_tokens:
+		chosen = index.select(instruction, int(_RETRIEVAL_CONFIG.get("budget_tokens", 4000)), _RETRIEVAL_CONFIG.get("top_k", 12))
+	kept = sum(index.tokens[i] for i in chosen)
+	if not chosen or kept >= total * float(_RETRIEVAL_CONFIG.get("max_kept_ratio", 0.8)):
+		_INDEX_CACHE.record(total, total)
+		return text
+	_INDEX_CACHE.record(total, kept)
+	parts = [f"[Excerpts: the {len(chosen)} of {len(index.passages)} passages most relevant to the instruction; [...] marks omitted text.]"]
+	previous = -1
+	for i in chosen:
+		if i > previous + 1:
+			parts.append("[...]")
+		parts.append(index.passages[i])
+		previous = i
+	if previous < len(index.passages) - 1:
+		parts.append("[...]")
+	return "\n\n".join(parts)
+
+
+def get_retrieval_stats() -> dict:
+	"""
+	Return index cache hits/misses, how many texts were narrowed vs passed through, and tokens in/out.
+	"""
+	return _INDEX_CACHE.stats()
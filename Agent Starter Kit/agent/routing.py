@@ -0,0 +1,405 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+from agent.managed import _is_retryable
+from agent.settings import AGENT_CONFIG
+
+_ROUTING_CONFIG = AGENT_CONFIG.get("routing") or {}
+
+# Content block types that need a multimodal model
+_MULTIMODAL_BLOCKS = {"image", "image_url", "file", "input_audio", "audio", "video"}
+
+
+class ModelHealth:
+	"""
+	Rolling latency and outcome statistics for one model, shared by every task that uses it.
+
+	A bad outcome is an error (retryable ones only; a 400 says nothing about the model) or a lost hedge race.
+	When the share of bad outcomes in the window reaches max_error_rate, or after max_consecutive_errors in a
+	row, the model counts as degraded for cooldown_seconds and routers try it last.
+	"""
+
+	def __init__(
+		self,
+		name: str,
+		window: int = 200,
+		min_samples: int = 20,
+		max_error_rate: float = 0.5,
+		max_consecutive_errors: int = 3,
+		cooldown_seconds: float = 60.0,
+	):
+		self.name = name
+		self.min_samples = min_samples
+		self.max_error_rate = max_error_rate
+		self.max_consecutive_errors = max_consecutive_errors
+		self.cooldown_seconds = cooldown_seconds
+		self._latencies: "deque[float]" = deque(maxlen=window)
+		self._outcomes: "deque[bool]" = deque(maxlen=window)
+		self._lock = threading.Lock()
+		self.successes = 0
+		self.errors = 0
+		self.hedges_lost = 0
+		self.consecutive_errors = 0
+		self.degraded_until = 0.0
+
+	def record_success(self, latency: float) -> None:
+		with self._lock:
+			self._latencies.append(latency)
+			self._outcomes.append(True)
+			self.successes += 1
+			self.consecutive_errors = 0
+
+	def record_failure(self, lost_hedge: bool = False) -> None:
+		with self._lock:
+			self._outcomes.append(False)
+			if lost_hedge:
+				self.hedges_lost += 1
+			else:
+				self.errors += 1
+				self.consecutive_errors += 1
+			bad = self._outcomes.count(False)
+			if self.consecutive_errors >= self.max_consecutive_errors or (
+				len(self._outcomes) >= self.min_samples and bad / len(self._outcomes) >= self.max_error_rate
+			):
+				self.degraded_until = time.monotonic() + self.cooldown_seconds
+				# Start the next evaluation fresh, so one probe after the cooldown can restore the model
+				self._outcomes.clear()
+				self.consecutive_errors = 0
+
+	def degraded(self) -> bool:
+		return time.monotonic() < self.degraded_until
+
+	def percentile(self, q: float) -> Optional[float]:
+		"""Latency percentile (0..1) of recent successful calls, or None with fewer than min_samples."""
+		with self._lock:
+			if len(self._latencies) < self.min_samples:
+				return None
+			ordered = sorted(self._latencies)
+		return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+	def stats(self) -> dict:
+		p50, p95 = self.percentile(0.5), self.percentile(0.95)
+		with self._lock:
+			window = len(self._outcomes)
+			bad = self._outcomes.count(False)
+		return {
+			"name": self.name,
+			"successes": self.successes,
+			"errors": self.errors,
+			"hedges_lost": self.hedges_lost,
+			"error_rate": round(bad / window, 3) if window else 0.0,
+			"p50_s": None if p50 is None else round(p50, 3),
+			"p95_s": None if p95 is None else round(p95, 3),
+			"degraded": self.degraded(),
+		}
+
+
+_HEALTH: Dict[str, ModelHealth] = {}
+_HEALTH_LOCK = threading.Lock()
+
+
+def get_model_health(model_name: str) -> ModelHealth:
+	"""
+	Return the process-wide health record for a model.
+	"""
+	with _HEALTH_LOCK:
+		health = _HEALTH.get(model_name)
+		if health is None:
+			health = _HEALTH[model_name] = ModelHealth(
+				model_name,
+				window=_ROUTING_CONFIG.get("window", 200),
+				min_samples=_ROUTING_CONFIG.get("min_samples", 20),
+				max_error_rate=_ROUTING_CONFIG.get("max_error_rate", 0.5),
+				max_consecutive_errors=_ROUTING_CONFIG.get("max_consecutive_errors", 3),
+				cooldown_seconds=_ROUTING_CONFIG.get("cooldown_seconds", 60),
+			)
+		return health
+
+
+def get_routing_stats() -> List[dict]:
+	"""
+	Return latency percentiles, error rates and degraded flags for every model that has been routed.
+	"""
+	with _HEALTH_LOCK:
+		records = list(_HEALTH.values())
+	return [health.stats() for health in records]
+
+
+# Sync hedges (only the extra calls) run here; a losing call cannot be interrupted and finishes in the background
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+def _start_thread(fn: Callable[[], Any]) -> Future:
+	"""Run fn on a new daemon thread, unbounded by any pool, and return a Future for its result."""
+	future: Future = Future()
+	future.set_running_or_notify_cancel()
+
+	def target() -> None:
+		try:
+			future.set_result(fn())
+		except BaseException as e:
+			future.set_exception(e)
+
+	threading.Thread(target=target, daemon=True).start()
+	return future
+
+
+def _needs_multimodal(messages: list) -> bool:
+	for message in messages:
+		content = getattr(message, "content", None)
+		if isinstance(content, list):
+			for part in content:
+				if isinstance(part, dict) and part.get("type") in _MULTIMODAL_BLOCKS:
+					return True
+	return False
+
+
+class RoutedChatModel(BaseChatModel):
+	"""
+	Chat model over an ordered chain of models (primary first) that routes each call by model health.
+
+	Degraded models (see ModelHealth) move to the back of the chain, and models marked multimodal: false are
+	skipped for image/file input. With hedging, if the first model has not answered within its observed p95
+	latency (hedge_percentile), the next model is started too and the first answer wins; the loser is
+	cancelled (async) or ignored (sync) and recorded as a lost hedge. A model failing with a retryable error
+	(see managed._is_retryable) fails over to the next one immediately; any other error, such as a 400 for the
+	request itself, is raised at once, since every model would be sent the same request. Streams are not
+	hedged but fail over until the first chunk has been yielded. Unhedged sync calls run on the caller's
+	thread.
+
+	Requests are built in the primary's format (bound tools, structured output), so the chain should stay
+	within one API family (here: OpenAI-compatible providers).
+	"""
+
+	models: List[BaseChatModel]
+	model_name: str
+	multimodal: List[Optional[bool]] = []
+	hedging: bool = False
+	hedge_percentile: float = 0.95
+	default_hedge_after: Optional[float] = 30.0
+	min_hedge_after: float = 1.0
+	max_hedges: int = 1
+
+	@property
+	def _llm_type(self) -> str:
+		return "routed"
+
+	@property
+	def _identifying_params(self) -> dict:
+		return {"models": [m.model_name for m in self.models]}
+
+	def _candidates(self, messages: list) -> List[BaseChatModel]:
+		models = list(self.models)
+		if _needs_multimodal(messages):
+			flags = self.multimodal or [None] * len(models)
+			models = [m for m, flag in zip(models, flags) if flag is not False] or models
+		healthy, degraded = [], []
+		for model in models:
+			(degraded if get_model_health(model.model_name).degraded() else healthy).append(model)
+		return healthy + degraded
+
+	def _hedge_after(self, model: BaseChatModel) -> Optional[float]:
+		if not self.hedging:
+			return None
+		p = get_model_health(model.model_name).percentile(self.hedge_percentile)
+		if p is None:
+			return self.default_hedge_after
+		return max(self.min_hedge_after, p)
+
+	def _timeout(self, candidates: List[BaseChatModel], launched: int, hedges: int, last_start: Optional[float]) -> Optional[float]:
+		# Seconds until the next hedge should fire, or None to wait for a result. Counted from when the latest
+		# call actually started (None: still queued), so time spent waiting for a thread doesn't count
+		if launched >= len(candidates) or hedges >= self.max_hedges:
+			return None
+		after = self._hedge_after(candidates[launched - 1])
+		if after is None:
+			return None
+		if last_start is None:
+			return after
+		return max(0.0, after - (time.monotonic() - last_start))
+
+	def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		candidates = self._candidates(messages)
+		if not self.hedging or self.max_hedges < 1 or len(candidates) < 2:
+			return self._generate_in_order(candidates, messages, stop, run_manager, **kwargs)
+		# The caller waits for whichever call answers first, so even the first call runs on a thread of its
+		# own (never queued behind other calls); only hedges share _HEDGE_POOL
+		pending: Dict[Future, list] = {}
+		launched = hedges = 0
+		latest: list = []
+		last_error: Optional[BaseException] = None
+
+		def launch(hedge: bool) -> None:
+			nonlocal launched, latest
+			model = candidates[launched]
+			launched += 1
+			attempt = latest = [model, None]
+			ctx = contextvars.copy_context()
+
+			def call() -> ChatResult:
+				attempt[1] = time.monotonic()
+				return ctx.run(model._generate, messages, stop=stop, run_manager=run_manager, **kwargs)
+
+			pending[_HEDGE_POOL.submit(call) if hedge else _start_thread(call)] = attempt
+
+		launch(hedge=False)
+		while pending:
+			last_start = latest[1]
+			done, _ = wait(list(pending), timeout=self._timeout(candidates, launched, hedges, last_start), return_when=FIRST_COMPLETED)
+			if not done:
+				# Hedge only once the latest call has been running for its hedge delay
+				if last_start is not None:
+					hedges += 1
+					launch(hedge=True)
+				continue
+			for future in done:
+				model, started = pending.pop(future)
+				error = future.exception()
+				if error is None:
+					get_model_health(model.model_name).record_success(time.monotonic() - started)
+					for other, _ in pending.values():
+						get_model_health(other.model_name).record_failure(lost_hedge=True)
+					return future.result()
+				if not _is_retryable(error):
+					# Calls still running can't be interrupted; they finish in the background
+					raise error
+				get_model_health(model.model_name).record_failure()
+				last_error = error
+			if not pending and launched < len(candidates):
+				launch(hedge=False)
+		raise last_error
+
+	def _generate_in_order(self, candidates: List[BaseChatModel], messages, stop, run_manager, **kwargs) -> ChatResult:
+		# No hedging: fail over along the chain on the caller's thread
+		last_error: Optional[BaseException] = None
+		for model in candidates:
+			started = time.monotonic()
+			try:
+				result = model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+			except Exception as e:
+				if not _is_retryable(e):
+					raise
+				get_model_health(model.model_name).record_failure()
+				last_error = e
+				continue
+			get_model_health(model.model_name).record_success(time.monotonic() - started)
+			return result
+		raise last_error
+
+	async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		candidates = self._candidates(messages)
+		pending: Dict[asyncio.Task, tuple] = {}
+		launched = hedges = 0
+		last_start = 0.0
+		last_error: Optional[BaseException] = None
+
+		def launch() -> None:
+			nonlocal launched, last_start
+			model = candidates[launched]
+			launched += 1
+			last_start = time.monotonic()
+			task = asyncio.ensure_future(model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs))
+			pending[task] = (model, last_start)
+
+		launch()
+		try:
+			while pending:
+				timeout = self._timeout(candidates, launched, hedges, last_start)
+				done, _ = await asyncio.wait(list(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+				if not done:
+					hedges += 1
+					launch()
+					continue
+				for task in done:
+					model, started = pending.pop(task)
+					error = task.exception()
+					if error is None:
+						get_model_health(model.model_name).record_success(time.monotonic() - started)
+						for other, _ in pending.values():
+							get_model_health(other.model_name).record_failure(lost_hedge=True)
+						return task.result()
+					if not _is_retryable(error):
+						raise error
+					get_model_health(model.model_name).record_failure()
+					last_error = error
+				if not pending and launched < len(candidates):
+					launch()
+			raise last_error
+		finally:
+			for task in pending:
+				task.cancel()
+
+	def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+		candidates = self._candidates(messages)
+		for i, model in enumerate(candidates):
+			started = False
+			began = time.monotonic()
+			try:
+				for chunk in model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+					started = True
+					yield chunk
+				get_model_health(model.model_name).record_success(time.monotonic() - began)
+				return
+			except Exception as e:
+				if not _is_retryable(e):
+					raise
+				get_model_health(model.model_name).record_failure()
+				if started or i == len(candidates) - 1:
+					raise
+
+	async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+		candidates = self._candidates(messages)
+		for i, model in enumerate(candidates):
+			started = False
+			began = time.monotonic()
+			try:
+				async for chunk in model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+					started = True
+					yield chunk
+				get_model_health(model.model_name).record_success(time.monotonic() - began)
+				return
+			except Exception as e:
+				if not _is_retryable(e):
+					raise
+				get_model_health(model.model_name).record_failure()
+				if started or i == len(candidates) - 1:
+					raise
+
+	def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs) -> bool:
+		return self.models[0]._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+	def bind_tools(self, tools, **kwargs):
+		# Tools are formatted by the primary; the same kwargs are sent to whichever model serves the call
+		bound = self.models[0].bind_tools(tools, **kwargs)
+		return self.bind(**bound.kwargs)
+
+	def with_structured_output(self, schema, **kwargs):
+		# Reuse the primary's structured-output chain (request kwargs + parser), re-pointed at this router
+		runnable = self.models[0].with_structured_output(schema, **kwargs)
+		if isinstance(runnable, RunnableSequence):
+			first = runnable.first
+			if isinstance(first, RunnableBinding) and first.bound is self.models[0]:
+				return RunnableSequence(self.bind(**first.kwargs), *runnable.steps[1:])
+		return super().with_structured_output(schema, **kwargs)
+
+
+def routing_settings() -> dict:
+	"""
+	Keyword arguments for RoutedChatModel from models.yaml `routing`.
+	"""
+	return {
+		"hedging": _ROUTING_CONFIG.get("hedging", False),
+		"hedge_percentile": _ROUTING_CONFIG.get("hedge_percentile", 0.95),
+		"default_hedge_after": _ROUTING_CONFIG.get("default_hedge_after_seconds", 30.0),
+		"min_hedge_after": _ROUTING_CONFIG.get("min_hedge_after_seconds", 1.0),
+		"max_hedges": _ROUTING_CONFIG.get("max_hedges", 1),
+	}
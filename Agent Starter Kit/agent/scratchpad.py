@@ -0,0 +1,175 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agent.settings import AGENT_CONFIG
+from agent.tokens import count_tokens, estimate_message_tokens
+
+_SCRATCHPAD_CONFIG = AGENT_CONFIG.get("scratchpad") or {}
+
+# Tag carried by the agent's own model calls (tool-internal LLM calls don't inherit it)
+AGENT_MODEL_TAG = "agent-model"
+
+
+class ReferenceStore:
+	"""
+	Bounded, content-addressed store for tool results compacted out of agent scratchpads.
+	References are sha256 prefixes, so the same observation always gets the same reference.
+	"""
+
+	def __init__(self, max_entries: int = 1000):
+		self.max_entries = max_entries
+		self._entries: "OrderedDict[str, str]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def put(self, text: str) -> str:
+		ref = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+		with self._lock:
+			self._entries[ref] = text
+			self._entries.move_to_end(ref)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+		return ref
+
+	def get(self, ref: str) -> Optional[str]:
+		with self._lock:
+			text = self._entries.get(ref.strip())
+			if text is not None:
+				self._entries.move_to_end(ref.strip())
+			return text
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+
+REFERENCE_STORE = ReferenceStore(_SCRATCHPAD_CONFIG.get("reference_store_entries", 1000))
+
+
+class ScratchpadCompactor:
+	"""
+	Callable for AgentExecutor.trim_intermediate_steps that keeps the scratchpad within a token budget.
+
+	The newest keep_recent_steps tool results are always sent verbatim. Once the observations together exceed
+	budget_tokens, the oldest remaining ones are replaced by a digest (their first digest_chars characters)
+	and a reference until they fit in compact_to_ratio of the budget; the full text goes to the reference store
+	and can be read back with recall_observation. Compacting down to below the budget leaves room for the next
+	few steps, so the prompt's compacted prefix (and the provider's prompt cache for it) stays the same for
+	several iterations instead of moving by one step each time. The outcome depends only on the steps, so each
+	iteration replays the same decisions.
+	"""
+
+	def __init__(
+		self,
+		budget_tokens: int = 8000,
+		keep_recent_steps: int = 2,
+		digest_chars: int = 600,
+		compact_to_ratio: float = 0.5,
+		model_name: Optional[str] = None,
+		store: Optional[ReferenceStore] = None,
+	):
+		self.budget_tokens = budget_tokens
+		self.keep_recent_steps = keep_recent_steps
+		self.digest_chars = digest_chars
+		self.compact_to_ratio = compact_to_ratio
+		self.model_name = model_name
+		self.store = store or REFERENCE_STORE
+		self._token_counts: "OrderedDict[str, int]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _tokens(self, text: str) -> int:
+		# Observations are re-measured every iteration; remember counts by content
+		key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+		with self._lock:
+			if key in self._token_counts:
+				return self._token_counts[key]
+		tokens = count_tokens(text, self.model_name)
+		with self._lock:
+			self._token_counts[key] = tokens
+			while len(self._token_counts) > 4096:
+				self._token_counts.popitem(last=False)
+		return tokens
+
+	def digest(self, observation: str, tokens: int) -> str:
+		ref = self.store.put(observation)
+		head = re.sub(r"\s+", " ", observation[: self.digest_chars * 2]).strip()[: self.digest_chars]
+		return (
+			f"{head}...\n[Earlier tool result compacted to save context: {tokens} tokens, first {len(head)} chars shown. "
+			f'Call recall_observation(ref="{ref}") to read the full text.]'
+		)
+
+	def __call__(self, steps: List[Tuple[AgentAction, Any]]) -> List[Tuple[AgentAction, Any]]:
+		observations = [obs if isinstance(obs, str) else str(obs) for _, obs in steps]
+		sizes = [self._tokens(obs) for obs in observations]
+		if sum(sizes) <= self.budget_tokens:
+			return steps
+		out = list(steps)
+		digests = {}
+		# Replay the iterations that led here: steps before `boundary` have been considered for compaction
+		total = boundary = 0
+		for n, size in enumerate(sizes, 1):
+			total += size
+			if total <= self.budget_tokens:
+				continue
+			target = self.budget_tokens * self.compact_to_ratio
+			while total > target and boundary < n - self.keep_recent_steps:
+				digest = self.digest(observations[boundary], sizes[boundary])
+				digest_tokens = self._tokens(digest)
+				if digest_tokens < sizes[boundary]:
+					digests[boundary] = digest
+					total -= sizes[boundary] - digest_tokens
+				boundary += 1
+		for i, digest in digests.items():
+			out[i] = (steps[i][0], digest)
+		return out
+
+
+def build_scratchpad_compactor(model_name: Optional[str] = None, enabled: Optional[bool] = None) -> Optional[ScratchpadCompactor]:
+	"""
+	Return a compactor configured from models.yaml `scratchpad`, or None when compaction is disabled
+	(enabled overrides the configured switch).
+	"""
+	if enabled is None:
+		enabled = _SCRATCHPAD_CONFIG.get("enabled", True)
+	if not enabled:
+		return None
+	return ScratchpadCompactor(
+		budget_tokens=_SCRATCHPAD_CONFIG.get("budget_tokens", 8000),
+		keep_recent_steps=_SCRATCHPAD_CONFIG.get("keep_recent_steps", 2),
+		digest_chars=_SCRATCHPAD_CONFIG.get("digest_chars", 600),
+		compact_to_ratio=_SCRATCHPAD_CONFIG.get("compact_to_ratio", 0.5),
+		model_name=model_name,
+	)
+
+
+class PromptTokenTracker(BaseCallbackHandler):
+	"""
+	Callback that records the prompt tokens of each agent-model call, i.e. one entry per agent iteration,
+	and the part of each the provider reported as read from its prompt cache (0 when it reports none).
+	Pass it per run: agent.invoke(inputs, config={"callbacks": [tracker]}).
+	"""
+
+	def __init__(self, model_name: Optional[str] = None):
+		self.model_name = model_name
+		self.iterations: List[int] = []
+		self.cached: List[int] = []
+
+	def on_chat_model_start(self, serialized, messages, *, tags=None, **kwargs) -> None:
+		if AGENT_MODEL_TAG not in (tags or []):
+			return
+		tools = (kwargs.get("invocation_params") or {}).get("tools")
+		for batch in messages:
+			self.iterations.append(estimate_message_tokens(batch, self.model_name, tools))
+
+	def on_llm_end(self, response, *, tags=None, **kwargs) -> None:
+		if AGENT_MODEL_TAG not in (tags or []):
+			return
+		for generations in response.generations:
+			message = getattr(generations[0], "message", None) if generations else None
+			usage = getattr(message, "usage_metadata", None) or {}
+			self.cached.append((usage.get("input_token_details") or {}).get("cache_read") or 0)
@@ -0,0 +1,174 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from agent.settings import AGENT_CONFIG
+from agent.streaming import StreamTiming, astream_agent
+
+_SESSIONS_CONFIG = AGENT_CONFIG.get("sessions") or {}
+
+
+class AgentSession:
+	"""
+	Conversation state for one session: message history plus a lock that keeps its turns in order.
+	"""
+
+	def __init__(self, session_id: str):
+		self.session_id = session_id
+		self.history: List[BaseMessage] = []
+		self.created_at = time.time()
+		self.last_used = self.created_at
+		self.runs = 0
+		self.lock = asyncio.Lock()
+
+
+class SessionManager:
+	"""
+	Serve many concurrent agent conversations from one event loop.
+
+	Every session shares one agent executor, and through it the pooled models, rate limiters and HTTP
+	clients. The executor keeps no per-run state, so each run gets its own max_parallel_tools budget. Each
+	session keeps its own history (passed to the agent as chat_history). Turns within a session run one at a
+	time; turns in different sessions run concurrently, at most max_concurrent_runs at once. Sessions idle for
+	idle_ttl_seconds are dropped, and the least recently used session is evicted beyond max_sessions.
+	"""
+
+	def __init__(
+		self,
+		agent: Any = None,
+		max_sessions: Optional[int] = None,
+		max_concurrent_runs: Optional[int] = None,
+		idle_ttl_seconds: Optional[float] = None,
+		max_history_messages: Optional[int] = None,
+	):
+		if agent is None:
+			from agent.agent import build_agent
+
+			agent = build_agent(verbose=False)
+		self.agent = agent
+		self.max_sessions = max_sessions or _SESSIONS_CONFIG.get("max_sessions", 10000)
+		self.max_concurrent_runs = max_concurrent_runs or _SESSIONS_CONFIG.get("max_concurrent_runs", 256)
+		self.idle_ttl_seconds = idle_ttl_seconds or _SESSIONS_CONFIG.get("idle_ttl_seconds", 1800)
+		self.max_history_messages = max_history_messages or _SESSIONS_CONFIG.get("max_history_messages", 40)
+		self._sessions: "OrderedDict[str, AgentSession]" = OrderedDict()
+		self._run_slots = asyncio.Semaphore(self.max_concurrent_runs)
+		self.active_runs = 0
+		self.completed_runs = 0
+		self.failed_runs = 0
+
+	# Sessions
+	def get(self, session_id: Optional[str] = None) -> AgentSession:
+		"""Return the session for session_id, creating it (with a new id if None) when needed."""
+		session_id = session_id or uuid.uuid4().hex
+		session = self._sessions.get(session_id)
+		if session is None:
+			self.prune()
+			while len(self._sessions) >= self.max_sessions:
+				oldest_id, oldest = next(iter(self._sessions.items()))
+				if oldest.lock.locked():
+					break
+				del self._sessions[oldest_id]
+			session = self._sessions[session_id] = AgentSession(session_id)
+		self._sessions.move_to_end(session_id)
+		return session
+
+	def close(self, session_id: str) -> None:
+		self._sessions.pop(session_id, None)
+
+	def prune(self) -> int:
+		"""Drop sessions idle for longer than idle_ttl_seconds; returns how many were removed."""
+		cutoff = time.time() - self.idle_ttl_seconds
+		expired = [sid for sid, s in self._sessions.items() if s.last_used < cutoff and not s.lock.locked()]
+		for session_id in expired:
+			del self._sessions[session_id]
+		return len(expired)
+
+	# Runs
+	def _inputs(self, session: AgentSession, text: str, extra: dict) -> dict:
+		return {**extra, "input": text, "chat_history": list(session.history)}
+
+	def _record(self, session: AgentSession, text: str, output: Any) -> None:
+		session.history.extend([HumanMessage(content=text), AIMessage(content=str(output))])
+		del session.history[: max(0, len(session.history) - self.max_history_messages)]
+		session.last_used = time.time()
+		session.runs += 1
+
+	async def ainvoke(self, session_id: Optional[str], text: str, **inputs: Any) -> dict:
+		"""
+		Run one agent turn for a session and return the executor's result (with "session_id" added).
+		"""
+		session = self.get(session_id)
+		async with session.lock, self._run_slots:
+			self.active_runs += 1
+			try:
+				result = await self.agent.ainvoke(self._inputs(session, text, inputs))
+			except BaseException:
+				self.failed_runs += 1
+				raise
+			finally:
+				self.active_runs -= 1
+			self._record(session, text, result.get("output", ""))
+			self.completed_runs += 1
+		return {**result, "session_id": session.session_id}
+
+	async def astream(self, session_id: Optional[str], text: str, **inputs: Any) -> AsyncIterator[dict]:
+		"""
+		Run one agent turn for a session, yielding the executor's stream chunks (actions, steps, output).
+		"""
+		session = self.get(session_id)
+		async with session.lock, self._run_slots:
+			self.active_runs += 1
+			output = None
+			try:
+				async for chunk in self.agent.astream(self._inputs(session, text, inputs)):
+					if "output" in chunk:
+						output = chunk["output"]
+					yield {**chunk, "session_id": session.session_id}
+			except BaseException:
+				self.failed_runs += 1
+				raise
+			finally:
+				self.active_runs -= 1
+			self._record(session, text, output or "")
+			self.completed_runs += 1
+
+	async def astream_events(
+		self,
+		session_id: Optional[str],
+		text: str,
+		timing: Optional[StreamTiming] = None,
+		**inputs: Any,
+	) -> AsyncIterator[dict]:
+		"""
+		Run one agent turn for a session, yielding token and tool events as they happen (see
+		streaming.astream_agent). Pass a StreamTiming to read time-to-first-token and total latency.
+		"""
+		session = self.get(session_id)
+		async with session.lock, self._run_slots:
+			self.active_runs += 1
+			output = None
+			try:
+				async for event in astream_agent(self.agent, self._inputs(session, text, inputs), timing=timing):
+					if event["event"] == "final":
+						output = event["output"]
+					yield {**event, "session_id": session.session_id}
+			except BaseException:
+				self.failed_runs += 1
+				raise
+			finally:
+				self.active_runs -= 1
+			self._record(session, text, output or "")
+			self.completed_runs += 1
+
+	def stats(self) -> dict:
+		return {
+			"sessions": len(self._sessions),
+			"active_runs": self.active_runs,
+			"completed_runs": self.completed_runs,
+			"failed_runs": self.failed_runs,
+			"max_concurrent_runs": self.max_concurrent_runs,
+		}
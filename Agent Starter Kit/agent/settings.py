@@ -1,10 +1,84 @@
+import json
 import os
-import yaml
+from typing import Optional
 
 _here = os.path.dirname(__file__)
 _config_path = os.path.join(_here, "models.yaml")
 
-with open(_config_path, "r") as f:
-	AGENT_CONFIG = yaml.safe_load(f)
+# Importing PyYAML and parsing models.yaml take most of a cold import of this module, so the validated
+# config is kept as JSON under __pycache__ (like a .pyc) and reused until models.yaml changes
+_cache_path = os.path.join(_here, "__pycache__", "models.yaml.json")
+_CACHE_VERSION = 1
 
 
+def validate_config(config: dict) -> dict:
+	"""
+	Check models.yaml's cross-references: every model has a provider, a `default` task exists, and every
+	task's model_name and fallbacks are listed under available_models. Raises ValueError naming each problem.
+	"""
+	if not isinstance(config, dict):
+		raise ValueError(f"{_config_path}: expected a mapping at the top level")
+	problems = []
+	models = config.get("available_models")
+	if not isinstance(models, dict) or not models:
+		problems.append("available_models: expected a mapping of model names to their settings")
+		models = {}
+	for name, model_cfg in models.items():
+		if not isinstance(model_cfg, dict) or not model_cfg.get("provider"):
+			problems.append(f"available_models.{name}: no provider")
+	if not isinstance(config.get("default"), dict):
+		problems.append("default: missing (tasks without their own entry use it)")
+	for task, task_cfg in config.items():
+		if not isinstance(task_cfg, dict) or "model_name" not in task_cfg:
+			continue
+		for name in [task_cfg["model_name"], *(task_cfg.get("fallbacks") or [])]:
+			if name not in models:
+				problems.append(f"{task}: model '{name}' is not in available_models")
+	if problems:
+		raise ValueError(f"Invalid {_config_path}:\n  " + "\n  ".join(problems))
+	return config
+
+
+def _stamp() -> list:
+	stat = os.stat(_config_path)
+	return [_CACHE_VERSION, stat.st_mtime_ns, stat.st_size]
+
+
+def _load_cached(stamp: list) -> Optional[dict]:
+	try:
+		with open(_cache_path, "r", encoding="utf-8") as f:
+			cached = json.load(f)
+	except (OSError, ValueError):
+		return None
+	return cached.get("config") if cached.get("stamp") == stamp else None
+
+
+def _compile(stamp: list) -> dict:
+	import yaml
+
+	with open(_config_path, "r") as f:
+		config = validate_config(yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+	# Only configs that survive a JSON round trip are cached; others (non-string keys, dates) are parsed each time
+	try:
+		encoded = json.dumps({"stamp": stamp, "config": config})
+		if json.loads(encoded)["config"] == config:
+			os.makedirs(os.path.dirname(_cache_path), exist_ok=True)
+			tmp = f"{_cache_path}.{os.getpid()}.tmp"
+			with open(tmp, "w", encoding="utf-8") as f:
+				f.write(encoded)
+			os.replace(tmp, _cache_path)
+	except (OSError, TypeError, ValueError):
+		pass
+	return config
+
+
+def load_config() -> dict:
+	"""
+	Load models.yaml: from the compiled cache when it is current, otherwise parsed, validated and recompiled.
+	"""
+	stamp = _stamp()
+	cached = _load_cached(stamp)
+	return cached if cached is not None else _compile(stamp)
+
+
+AGENT_CONFIG = load_config()
@@ -0,0 +1,88 @@
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional
+
+# Rough costs for non-text content parts (providers bill these differently; used only for budgeting)
+IMAGE_PART_TOKENS = 765
+CHARS_PER_TOKEN = 4
+
+_encoding_lock = threading.Lock()
+
+
+@lru_cache(maxsize=32)
+def _encoding_for(model_name: Optional[str]):
+	"""
+	Return a tiktoken encoding for the model, or None when no encoding can be loaded (e.g. offline).
+	"""
+	try:
+		import tiktoken
+	except ImportError:
+		return None
+	with _encoding_lock:
+		try:
+			if model_name:
+				try:
+					return tiktoken.encoding_for_model(model_name)
+				except KeyError:
+					pass
+			return tiktoken.get_encoding("o200k_base")
+		except Exception:
+			return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+	"""
+	Count tokens in text with tiktoken, falling back to a characters-per-token estimate.
+	"""
+	if not text:
+		return 0
+	encoding = _encoding_for(model_name)
+	if encoding is None:
+		return len(text) // CHARS_PER_TOKEN + 1
+	return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_tokens(text: str, max_tokens: int, model_name: Optional[str] = None) -> List[str]:
+	"""
+	Hard-split text into pieces of at most max_tokens tokens (characters-per-token when tiktoken is unavailable).
+	"""
+	max_tokens = max(1, max_tokens)
+	encoding = _encoding_for(model_name)
+	if encoding is None:
+		step = max_tokens * CHARS_PER_TOKEN
+		return [text[i : i + step] for i in range(0, len(text), step)]
+	tokens = encoding.encode(text, disallowed_special=())
+	return [encoding.decode(tokens[i : i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def _content_tokens(content: Any, model_name: Optional[str]) -> int:
+	if isinstance(content, str):
+		return count_tokens(content, model_name)
+	total = 0
+	for part in content or []:
+		if isinstance(part, str):
+			total += count_tokens(part, model_name)
+		elif isinstance(part, dict):
+			part_type = part.get("type")
+			if part_type == "text":
+				total += count_tokens(part.get("text", ""), model_name)
+			elif part_type in ("image", "image_url"):
+				total += IMAGE_PART_TOKENS
+			elif part_type == "file":
+				# base64 payload; roughly one token per 6 decoded bytes of document
+				total += len(part.get("data") or "") // 8
+	return total
+
+
+def estimate_message_tokens(messages: Iterable[Any], model_name: Optional[str] = None, tools: Any = None) -> int:
+	"""
+	Estimate prompt tokens for a list of LangChain messages or role/content dicts (plus optional tool schemas).
+	"""
+	total = 0
+	for message in messages:
+		content = message.get("content") if isinstance(message, dict) else getattr(message, "content", "")
+		total += 4 + _content_tokens(content, model_name)
+	if tools:
+		total += count_tokens(json.dumps(tools, default=str), model_name)
+	return total + 2
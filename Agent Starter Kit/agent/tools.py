@@ -1,12 +1,25 @@
 from typing import Optional
+import asyncio
 import os
-import base64
 import mimetypes
-import httpx
-from langchain.tools import tool
-from langchain_tavily import TavilySearch
+from langchain_core.tools import tool
 
+from agent.chunking import MAX_INPUT_CHARS, amap_reduce, map_prompt, map_reduce, reduce_prompt, split_for_model, text_of
+from agent.extract import html_read_chars, readable_text
 from agent.factory import get_llm_for
+from agent.fetch_strategy import get_fetch_strategy
+from agent.http_client import Download, afetch_download, afetch_text, fetch_download, fetch_text
+from agent.images import prepare_image
+from agent.metrics import annotate, instrumented, phase
+from agent.pdfs import PreparedPdf, prepare_pdf
+from agent.retrieval import focus_text
+from agent.scratchpad import REFERENCE_STORE
+from agent.settings import AGENT_CONFIG
+from agent.singleflight import SingleFlight
+from agent.tokens import count_tokens
+
+# Concurrent fetches of the same URL share one download
+_FETCHES = SingleFlight("fetch")
 
 
 # Helpers
@@ -21,156 +34,357 @@ def _default_headers() -> dict:
 	}
 
 
+def _search_client(max_results: int):
+	# langchain_tavily is only imported when a search runs
+	from langchain_tavily import TavilySearch
+
+	return TavilySearch(k=max_results)
+
+
 def _jina_reader_url(url: str) -> str:
 	# Transform any http/https url into Jina Reader endpoint
 	stripped = url.split("://", 1)[-1]
 	return f"https://r.jina.ai/http://{stripped}"
 
 
-def _fetch_webpage_text_with_fallback(url: str, max_chars: int) -> tuple[str, str]:
+def _fetch_webpage_text_with_fallback(url: str, max_chars: int, raw_html: bool = False) -> tuple[str, str]:
 	"""
-	Try fetching the webpage HTML directly with robust headers.
-	On failure (401/403/network), fall back to Jina Reader to get readable text.
-	Returns (text, source), where source is "direct" or "jina".
+	Fetch the webpage HTML directly with robust headers and reduce it to readable markdown (unless raw_html),
+	or get readable text from Jina Reader, whichever works for the URL's domain: the fetch strategy
+	(fetch_strategy.py) starts with the path known to work there and races the other when it is slow.
+	Returns (text, source), where source is "direct", "jina" or "error".
+	Concurrent calls for the same URL share a single fetch.
 	"""
-	# First attempt: direct
+	text, source = _FETCHES.do(
+		("text", url, max_chars, raw_html),
+		lambda: _fetch_webpage_text_uncollapsed(url, max_chars, raw_html),
+	)
+	annotate(fetch_source=source)
+	return text, source
+
+
+def _fetch_webpage_text_uncollapsed(url: str, max_chars: int, raw_html: bool) -> tuple[str, str]:
+	def direct(timeout: float) -> str:
+		# Streamed: reading stops once enough text is decoded for extraction
+		with phase("fetch"):
+			body = fetch_text(url, html_read_chars(max_chars, raw_html), headers=_default_headers(), timeout=timeout)
+		with phase("preprocess"):
+			return readable_text(body, max_chars, raw_html=raw_html)
+
+	def jina(timeout: float) -> str:
+		# Jina Reader already returns readable text
+		with phase("fetch"):
+			return fetch_text(_jina_reader_url(url), max_chars, timeout=timeout)
+
 	try:
-		headers = _default_headers()
-		with httpx.Client(headers=headers, timeout=20.0, follow_redirects=True) as client:
-			r = client.get(url)
-			r.raise_for_status()
-			text = r.text[: max(0, max_chars)]
-			if text.strip():
-				return text, "direct"
+		return get_fetch_strategy().fetch(url, {"direct": direct, "jina": jina})
 	except Exception:
-		pass
+		return "", "error"
+
+
+async def _afetch_webpage_text_with_fallback(url: str, max_chars: int, raw_html: bool = False) -> tuple[str, str]:
+	"""
+	Async variant of _fetch_webpage_text_with_fallback(); shares in-flight fetches with the sync path.
+	"""
+	text, source = await _FETCHES.ado(
+		("text", url, max_chars, raw_html),
+		lambda: _afetch_webpage_text_uncollapsed(url, max_chars, raw_html),
+	)
+	annotate(fetch_source=source)
+	return text, source
+
+
+async def _afetch_webpage_text_uncollapsed(url: str, max_chars: int, raw_html: bool) -> tuple[str, str]:
+	async def direct(timeout: float) -> str:
+		with phase("fetch"):
+			body = await afetch_text(url, html_read_chars(max_chars, raw_html), headers=_default_headers(), timeout=timeout)
+		# Parsing a large page is CPU work; keep it off the event loop
+		with phase("preprocess"):
+			return await asyncio.to_thread(readable_text, body, max_chars, raw_html)
+
+	async def jina(timeout: float) -> str:
+		with phase("fetch"):
+			return await afetch_text(_jina_reader_url(url), max_chars, timeout=timeout)
 
-	# Fallback: Jina Reader
 	try:
-		jr_url = _jina_reader_url(url)
-		with httpx.Client(timeout=20.0, follow_redirects=True) as client:
-			r = client.get(jr_url)
-			r.raise_for_status()
-			text = r.text[: max(0, max_chars)]
-			return text, "jina"
+		return await get_fetch_strategy().afetch(url, {"direct": direct, "jina": jina})
 	except Exception:
 		return "", "error"
 
 
-def _fetch_bytes_and_mime_from_url(url: str) -> tuple[bytes, Optional[str]]:
-	headers = {
+# Content types accepted for binary sources (octet-stream covers servers that don't label files)
+_IMAGE_TYPES = ("image/", "application/octet-stream", "binary/octet-stream")
+_PDF_TYPES = ("application/pdf", "application/x-pdf", "application/octet-stream", "binary/octet-stream")
+
+
+def _fetch_download_from_url(url: str, accept: tuple) -> Download:
+	"""
+	Stream a binary URL into a Download (spooled to a temp file when large). Wrong content types and
+	bodies over the per-type byte cap are rejected before or during the download.
+	"""
+	return _FETCHES.do(("bytes", url, accept), lambda: _fetch_download_uncollapsed(url, accept))
+
+
+def _download_headers() -> dict:
+	return {
 		"User-Agent": (
 			"Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
 			"(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
 		)
 	}
-	with httpx.Client(headers=headers, timeout=30.0, follow_redirects=True) as client:
-		r = client.get(url)
-		r.raise_for_status()
-		content_type = r.headers.get("content-type")
-		return r.content, content_type
 
 
-def _load_bytes_and_mime_from_source(source: str) -> tuple[bytes, Optional[str]]:
-	"""If source is URL, fetch; otherwise treat as local path and read."""
+def _fetch_download_uncollapsed(url: str, accept: tuple) -> Download:
+	with phase("fetch"):
+		return fetch_download(url, headers=_download_headers(), timeout=30.0, accept=accept)
+
+
+async def _afetch_download_uncollapsed(url: str, accept: tuple) -> Download:
+	with phase("fetch"):
+		return await afetch_download(url, headers=_download_headers(), timeout=30.0, accept=accept)
+
+
+async def _afetch_download_from_url(url: str, accept: tuple) -> Download:
+	return await _FETCHES.ado(("bytes", url, accept), lambda: _afetch_download_uncollapsed(url, accept))
+
+
+def _load_download_from_source(source: str, accept: tuple) -> tuple[Download, Optional[str]]:
+	"""If source is URL, fetch; otherwise treat as local path (read lazily). Returns (download, mime)."""
 	if source.lower().startswith("http://") or source.lower().startswith("https://"):
-		return _fetch_bytes_and_mime_from_url(source)
+		download = _fetch_download_from_url(source, accept)
+		mime = (download.content_type or "").split(";")[0].strip() or None
+		return download, mime
 	# local file
-	with open(source, "rb") as f:
-		data = f.read()
 	mime, _ = mimetypes.guess_type(source)
-	return data, mime
+	return Download(mime, path=source), mime
+
+
+async def _aload_download_from_source(source: str, accept: tuple) -> tuple[Download, Optional[str]]:
+	"""Async variant of _load_download_from_source()."""
+	if source.lower().startswith("http://") or source.lower().startswith("https://"):
+		download = await _afetch_download_from_url(source, accept)
+		mime = (download.content_type or "").split(";")[0].strip() or None
+		return download, mime
+	mime, _ = mimetypes.guess_type(source)
+	return Download(mime, path=source), mime
+
+
+# Prompt builders shared by the sync and async tool implementations. Prompts put what stays the same
+# first (system prompt, then the document) and the instruction last: providers cache prompt prefixes, so a
+# page, text or PDF asked about again with another instruction is mostly served from the cache.
+def _user_text(text: str) -> dict:
+	return {"role": "user", "content": [{"type": "text", "text": text}]}
+
+
+def _user_document(document: str, instruction: str) -> dict:
+	content = [{"type": "text", "text": document.rstrip()}] if document.strip() else []
+	return {"role": "user", "content": [*content, {"type": "text", "text": f"Instruction:\n{instruction}"}]}
+
+
+def _plan_text_call(llm, system_prompt: str, instruction: str, text: str, header: str, label: str, focus: Optional[str] = None) -> tuple[Optional[list], Optional[dict]]:
+	"""
+	Return (messages, None) for a text that fits one call, or (None, map_reduce kwargs) when it must be chunked.
+	A single call sends header + text, then the instruction. With focus (the user's instruction), a long text
+	is first narrowed to its most relevant passages (see retrieval.focus_text).
+	"""
+	with phase("preprocess"):
+		if focus:
+			text = focus_text(text, focus, llm.model_name)
+		overhead = count_tokens(f"{header}\n\nInstruction:\n{instruction}", llm.model_name)
+		chunks = split_for_model(text, llm.model_name, overhead_tokens=overhead)
+	system = {"role": "system", "content": system_prompt}
+	if len(chunks) <= 1:
+		return [system, _user_document(f"{header}{text}", instruction)], None
+	return None, {
+		"chunks": chunks,
+		"map_messages": lambda chunk, i, n: [system, _user_text(map_prompt(instruction, chunk, i, n, label))],
+		"reduce_messages": lambda partials: [system, _user_text(reduce_prompt(instruction, partials))],
+		"overhead_tokens": count_tokens(instruction, llm.model_name),
+	}
+
+
+def _run_text_call(task: str, system_prompt: str, instruction: str, text: str, header: str, label: str = "Text", focus: Optional[str] = None) -> str:
+	llm = get_llm_for(task)
+	messages, chunked = _plan_text_call(llm, system_prompt, instruction, text, header, label, focus)
+	if chunked is not None:
+		return text_of(map_reduce(llm, **chunked))
+	return text_of(llm.invoke(messages))
+
+
+async def _arun_text_call(task: str, system_prompt: str, instruction: str, text: str, header: str, label: str = "Text", focus: Optional[str] = None) -> str:
+	llm = get_llm_for(task)
+	# Indexing and token counting over a long input are CPU work; keep them off the event loop
+	messages, chunked = await asyncio.to_thread(_plan_text_call, llm, system_prompt, instruction, text, header, label, focus)
+	if chunked is not None:
+		return text_of(await amap_reduce(llm, **chunked))
+	return text_of(await llm.ainvoke(messages))
+
+
+_WEBPAGE_SYSTEM = "You are an expert web assistant. Follow the user's instruction precisely."
+_TEXT_SYSTEM = "You are a helpful text assistant. Follow the user's instruction precisely."
+
+
+def _image_payload(download: Download, mime: Optional[str], model_name: Optional[str]) -> tuple[str, str]:
+	"""Return (base64, mime) for an image, sniffed and downscaled for the model (see images.prepare_image)."""
+	with phase("preprocess"):
+		image = prepare_image(download.read(), model_name, mime)
+		return image.base64(), image.mime
+
+
+def _image_messages(instruction: str, image_base64: str, mime: Optional[str]) -> list:
+	if not mime or not mime.startswith("image/"):
+		# Best-effort default
+		mime = "image/jpeg"
+	return [
+		{"role": "system", "content": "You are an expert vision assistant. Follow the user's instruction precisely."},
+		{
+			"role": "user",
+			"content": [
+				{"type": "image", "source_type": "base64", "data": image_base64, "mime_type": mime},
+				{"type": "text", "text": f"Instruction:\n{instruction}"},
+			],
+		},
+	]
+
+
+_PDF_SYSTEM = "You are an expert PDF assistant. Follow the user's instruction precisely."
+
+
+def _pdf_payload(download: Download, instruction: str, pages: Optional[str], model_name: Optional[str]) -> PreparedPdf:
+	"""Return what to send for a PDF: extracted text, plus only its scanned pages as a file (see pdfs.prepare_pdf)."""
+	with phase("preprocess"):
+		return prepare_pdf(download.read(), instruction, pages, model_name)
+
+
+def _pdf_file_block(pdf: PreparedPdf, mime: Optional[str], source: str) -> dict:
+	if not mime or "octet-stream" in mime or pdf.page_count:
+		mime = "application/pdf"
+	return {"type": "file", "source_type": "base64", "mime_type": mime, "data": pdf.file_base64(), "filename": os.path.basename(source) or "document.pdf"}
+
+
+def _with_block(messages: list, block: dict) -> list:
+	# Insert a content block into the last (user) message, ahead of its final text (which ends with the instruction)
+	*head, last = messages
+	return [*head, {**last, "content": [*last["content"][:-1], block, last["content"][-1]]}]
+
+
+def _plan_pdf_call(llm, instruction: str, pdf: PreparedPdf, mime: Optional[str], source: str) -> tuple[Optional[list], Optional[dict]]:
+	"""
+	Like _plan_text_call for a PDF's extracted text. Pages sent as a file are attached to the single call,
+	or to the final combine step when the text has to be chunked.
+	"""
+	note = f"{pdf.note()}\n\n" if pdf.note() else ""
+	header = note + ("PDF text:\n" if pdf.text else "")
+	messages, chunked = _plan_text_call(llm, _PDF_SYSTEM, instruction, pdf.text, header, "PDF text", instruction)
+	if pdf.file_data is None:
+		return messages, chunked
+	block = _pdf_file_block(pdf, mime, source)
+	if chunked is None:
+		return _with_block(messages, block), None
+	reduce_messages = chunked["reduce_messages"]
+	return None, {**chunked, "reduce_messages": lambda partials: _with_block(reduce_messages(partials), block)}
 
 
 @tool
-def read_webpage(url: str, instruction: str, max_chars: int = 12000) -> str:
+def read_webpage(url: str, instruction: str, max_chars: Optional[int] = None, raw_html: bool = False) -> str:
 	"""
 	Read a webpage and extract information per the provided instruction.
+	The page's main content is passed as markdown; set raw_html=True only when the markup itself is needed.
+	For narrow instructions on long pages only the most relevant passages are read; other long pages are
+	processed in parallel chunks and combined. max_chars optionally caps how much text is read.
 	"""
-	webpage_text, source = _fetch_webpage_text_with_fallback(url, max_chars)
+	webpage_text, source = _fetch_webpage_text_with_fallback(url, max_chars or MAX_INPUT_CHARS, raw_html)
 	if not webpage_text:
 		return f"Failed to fetch webpage. URL: {url}"
+	return _run_text_call(
+		"tool-read-webpage",
+		_WEBPAGE_SYSTEM,
+		f"{instruction}\n\n(Webpage URL: {url})",
+		webpage_text,
+		f"Source: {source}\n\nWebpage contents:\n",
+		"Webpage contents",
+		focus=instruction,
+	)
 
-	llm = get_llm_for("tool-read-webpage")
-	messages = [
-		{"role": "system", "content": "You are an expert web assistant. Follow the user's instruction precisely."},
-		{"role": "user", "content": [{"type": "text", "text": f"Instruction:\n{instruction}\n\nSource: {source}\nURL: {url}\n\nWebpage contents:\n{webpage_text}"}]},
-	]
-	result = llm.invoke(messages)
-	try:
-		return result.content  # AIMessage
-	except AttributeError:
-		return str(result)
+
+async def _aread_webpage(url: str, instruction: str, max_chars: Optional[int] = None, raw_html: bool = False) -> str:
+	webpage_text, source = await _afetch_webpage_text_with_fallback(url, max_chars or MAX_INPUT_CHARS, raw_html)
+	if not webpage_text:
+		return f"Failed to fetch webpage. URL: {url}"
+	return await _arun_text_call(
+		"tool-read-webpage",
+		_WEBPAGE_SYSTEM,
+		f"{instruction}\n\n(Webpage URL: {url})",
+		webpage_text,
+		f"Source: {source}\n\nWebpage contents:\n",
+		"Webpage contents",
+		focus=instruction,
+	)
 
 
 @tool
 def text_summary(text: str, instruction: str) -> str:
 	"""
 	Summarize or transform text according to the provided instruction.
+	For narrow instructions on long text only the most relevant passages are used; text too long for one model
+	call is split into token-budgeted chunks, processed in parallel and combined.
 	"""
-	llm = get_llm_for("tool-text-summary")
-	messages = [
-		{"role": "system", "content": "You are a helpful text assistant. Follow the user's instruction precisely."},
-		{"role": "user", "content": [{"type": "text", "text": f"Instruction:\n{instruction}\n\nText:\n{text}"}]},
-	]
-	result = llm.invoke(messages)
-	try:
-		return result.content
-	except AttributeError:
-		return str(result)
+	return _run_text_call("tool-text-summary", _TEXT_SYSTEM, instruction, text, "Text:\n", focus=instruction)
+
+
+async def _atext_summary(text: str, instruction: str) -> str:
+	return await _arun_text_call("tool-text-summary", _TEXT_SYSTEM, instruction, text, "Text:\n", focus=instruction)
+
 
 @tool
 def analyze_image(source: str, instruction: str) -> str:
 	"""
 	Analyze an image from a local path or URL (auto-converted to base64) following the given instruction.
 	"""
-	data, mime = _load_bytes_and_mime_from_source(source)
-	if not mime:
-		# Best-effort default
-		mime = "image/jpeg"
-	image_base64 = base64.b64encode(data).decode("ascii")
+	download, mime = _load_download_from_source(source, _IMAGE_TYPES)
 	llm = get_llm_for("tool-analyze-image")
-	messages = [
-		{"role": "system", "content": "You are an expert vision assistant. Follow the user's instruction precisely."},
-		{
-			"role": "user",
-			"content": [
-				{"type": "text", "text": f"Instruction:\n{instruction}"},
-				{"type": "image", "source_type": "base64", "data": image_base64, "mime_type": mime},
-			],
-		},
-	]
-	result = llm.invoke(messages)
-	try:
-		return result.content
-	except AttributeError:
-		return str(result)
+	return text_of(llm.invoke(_image_messages(instruction, *_image_payload(download, mime, llm.model_name))))
+
+
+async def _aanalyze_image(source: str, instruction: str) -> str:
+	download, mime = await _aload_download_from_source(source, _IMAGE_TYPES)
+	llm = get_llm_for("tool-analyze-image")
+	# Decoding and resizing are CPU work; keep them off the event loop
+	payload = await asyncio.to_thread(_image_payload, download, mime, llm.model_name)
+	return text_of(await llm.ainvoke(_image_messages(instruction, *payload)))
+
 
 @tool
-def analyze_pdf(source: str, instruction: str) -> str:
+def analyze_pdf(source: str, instruction: str, pages: Optional[str] = None) -> str:
 	"""
-	Analyze a PDF from a local path or URL (auto-converted to base64) following the given instruction.
+	Analyze a PDF from a local path or URL following the given instruction.
+	pages optionally limits it to page ranges such as "1-3, 7"; by default the whole document is read
+	(or, for very long documents, the pages relevant to the instruction).
 	"""
-	data, mime = _load_bytes_and_mime_from_source(source)
-	if not mime:
-		mime = "application/pdf"
-	pdf_base64 = base64.b64encode(data).decode("utf-8")
+	download, mime = _load_download_from_source(source, _PDF_TYPES)
 	llm = get_llm_for("tool-analyze-pdf")
-	messages = [
-		{"role": "system", "content": "You are an expert PDF assistant. Follow the user's instruction precisely."},
-		{
-			"role": "user",
-			"content": [
-				{"type": "text", "text": f"Instruction:\n{instruction}"},
-				{"type": "file", "source_type": "base64", "mime_type": mime, "data": pdf_base64, "filename": os.path.basename(source) or "document.pdf"},
-			],
-		},
-	]
-	result = llm.invoke(messages)
 	try:
-		return result.content
-	except AttributeError:
-		return str(result)
+		pdf = _pdf_payload(download, instruction, pages, llm.model_name)
+	except ValueError as e:
+		return f"Failed to read PDF pages. {e}"
+	messages, chunked = _plan_pdf_call(llm, instruction, pdf, mime, source)
+	if chunked is not None:
+		return text_of(map_reduce(llm, **chunked))
+	return text_of(llm.invoke(messages))
+
+
+async def _aanalyze_pdf(source: str, instruction: str, pages: Optional[str] = None) -> str:
+	download, mime = await _aload_download_from_source(source, _PDF_TYPES)
+	llm = get_llm_for("tool-analyze-pdf")
+	# Text extraction (in a process pool for long documents) and token counting are CPU work; keep them off the event loop
+	try:
+		pdf = await asyncio.to_thread(_pdf_payload, download, instruction, pages, llm.model_name)
+	except ValueError as e:
+		return f"Failed to read PDF pages. {e}"
+	messages, chunked = await asyncio.to_thread(_plan_pdf_call, llm, instruction, pdf, mime, source)
+	if chunked is not None:
+		return text_of(await amap_reduce(llm, **chunked))
+	return text_of(await llm.ainvoke(messages))
 
 
 @tool
@@ -210,8 +424,47 @@ def internet_search(query: str, max_results: int = 5) -> str:
 	Search the internet using Tavily and return top results with URLs and snippets.
 	Requires TAVILY_API_KEY in the environment.
 	"""
-	search = TavilySearch(k=max_results)
+	search = _search_client(max_results)
 	results = search.invoke(query)
 	return results
 
 
+@tool
+def recall_observation(ref: str, start: int = 0, max_chars: int = 8000) -> str:
+	"""
+	Read back the full text of an earlier tool result that was compacted to save context.
+	Pass the ref shown in the compacted result; use start to page through long results.
+	"""
+	text = REFERENCE_STORE.get(ref)
+	if text is None:
+		return f"No stored tool result for ref {ref} (it may have expired)."
+	end = start + max_chars
+	page = text[start:end]
+	if end < len(text):
+		page += f"\n[{len(text) - end} more characters; call recall_observation(ref=\"{ref}\", start={end}) to continue.]"
+	return page
+
+
+async def _ainternet_search(query: str, max_results: int = 5) -> str:
+	search = _search_client(max_results)
+	return await search.ainvoke(query)
+
+
+# Async implementations: ainvoke/astream on the agent (and tool.ainvoke) await these on the event loop
+# instead of running the sync functions in worker threads
+for _tool, _coroutine in (
+	(read_webpage, _aread_webpage),
+	(text_summary, _atext_summary),
+	(analyze_image, _aanalyze_image),
+	(analyze_pdf, _aanalyze_pdf),
+	(internet_search, _ainternet_search),
+):
+	_tool.coroutine = _coroutine
+
+# Every tool run is recorded with its phases, tokens and estimated cost (see agent.metrics)
+for _tool in (read_webpage, text_summary, analyze_image, analyze_pdf, internet_search, safe_calculate, recall_observation):
+	_task = f"tool-{_tool.name.replace('_', '-')}"
+	_instrument = instrumented("tool", _tool.name, _task if _task in AGENT_CONFIG else None)
+	_tool.func = _instrument(_tool.func)
+	if _tool.coroutine is not None:
+		_tool.coroutine = _instrument(_tool.coroutine)
@@ -0,0 +1,213 @@
+# benchmarks/agent_load_test.py
+"""
+Load-test the async agent runtime: many concurrent sessions on one event loop through SessionManager.
+
+Models are stubbed (no API keys or network needed): the agent model asks for --tools-per-turn read_webpage
+calls against a page served locally, then answers; every model call sleeps --model-latency seconds. Tools,
+fetches, the model pool and the HTTP pool are the real ones. Reports sessions per second and p50/p99 latency
+per turn and per session.
+
+A baseline then replays the same turns for fewer sessions (8 per run slot) with at most --baseline-runs turns
+in flight. Runs don't share their tool-call budget, so sessions per second should grow with concurrency until the
+event loop runs out of CPU; if the full run is less than --min-scaling times the baseline's throughput, that is
+reported and the exit status is 1.
+
+    python benchmarks/agent_load_test.py [--sessions 200] [--turns 2] [--tools-per-turn 3] [--stream]
+        [--baseline-runs 2] [--min-scaling 6] [--json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import agent.factory
+from agent import SessionManager, build_agent, get_model_pool_stats
+from agent.http_client import aclose_async_client
+from agent.settings import AGENT_CONFIG
+
+_PAGE = (
+	"<html><head><title>Load test page</title><script>var x = 1;</script></head><body>"
+	"<nav><a href='/'>Home</a></nav><article><h1>Quarterly update</h1>"
+	+ "".join(f"<p>Paragraph {i}: revenue grew while costs held steady across regions.</p>" for i in range(40))
+	+ "</article><footer>Footer</footer></body></html>"
+).encode("utf-8")
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+	# Headers and body are separate writes; without this, delayed ACKs add ~40ms per request
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		self.send_response(200)
+		self.send_header("content-type", "text/html; charset=utf-8")
+		self.send_header("content-length", str(len(_PAGE)))
+		self.end_headers()
+		self.wfile.write(_PAGE)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class _PageServer(ThreadingHTTPServer):
+	# The default listen backlog of 5 overflows under hundreds of concurrent fetches, and the SYN retries that
+	# follow (1s, then 3s) would be measured as agent latency
+	request_queue_size = 256
+	daemon_threads = True
+
+
+class StubChatModel(BaseChatModel):
+	"""
+	Offline chat model. With tools bound (the agent model) it requests tools_per_turn read_webpage calls
+	for a new user turn and answers once the tool results are in; without tools it returns a short summary.
+	"""
+
+	latency: float = 0.05
+	tools_per_turn: int = 3
+	page_url: str = ""
+
+	@property
+	def _llm_type(self) -> str:
+		return "stub"
+
+	def bind_tools(self, tools, **kwargs):
+		from langchain_core.utils.function_calling import convert_to_openai_tool
+
+		return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+	def _reply(self, messages, kwargs) -> ChatResult:
+		last = messages[-1]
+		if kwargs.get("tools") and isinstance(last, HumanMessage):
+			calls = [
+				{
+					"name": "read_webpage",
+					"args": {"url": f"{self.page_url}?page={i}", "instruction": f"Summarize for: {last.content}"},
+					"id": f"call_{i}",
+				}
+				for i in range(self.tools_per_turn)
+			]
+			message = AIMessage(content="", tool_calls=calls)
+		elif kwargs.get("tools"):
+			message = AIMessage(content="Revenue grew while costs held steady.")
+		else:
+			message = AIMessage(content="Summary: revenue grew, costs steady.")
+		return ChatResult(generations=[ChatGeneration(message=message)])
+
+	def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		time.sleep(self.latency)
+		return self._reply(messages, kwargs)
+
+	async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		await asyncio.sleep(self.latency)
+		return self._reply(messages, kwargs)
+
+
+def _percentile(values: List[float], q: float) -> float:
+	ordered = sorted(values)
+	if not ordered:
+		return 0.0
+	return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def _session(manager: SessionManager, session_id: str, turns: int, stream: bool, turn_latencies: List[float]) -> float:
+	started = time.perf_counter()
+	for turn in range(turns):
+		turn_started = time.perf_counter()
+		text = f"{session_id} turn {turn}: what changed this quarter?"
+		if stream:
+			async for _ in manager.astream(session_id, text):
+				pass
+		else:
+			await manager.ainvoke(session_id, text)
+		turn_latencies.append(time.perf_counter() - turn_started)
+	return time.perf_counter() - started
+
+
+async def _load(args: argparse.Namespace, sessions: int, max_concurrent_runs: Optional[int], label: str) -> dict:
+	manager = SessionManager(build_agent(verbose=False), max_concurrent_runs=max_concurrent_runs)
+	turn_latencies: List[float] = []
+	started = time.perf_counter()
+	session_latencies = await asyncio.gather(
+		*(_session(manager, f"{label}-{i}", args.turns, args.stream, turn_latencies) for i in range(sessions))
+	)
+	elapsed = time.perf_counter() - started
+	return {
+		"elapsed_s": round(elapsed, 3),
+		"sessions_per_s": round(sessions / elapsed, 2),
+		"turns_per_s": round(len(turn_latencies) / elapsed, 2),
+		"turn_p50_ms": round(statistics.median(turn_latencies) * 1000, 1),
+		"turn_p99_ms": round(_percentile(turn_latencies, 0.99) * 1000, 1),
+		"session_p50_ms": round(statistics.median(session_latencies) * 1000, 1),
+		"session_p99_ms": round(_percentile(session_latencies, 0.99) * 1000, 1),
+		"manager": manager.stats(),
+	}
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--sessions", type=int, default=200)
+	parser.add_argument("--turns", type=int, default=2)
+	parser.add_argument("--tools-per-turn", type=int, default=3)
+	parser.add_argument("--model-latency", type=float, default=0.05)
+	parser.add_argument("--max-concurrent-runs", type=int, default=None)
+	parser.add_argument("--baseline-runs", type=int, default=2, help="max concurrent runs of the baseline replay")
+	parser.add_argument("--min-scaling", type=float, default=6.0, help="fail when the full run is less than this many times the baseline's throughput")
+	parser.add_argument("--stream", action="store_true", help="drive turns through astream instead of ainvoke")
+	parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = parser.parse_args()
+
+	server = _PageServer(("127.0.0.1", 0), _PageHandler)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	stub = StubChatModel(
+		latency=args.model_latency,
+		tools_per_turn=args.tools_per_turn,
+		page_url=f"http://127.0.0.1:{server.server_address[1]}/page",
+	)
+	agent.factory.init_chat_model = lambda **kwargs: stub
+	# Measure the runtime, not client-side provider quotas
+	AGENT_CONFIG["rate_limits"] = {}
+
+	try:
+		full = await _load(args, args.sessions, args.max_concurrent_runs, "load")
+		baseline = await _load(args, min(args.sessions, 8 * args.baseline_runs), args.baseline_runs, "baseline")
+	finally:
+		await aclose_async_client()
+		server.shutdown()
+	scaling = round(full["sessions_per_s"] / baseline["sessions_per_s"], 1) if baseline["sessions_per_s"] else None
+
+	result = {
+		"sessions": args.sessions,
+		"turns_per_session": args.turns,
+		"tools_per_turn": args.tools_per_turn,
+		"model_latency_s": args.model_latency,
+		**full,
+		"baseline_runs": args.baseline_runs,
+		"baseline_sessions_per_s": baseline["sessions_per_s"],
+		"scaling": scaling,
+		"scales": scaling is not None and scaling >= args.min_scaling,
+		"model_pool": get_model_pool_stats(),
+	}
+	if args.json:
+		print(json.dumps(result, indent=2))
+	else:
+		for key, value in result.items():
+			print(f"{key:<24}{value}")
+		if not result["scales"]:
+			print(f"NOT SCALING: {scaling}x the throughput of {args.baseline_runs} concurrent runs (want {args.min_scaling}x)")
+	sys.exit(0 if result["scales"] else 1)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,113 @@
+# benchmarks/import_time.py
+"""
+Measure the cold import time of the kit's entry points and fail when one goes over its budget.
+
+Each entry point is imported in a fresh interpreter (`python -X importtime`) --runs times; the median cumulative
+time is compared with its budget and the heaviest modules it pulls in are listed. Budgets default to roughly
+twice the time measured when heavy dependencies were made lazy; --budget STATEMENT=MS overrides one. Exits 1
+when any entry point is over budget, so the script can gate CI.
+
+	python benchmarks/import_time.py [--runs 5] [--top 8] [--budget "import agent.tools=1500"] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, Iterable, List, Tuple
+
+_kit = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Statement -> budget in milliseconds
+DEFAULT_BUDGETS = {
+	"import agent": 50,
+	"import agent.settings": 15,
+	"import agent.factory": 150,
+	"import agent.tools": 1500,
+	"from agent import build_agent": 3000,
+}
+
+
+def _importtime(statement: str, startup: Iterable[str] = ()) -> Tuple[float, Dict[str, float]]:
+	"""
+	Run one statement in a fresh interpreter: (ms spent importing, {module: cumulative ms}), leaving out the
+	modules in `startup` (imported by the interpreter itself, e.g. site and .pth hooks)
+	"""
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_kit, os.environ.get("PYTHONPATH")])))
+	proc = subprocess.run(
+		[sys.executable, "-X", "importtime", "-c", statement],
+		cwd=_kit, env=env, capture_output=True, text=True,
+	)
+	if proc.returncode:
+		raise RuntimeError(f"`{statement}` failed:\n{proc.stderr.strip()}")
+	total, modules = 0.0, {}
+	for line in proc.stderr.splitlines():
+		# "import time: self [us] | cumulative | imported package", nested imports indented under their parent
+		if not line.startswith("import time:") or "[us]" in line:
+			continue
+		_, cumulative, name = line[len("import time:"):].split("|", 2)
+		ms = int(cumulative) / 1000
+		if name.strip() in startup:
+			continue
+		modules[name.strip()] = ms
+		if not name.startswith("  "):
+			total += ms
+	return total, modules
+
+
+def measure(statement: str, runs: int) -> Tuple[float, List[Tuple[str, float]]]:
+	"""
+	Median import time (ms) of a statement over `runs` fresh interpreters and its heaviest modules
+	"""
+	startup = set(_importtime("pass")[1])
+	totals, per_module = [], {}
+	for _ in range(runs):
+		total, modules = _importtime(statement, startup)
+		totals.append(total)
+		for name, ms in modules.items():
+			per_module.setdefault(name, []).append(ms)
+	heaviest = sorted(((name, statistics.median(ms)) for name, ms in per_module.items()), key=lambda x: -x[1])
+	return statistics.median(totals), heaviest
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--runs", type=int, default=5)
+	parser.add_argument("--top", type=int, default=8, help="heaviest modules listed per entry point")
+	parser.add_argument("--budget", action="append", default=[], metavar="STATEMENT=MS",
+						help="override (or add) an entry point's budget")
+	parser.add_argument("--json", action="store_true", help="print the results as JSON")
+	args = parser.parse_args()
+
+	budgets = dict(DEFAULT_BUDGETS)
+	for override in args.budget:
+		statement, _, ms = override.rpartition("=")
+		if not statement:
+			parser.error(f"--budget expects STATEMENT=MS, got {override!r}")
+		budgets[statement.strip()] = float(ms)
+
+	results = []
+	for statement, budget in budgets.items():
+		median, heaviest = measure(statement, args.runs)
+		results.append({
+			"statement": statement,
+			"median_ms": round(median, 1),
+			"budget_ms": budget,
+			"over_budget": median > budget,
+			"heaviest": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in heaviest[:args.top]],
+		})
+
+	if args.json:
+		print(json.dumps(results, indent=2))
+	else:
+		for result in results:
+			status = "OVER BUDGET" if result["over_budget"] else "ok"
+			print(f"{result['statement']:<32} {result['median_ms']:>8.1f} ms  (budget {result['budget_ms']:g} ms)  {status}")
+			for module in result["heaviest"]:
+				print(f"    {module['cumulative_ms']:>8.1f} ms  {module['module']}")
+	sys.exit(1 if any(result["over_budget"] for result in results) else 0)
+
+
+if __name__ == "__main__":
+	main()
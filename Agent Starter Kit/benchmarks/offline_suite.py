@@ -0,0 +1,755 @@
+# benchmarks/offline_suite.py
+"""
+Offline benchmark suite for every tool in agent/tools.py (sync and async) and full build_agent runs.
+
+No API keys or network needed. Chat models are replaced by a local stub. The stub waits --latency seconds before
+its first token, then produces --output-tokens tokens at --tokens-per-second. A --rate-limit-probability share
+of its calls fail with a 429 (Retry-After: --retry-after), which goes through the kit's retries and rate
+limiter. Prompt caching is simulated the way OpenAI does it (prefixes from 1024 tokens, in 128-token blocks),
+and the cached part of each prompt is reported in its usage. The agent model asks for one call of each tool on a
+new question and answers once the results are in. A local HTTP server stands in for the outside world: generated
+webpages, the image and the PDF from agent/example_assets, a Tavily-style search endpoint, a Jina Reader
+endpoint and a page that answers 403 (so read_webpage falls back to Jina). Everything else is the kit's real
+code: fetching, extraction, chunking, retrieval, image and PDF preparation, the executor, the model pool,
+routing and metrics.
+
+Each scenario runs --warmup calls, then --iterations timed calls, --concurrency at a time. It reports
+throughput, p50/p95/p99 latency (plus time to first event for agent streaming), peak RSS during the run
+and the calls' phase breakdown from agent.metrics. A separate pass of --alloc-iterations calls runs under
+tracemalloc and reports peak and retained Python allocations (it is kept out of the timings because
+tracing slows everything down).
+
+Write results with --output and compare a later run against them with --baseline. Scenarios whose p50/p95
+latency, throughput, peak RSS or allocation peak got worse by more than --threshold are listed, and the
+exit status is 1.
+
+    python benchmarks/offline_suite.py [--scenario read_webpage*] [--iterations 20] [--concurrency 4]
+        [--latency 0.1] [--tokens-per-second 500] [--rate-limit-probability 0.1] [--output results.json]
+        [--baseline previous.json] [--json] [--list]
+"""
+import argparse
+import asyncio
+import fnmatch
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import agent.factory
+import agent.tools
+from agent import astream_agent, build_agent
+from agent.http_client import aclose_async_client, afetch_text, fetch_text
+from agent.metrics import HistogramSink, add_metrics_sink
+from agent.scratchpad import REFERENCE_STORE
+from agent.settings import AGENT_CONFIG
+
+_KIT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ASSETS = os.path.join(_KIT_DIR, "agent", "example_assets")
+
+# Seeded in main() so 429 injection is repeatable
+_RANDOM = random.Random(0)
+
+_FILLER = "revenue grew while costs held steady across regions and teams".split()
+
+
+# Stub chat model
+class _PrefixCache:
+	"""
+	Simulated provider prompt cache: like OpenAI's, prompts of at least min_tokens are cached in 128-token
+	blocks, and a call reads back the longest prefix an earlier call (to the same model) already sent.
+	Prefixes are kept as chained sha1 digests in a bounded LRU.
+	"""
+
+	def __init__(self, min_tokens: int = 1024, block_tokens: int = 128, max_entries: int = 100_000):
+		self.min_chars = min_tokens * 4
+		self.block_chars = block_tokens * 4
+		self.max_entries = max_entries
+		self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def read(self, model: str, prompt: str) -> int:
+		"""Tokens of prompt served from the cache; all of its blocks are cached for later calls."""
+		digest = hashlib.sha1(model.encode("utf-8"))
+		boundaries, start = [], 0
+		for end in range(self.min_chars, len(prompt) + 1, self.block_chars):
+			digest.update(prompt[start:end].encode("utf-8"))
+			boundaries.append((end, digest.digest()))
+			start = end
+		cached = 0
+		with self._lock:
+			for end, key in boundaries:
+				if key not in self._seen:
+					break
+				cached = end
+			for _, key in boundaries:
+				self._seen[key] = None
+				self._seen.move_to_end(key)
+			while len(self._seen) > self.max_entries:
+				self._seen.popitem(last=False)
+		return cached // 4
+
+	def clear(self) -> None:
+		with self._lock:
+			self._seen.clear()
+
+
+PREFIX_CACHE = _PrefixCache()
+
+
+def _serialize(messages: list) -> str:
+	# The prompt as the provider would see it, in order; non-text blocks (images, files) are represented by a digest
+	parts = []
+	for message in messages:
+		parts.append(f"<{message.type}>")
+		content = message.content
+		blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+		for block in blocks:
+			if isinstance(block, dict) and block.get("type") == "text":
+				parts.append(block.get("text") or "")
+			else:
+				parts.append(hashlib.sha1(json.dumps(block, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+		if getattr(message, "tool_calls", None):
+			parts.append(json.dumps(message.tool_calls, sort_keys=True, default=str))
+	return "\n".join(parts)
+
+
+def _prompt_chars(messages: list) -> int:
+	chars = 0
+	for message in messages:
+		content = message.content
+		if isinstance(content, str):
+			chars += len(content)
+			continue
+		for block in content or []:
+			if isinstance(block, dict) and block.get("type") == "text":
+				chars += len(block.get("text") or "")
+	return chars
+
+
+def _fill(schema: dict, words: int) -> dict:
+	# Schema-shaped arguments: strings share the word budget, arrays get a few short items
+	properties = schema.get("properties") or {}
+	strings = [name for name, spec in properties.items() if spec.get("type", "string") == "string"]
+	per_string = max(1, words // max(1, len(strings)))
+	out: Dict[str, Any] = {}
+	for name, spec in properties.items():
+		kind = spec.get("type", "string")
+		if kind == "string":
+			out[name] = " ".join(_FILLER[i % len(_FILLER)] for i in range(per_string))
+		elif kind == "array":
+			out[name] = _FILLER[:3]
+		elif kind in ("integer", "number"):
+			out[name] = 0
+		elif kind == "boolean":
+			out[name] = False
+		else:
+			out[name] = None
+	return out
+
+
+def _rate_limit_error(retry_after: float) -> openai.RateLimitError:
+	request = httpx.Request("POST", "http://stub.invalid/v1/chat/completions")
+	response = httpx.Response(429, headers={"retry-after": str(retry_after)}, request=request)
+	return openai.RateLimitError("Rate limit reached (stub)", response=response, body=None)
+
+
+class StubChatModel(BaseChatModel):
+	"""
+	Offline chat model. Replies after latency seconds plus output_tokens at tokens_per_second, and streams
+	at the same rate. With tools bound and no tool_choice (the agent model) it requests the plan's tool calls
+	for a new user turn and answers once the tool results are in; structured-output calls (tool_choice set)
+	get the schema's fields filled in; other calls get text. rate_limit_probability of calls raise
+	openai.RateLimitError (HTTP 429).
+	"""
+
+	model_name: str = "stub"
+	latency: float = 0.1
+	tokens_per_second: float = 500.0
+	output_tokens: int = 60
+	rate_limit_probability: float = 0.0
+	retry_after: float = 0.05
+	plan: List[dict] = []
+
+	@property
+	def _llm_type(self) -> str:
+		return "stub"
+
+	def bind_tools(self, tools, **kwargs):
+		from langchain_core.utils.function_calling import convert_to_openai_tool
+
+		return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+	def _check_rate_limit(self) -> None:
+		if self.rate_limit_probability and _RANDOM.random() < self.rate_limit_probability:
+			raise _rate_limit_error(self.retry_after)
+
+	def _usage(self, messages: list) -> dict:
+		prompt = _prompt_chars(messages) // 4
+		cached = min(prompt, PREFIX_CACHE.read(self.model_name, _serialize(messages)))
+		return {
+			"input_tokens": prompt,
+			"output_tokens": self.output_tokens,
+			"total_tokens": prompt + self.output_tokens,
+			"input_token_details": {"cache_read": cached},
+		}
+
+	def _reply(self, messages: list, kwargs: dict) -> AIMessage:
+		tools = kwargs.get("tools") or []
+		if tools and not kwargs.get("tool_choice"):
+			if isinstance(messages[-1], HumanMessage):
+				calls = [{"name": step["name"], "args": step["args"], "id": f"call_{i}"} for i, step in enumerate(self.plan)]
+				return AIMessage(content="", tool_calls=calls, usage_metadata=self._usage(messages))
+		elif tools:
+			function = tools[0]["function"]
+			args = _fill(function.get("parameters") or {}, self.output_tokens)
+			return AIMessage(content="", tool_calls=[{"name": function["name"], "args": args, "id": "call_0"}], usage_metadata=self._usage(messages))
+		text = " ".join(_FILLER[i % len(_FILLER)] for i in range(self.output_tokens))
+		return AIMessage(content=text, usage_metadata=self._usage(messages))
+
+	def _pieces(self, message: AIMessage) -> List[AIMessageChunk]:
+		# About one token per chunk: words of text, or 4-character slices of tool-call JSON
+		if message.tool_calls:
+			chunks = []
+			for index, call in enumerate(message.tool_calls):
+				args = json.dumps(call["args"])
+				chunks.append(AIMessageChunk(content="", tool_call_chunks=[{"name": call["name"], "args": "", "id": call["id"], "index": index}]))
+				chunks += [AIMessageChunk(content="", tool_call_chunks=[{"args": args[i:i + 4], "index": index}]) for i in range(0, len(args), 4)]
+		else:
+			chunks = [AIMessageChunk(content=word + " ") for word in message.content.split(" ")]
+		chunks.append(AIMessageChunk(content="", usage_metadata=message.usage_metadata))
+		return chunks
+
+	def _duration(self) -> float:
+		return self.latency + self.output_tokens / self.tokens_per_second
+
+	def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		self._check_rate_limit()
+		time.sleep(self._duration())
+		return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+	async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		self._check_rate_limit()
+		await asyncio.sleep(self._duration())
+		return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+	def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+		self._check_rate_limit()
+		time.sleep(self.latency)
+		pieces = self._pieces(self._reply(messages, kwargs))
+		for piece in pieces:
+			time.sleep(self.output_tokens / self.tokens_per_second / len(pieces))
+			yield ChatGenerationChunk(message=piece)
+
+	async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+		self._check_rate_limit()
+		await asyncio.sleep(self.latency)
+		pieces = self._pieces(self._reply(messages, kwargs))
+		for piece in pieces:
+			await asyncio.sleep(self.output_tokens / self.tokens_per_second / len(pieces))
+			yield ChatGenerationChunk(message=piece)
+
+
+# Local fixtures
+def _page(paragraphs: int) -> bytes:
+	return (
+		"<html><head><title>Quarterly update</title><script>var x = 1;</script></head><body>"
+		"<nav><a href='/'>Home</a></nav><article><h1>Quarterly update</h1>"
+		+ "".join(f"<p>Paragraph {i}: {' '.join(_FILLER)} in region {i % 7}.</p>" for i in range(paragraphs))
+		+ "<p>Final score: the Rockets beat the Hawks 112-104 after overtime.</p>"
+		+ "</article><footer>Footer</footer></body></html>"
+	).encode("utf-8")
+
+
+def _read(path: str) -> bytes:
+	with open(path, "rb") as f:
+		return f.read()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+	"""
+	/page (short article), /page/long (past the retrieval threshold), /blocked (403), /jina/<url> (Jina
+	Reader: markdown), /search?query= (Tavily-style JSON) and /assets/<file> (example_assets).
+	"""
+
+	protocol_version = "HTTP/1.1"
+	# Headers and body are separate writes; without this, delayed ACKs add ~40ms per request
+	disable_nagle_algorithm = True
+	latency = 0.0
+	pages = {"/page": _page(40), "/page/long": _page(2000)}
+
+	def _send(self, status: int, content_type: str, body: bytes) -> None:
+		self.send_response(status)
+		self.send_header("content-type", content_type)
+		self.send_header("content-length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		if self.latency:
+			time.sleep(self.latency)
+		url = urlsplit(self.path)
+		if url.path in self.pages:
+			self._send(200, "text/html; charset=utf-8", self.pages[url.path])
+		elif url.path.startswith("/blocked"):
+			self._send(403, "text/plain", b"Forbidden")
+		elif url.path.startswith("/jina/"):
+			text = "Title: Quarterly update\n\nMarkdown Content:\n" + "\n\n".join(f"Paragraph {i}: {' '.join(_FILLER)}." for i in range(40))
+			self._send(200, "text/plain; charset=utf-8", text.encode("utf-8"))
+		elif url.path == "/search":
+			query = parse_qs(url.query).get("query", [""])[0]
+			results = [
+				{"title": f"Result {i} for {query}", "url": f"http://example.com/{i}", "content": " ".join(_FILLER), "score": 1 - i / 10}
+				for i in range(5)
+			]
+			self._send(200, "application/json", json.dumps({"query": query, "results": results}).encode("utf-8"))
+		elif url.path.startswith("/assets/") and os.path.isfile(os.path.join(_ASSETS, os.path.basename(url.path))):
+			name = os.path.basename(url.path)
+			content_type = "application/pdf" if name.endswith(".pdf") else "image/jpeg"
+			self._send(200, content_type, _read(os.path.join(_ASSETS, name)))
+		else:
+			self._send(404, "text/plain", b"Not found")
+
+	def log_message(self, format, *args):
+		pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+	# The default listen backlog of 5 overflows when concurrent scenarios open many connections at once, and
+	# the SYN retries that follow (1s, then 3s) would be measured as latency
+	request_queue_size = 256
+
+	def handle_error(self, request, client_address):
+		# Clients that stop reading early (streamed fetches) reset their connections; that is expected here
+		pass
+
+
+def _serve(latency: float) -> ThreadingHTTPServer:
+	server = _QuietServer(("127.0.0.1", 0), type("_Handler", (_FixtureHandler,), {"latency": latency}))
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+
+class _StubSearch:
+	"""Stands in for TavilySearch: queries the fixture server's /search endpoint."""
+
+	def __init__(self, base_url: str, k: int = 5):
+		self.base_url = base_url
+		self.k = k
+
+	def _url(self, query: str) -> str:
+		return f"{self.base_url}/search?query={query}"
+
+	def invoke(self, query: str) -> dict:
+		data = json.loads(fetch_text(self._url(query), 1_000_000, use_cache=False))
+		return {**data, "results": data["results"][: self.k]}
+
+	async def ainvoke(self, query: str) -> dict:
+		data = json.loads(await afetch_text(self._url(query), 1_000_000, use_cache=False))
+		return {**data, "results": data["results"][: self.k]}
+
+
+# Scenarios: each call gets a distinct index so inputs (and URLs) differ and nothing is collapsed or cached
+async def _drain(stream) -> float:
+	started = time.perf_counter()
+	first = None
+	async for _ in stream:
+		if first is None:
+			first = time.perf_counter() - started
+	return first
+
+
+async def _awaited(coro) -> None:
+	await coro
+
+
+async def _in_thread(fn: Callable, *args: Any) -> None:
+	# Sync entry points run in worker threads, as a sync caller would run them concurrently
+	await asyncio.to_thread(fn, *args)
+
+
+def _agent_plan(base_url: str) -> List[dict]:
+	return [
+		{"name": "read_webpage", "args": {"url": f"{base_url}/page", "instruction": "Summarize the update."}},
+		{"name": "analyze_pdf", "args": {"source": f"{base_url}/assets/declaration-of-independence.pdf", "instruction": "List the grievances."}},
+		{"name": "analyze_image", "args": {"source": f"{base_url}/assets/happy-cat.jpg", "instruction": "Describe the image."}},
+		{"name": "internet_search", "args": {"query": "quarterly update", "max_results": 3}},
+		{"name": "safe_calculate", "args": {"expression": "(112 - 104) * 4"}},
+	]
+
+
+def _scenarios(base_url: str) -> Dict[str, Callable[[int], Awaitable[Optional[float]]]]:
+	tools = agent.tools
+	long_text = _page(600).decode("utf-8")
+	ref = REFERENCE_STORE.put(long_text)
+	image_url = f"{base_url}/assets/happy-cat.jpg"
+	pdf_url = f"{base_url}/assets/declaration-of-independence.pdf"
+	executor = build_agent(verbose=False)
+
+	inputs = {
+		"read_webpage": lambda i: {"url": f"{base_url}/page?i={i}", "instruction": "Summarize the update."},
+		"read_webpage[long]": lambda i: {"url": f"{base_url}/page/long?i={i}", "instruction": "Extract the final score and the teams."},
+		# Another host name for the same server, so the fetch strategy learns it separately from /page
+		"read_webpage[jina]": lambda i: {"url": f"{base_url.replace('127.0.0.1', 'localhost')}/blocked?i={i}", "instruction": "Summarize the update."},
+		"text_summary": lambda i: {"text": f"{long_text}\n\n(sample {i})", "instruction": "Summarize in two bullet points."},
+		"analyze_image": lambda i: {"source": f"{image_url}?i={i}", "instruction": "Describe the image."},
+		"analyze_pdf": lambda i: {"source": f"{pdf_url}?i={i}", "instruction": "List the grievances."},
+		"internet_search": lambda i: {"query": f"quarterly update {i}", "max_results": 5},
+		"safe_calculate": lambda i: {"expression": f"({i} + 3) * 4 / 2"},
+		"recall_observation": lambda i: {"ref": ref, "start": i % 100, "max_chars": 8000},
+	}
+
+	def tool_call(name: str, args: Callable, sync: bool) -> Callable:
+		tool = getattr(tools, name.split("[")[0])
+		if sync:
+			return lambda i: _in_thread(tool.invoke, args(i))
+		return lambda i: _awaited(tool.ainvoke(args(i)))
+
+	def question(i: int) -> dict:
+		return {"input": f"What changed this quarter? ({i})"}
+
+	scenarios = {}
+	for name, args in inputs.items():
+		scenarios[name] = tool_call(name, args, sync=False)
+		scenarios[f"{name}[sync]"] = tool_call(name, args, sync=True)
+	scenarios["agent_invoke"] = lambda i: _in_thread(executor.invoke, question(i))
+	scenarios["agent_ainvoke"] = lambda i: _awaited(executor.ainvoke(question(i)))
+	scenarios["agent_astream"] = lambda i: _drain(astream_agent(executor, question(i)))
+	return scenarios
+
+
+# Measurement
+def _rss_bytes() -> Optional[int]:
+	# Current resident set size (Linux); None where /proc is unavailable
+	try:
+		with open("/proc/self/statm") as f:
+			return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+	except (OSError, ValueError, IndexError, AttributeError):
+		return None
+
+
+def _max_rss_bytes() -> Optional[int]:
+	# Process-lifetime peak, the fallback where current RSS can't be sampled
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _RssSampler:
+	"""Samples RSS every interval seconds in a background thread and keeps the peak."""
+
+	def __init__(self, interval: float = 0.01):
+		self.interval = interval
+		self.start_bytes = _rss_bytes()
+		self.peak_bytes = self.start_bytes or 0
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, daemon=True)
+
+	def _run(self) -> None:
+		while not self._stop.wait(self.interval):
+			self.peak_bytes = max(self.peak_bytes, _rss_bytes() or 0)
+
+	def __enter__(self) -> "_RssSampler":
+		if self.start_bytes is not None:
+			self._thread.start()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		if self.start_bytes is None:
+			self.peak_bytes = _max_rss_bytes() or 0
+			return
+		self._stop.set()
+		self._thread.join()
+		self.peak_bytes = max(self.peak_bytes, _rss_bytes() or 0)
+
+
+def _percentile(values: List[float], q: float) -> float:
+	ordered = sorted(values)
+	if not ordered:
+		return 0.0
+	return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _distribution_ms(values: List[float]) -> Optional[dict]:
+	if not values:
+		return None
+	return {
+		"p50": round(_percentile(values, 0.5) * 1000, 2),
+		"p95": round(_percentile(values, 0.95) * 1000, 2),
+		"p99": round(_percentile(values, 0.99) * 1000, 2),
+		"mean": round(sum(values) / len(values) * 1000, 2),
+		"max": round(max(values) * 1000, 2),
+	}
+
+
+async def _run_calls(call: Callable, start: int, count: int, concurrency: int) -> tuple[List[float], List[float], List[str]]:
+	semaphore = asyncio.Semaphore(concurrency)
+	latencies: List[float] = []
+	ttfts: List[float] = []
+	errors: List[str] = []
+
+	async def one(i: int) -> None:
+		async with semaphore:
+			started = time.perf_counter()
+			try:
+				ttft = await call(i)
+			except Exception as e:
+				# First line only: httpx errors append a documentation link
+				errors.append(f"{type(e).__name__}: {(str(e).splitlines() or [''])[0]}")
+				return
+			latencies.append(time.perf_counter() - started)
+			if ttft is not None:
+				ttfts.append(ttft)
+
+	await asyncio.gather(*(one(i) for i in range(start, start + count)))
+	return latencies, ttfts, errors
+
+
+def _breakdown(summary: List[dict]) -> List[dict]:
+	# Per recorded call kind/name: counts and the p50 of each phase (ms)
+	rows = []
+	for row in summary:
+		phases = {name: round(value["p50"] * 1000, 2) for name, value in row.items() if isinstance(value, dict)}
+		rows.append({
+			"kind": row["kind"],
+			"name": row["name"],
+			"calls": row["calls"],
+			"errors": row["errors"],
+			"retries": row["retries"],
+			"prompt_tokens": row["prompt_tokens"],
+			"completion_tokens": row["completion_tokens"],
+			"cached_tokens": row["cached_tokens"],
+			"cache_hit_rate": row.get("cache_hit_rate", 0.0),
+			"phase_p50_ms": phases,
+		})
+	return rows
+
+
+async def _bench(name: str, call: Callable, args: argparse.Namespace, sink: HistogramSink, counter: List[int]) -> dict:
+	def indices(count: int) -> int:
+		start = counter[0]
+		counter[0] += count
+		return start
+
+	if args.warmup:
+		await _run_calls(call, indices(args.warmup), args.warmup, args.concurrency)
+	sink.reset()
+	gc.collect()
+	with _RssSampler() as rss:
+		started = time.perf_counter()
+		latencies, ttfts, errors = await _run_calls(call, indices(args.iterations), args.iterations, args.concurrency)
+		elapsed = time.perf_counter() - started
+	summary = sink.summary()
+
+	row = {
+		"scenario": name,
+		"calls": args.iterations,
+		"errors": len(errors),
+		"first_error": errors[0] if errors else None,
+		"elapsed_s": round(elapsed, 3),
+		"throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+		"latency_ms": _distribution_ms(latencies),
+		"ttft_ms": _distribution_ms(ttfts),
+		"rss_start_mib": round((rss.start_bytes or 0) / 2 ** 20, 1),
+		"rss_peak_mib": round(rss.peak_bytes / 2 ** 20, 1),
+		"llm_calls": sum(r["calls"] for r in summary if r["kind"] == "llm"),
+		"retries": sum(r["retries"] for r in summary if r["kind"] == "llm"),
+		"prompt_tokens": sum(r["prompt_tokens"] for r in summary if r["kind"] == "llm"),
+		"cached_tokens": sum(r["cached_tokens"] for r in summary if r["kind"] == "llm"),
+		"breakdown": _breakdown(summary),
+	}
+	row["cache_hit_rate"] = round(row["cached_tokens"] / row["prompt_tokens"], 4) if row["prompt_tokens"] else 0.0
+
+	if args.alloc_iterations:
+		gc.collect()
+		tracemalloc.start()
+		await _run_calls(call, indices(args.alloc_iterations), args.alloc_iterations, args.concurrency)
+		gc.collect()
+		retained, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		row["alloc_peak_kib"] = round(peak / 1024, 1)
+		row["alloc_retained_kib"] = round(retained / 1024, 1)
+	return row
+
+
+# Baseline comparison
+_COMPARED = (
+	("latency p50", lambda r: (r.get("latency_ms") or {}).get("p50"), False),
+	("latency p95", lambda r: (r.get("latency_ms") or {}).get("p95"), False),
+	("throughput", lambda r: r.get("throughput_per_s"), True),
+	("rss peak", lambda r: r.get("rss_peak_mib"), False),
+	("alloc peak", lambda r: r.get("alloc_peak_kib"), False),
+)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[dict]:
+	"""
+	Regressions of current against baseline: metrics that got worse by more than threshold (a fraction),
+	per scenario present in both.
+	"""
+	previous = {row["scenario"]: row for row in baseline.get("scenarios", [])}
+	regressions = []
+	for row in current["scenarios"]:
+		before = previous.get(row["scenario"])
+		if before is None:
+			continue
+		for metric, value_of, higher_is_better in _COMPARED:
+			old, new = value_of(before), value_of(row)
+			if not old or new is None:
+				continue
+			change = (old - new) / old if higher_is_better else (new - old) / old
+			if change > threshold:
+				regressions.append({"scenario": row["scenario"], "metric": metric, "baseline": old, "current": new, "worse_by": round(change, 3)})
+	return regressions
+
+
+def _git_commit() -> Optional[str]:
+	try:
+		result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_KIT_DIR, capture_output=True, text=True, timeout=5)
+	except (OSError, subprocess.SubprocessError):
+		return None
+	return result.stdout.strip() or None
+
+
+def _print_table(result: dict) -> None:
+	header = f"{'scenario':<32}{'calls':>6}{'err':>5}{'/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft ms':>9}{'llm':>5}{'retry':>6}{'cache%':>8}{'rss MiB':>9}{'alloc KiB':>11}"
+	print(header)
+	print("-" * len(header))
+	for row in result["scenarios"]:
+		latency = row["latency_ms"] or {}
+		ttft = (row["ttft_ms"] or {}).get("p50", "")
+		print(
+			f"{row['scenario']:<32}{row['calls']:>6}{row['errors']:>5}{row['throughput_per_s']:>8}"
+			f"{latency.get('p50', ''):>9}{latency.get('p95', ''):>9}{latency.get('p99', ''):>9}{ttft:>9}"
+			f"{row['llm_calls']:>5}{row['retries']:>6}{row['cache_hit_rate']:>8.0%}{row['rss_peak_mib']:>9}{row.get('alloc_peak_kib', ''):>11}"
+		)
+	settings = result["settings"]
+	print("-" * len(header))
+	print(
+		f"stub model: {settings['latency']}s to first token, {settings['output_tokens']} tokens at "
+		f"{settings['tokens_per_second']:g} tok/s, 429 probability {settings['rate_limit_probability']}"
+	)
+	for row in result["scenarios"]:
+		if row["first_error"]:
+			print(f"{row['scenario']}: {row['errors']} errors, first: {row['first_error']}")
+
+
+async def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--scenario", action="append", default=[], help="scenario name or glob (repeatable); default: all")
+	parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+	parser.add_argument("--iterations", type=int, default=20)
+	parser.add_argument("--concurrency", type=int, default=4)
+	parser.add_argument("--warmup", type=int, default=1)
+	parser.add_argument("--alloc-iterations", type=int, default=5, help="calls in the tracemalloc pass (0 skips it)")
+	parser.add_argument("--latency", type=float, default=0.1, help="stub seconds to first token")
+	parser.add_argument("--tokens-per-second", type=float, default=500.0)
+	parser.add_argument("--output-tokens", type=int, default=60)
+	parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="share of stub calls that return 429")
+	parser.add_argument("--retry-after", type=float, default=0.05)
+	parser.add_argument("--fetch-latency", type=float, default=0.0, help="seconds the fixture server waits per request")
+	parser.add_argument("--keep-rate-limits", action="store_true", help="keep the client-side rate limits from models.yaml")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", help="write results as JSON to this file")
+	parser.add_argument("--baseline", help="compare against results written earlier with --output")
+	parser.add_argument("--threshold", type=float, default=0.15, help="regression threshold as a fraction (0.15 = 15%% worse)")
+	parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = parser.parse_args()
+
+	server = _serve(args.fetch_latency)
+	base_url = f"http://127.0.0.1:{server.server_address[1]}"
+	_RANDOM.seed(args.seed)
+	stub = dict(
+		latency=args.latency,
+		tokens_per_second=args.tokens_per_second,
+		output_tokens=args.output_tokens,
+		rate_limit_probability=args.rate_limit_probability,
+		retry_after=args.retry_after,
+		plan=_agent_plan(base_url),
+	)
+	agent.factory.init_chat_model = lambda **kwargs: StubChatModel(model_name=kwargs["model"], **stub)
+	agent.tools._search_client = lambda max_results: _StubSearch(base_url, max_results)
+	agent.tools._jina_reader_url = lambda url: f"{base_url}/jina/{url.split('://', 1)[-1]}"
+	# The image and PDF bytes repeat across calls; every call should still reach the model
+	AGENT_CONFIG["single_flight"] = False
+	if not args.keep_rate_limits:
+		# Measure the kit, not client-side provider quotas
+		AGENT_CONFIG["rate_limits"] = {}
+	# Keep the fetch cache and the learned fetch stats out of the kit directory
+	cache_dir = tempfile.TemporaryDirectory(prefix="llm-bench-")
+	((AGENT_CONFIG.setdefault("http", {})).setdefault("fetch_cache", {}))["path"] = os.path.join(cache_dir.name, "fetch_cache")
+	AGENT_CONFIG.setdefault("fetch_strategy", {})["path"] = os.path.join(cache_dir.name, "fetch_stats.json")
+	sink = add_metrics_sink(HistogramSink())
+
+	scenarios = _scenarios(base_url)
+	if args.list:
+		print("\n".join(scenarios))
+		server.shutdown()
+		cache_dir.cleanup()
+		return
+	if args.scenario:
+		scenarios = {name: call for name, call in scenarios.items() if any(fnmatch.fnmatchcase(name, p) for p in args.scenario)}
+
+	result = {
+		"suite": "agent",
+		"commit": _git_commit(),
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+		"settings": {k: v for k, v in vars(args).items() if k not in ("list", "output", "baseline", "json")},
+		"scenarios": [],
+	}
+	counter = [0]
+	try:
+		for name, call in scenarios.items():
+			result["scenarios"].append(await _bench(name, call, args, sink, counter))
+	finally:
+		await aclose_async_client()
+		server.shutdown()
+		cache_dir.cleanup()
+
+	regressions = None
+	if args.baseline:
+		with open(args.baseline, encoding="utf-8") as f:
+			regressions = compare(json.load(f), result, args.threshold)
+		result["regressions"] = regressions
+	if args.output:
+		with open(args.output, "w", encoding="utf-8") as f:
+			json.dump(result, f, indent=2)
+
+	if args.json:
+		print(json.dumps(result, indent=2))
+	else:
+		_print_table(result)
+		if regressions is not None:
+			print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}")
+			for r in regressions:
+				print(f"  {r['scenario']:<32}{r['metric']:<14}{r['baseline']:>10} -> {r['current']:<10} ({r['worse_by']:+.0%})")
+	if regressions:
+		sys.exit(1)
+
+
+if __name__ == "__main__":
+	asyncio.run(main())
@@ -0,0 +1,179 @@
+# benchmarks/retrieval_benchmark.py
+"""
+Measure what BM25 retrieval (agent.retrieval.focus_text) saves on narrow instructions, and what it costs in
+answer quality, on a fixture set of long documents with planted facts.
+
+Each fixture is a document of --paragraphs filler paragraphs (sports, markets, science, travel, cooking,
+software) with one fact paragraph planted at a random position, and a question whose gold answer appears only
+in that paragraph. Some questions share words with the fact; others paraphrase it, which lexical retrieval
+can miss. Offline (default), for every fixture the prompt tokens with and without retrieval are compared,
+and "answer kept" checks that the gold answer is still in the text sent. With --live, the text_summary tool
+is also run both ways against the configured model (API keys needed) and each answer is scored by whether
+it contains the gold answer.
+
+    python benchmarks/retrieval_benchmark.py [--paragraphs 300] [--seed 7] [--live] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent.retrieval
+from agent.retrieval import focus_text, get_retrieval_stats
+from agent.tokens import count_tokens
+
+_TOPICS = {
+	"sports": (
+		"The {team} {verb} their rivals in front of a {size} crowd, with the coach praising the defense.",
+		"Analysts said the {team} still need depth on the bench before the playoffs begin next month.",
+		"Ticket sales for the {team} rose again, and the club announced a renovation of the training center.",
+	),
+	"markets": (
+		"Shares of {company} {move} after the quarterly update, as traders weighed guidance on margins.",
+		"Bond yields drifted while investors waited for the central bank minutes and fresh inflation data.",
+		"{company} said supply costs eased, although freight delays continued to weigh on smaller suppliers.",
+	),
+	"science": (
+		"Researchers at the {lab} published results suggesting the enzyme behaves differently at low temperature.",
+		"The {lab} team plans a follow-up study with a larger sample and independent replication.",
+		"Funding for the telescope upgrade at the {lab} was approved after a two-year review.",
+	),
+	"travel": (
+		"Visitors to {city} can take the coastal rail line, which runs every twenty minutes in summer.",
+		"Hotels in {city} reported high occupancy, and several museums extended their opening hours.",
+		"The old quarter of {city} is best explored on foot, with cafes lining the narrow streets.",
+	),
+	"cooking": (
+		"For the sauce, reduce the stock slowly and finish it with butter and a squeeze of lemon.",
+		"Roast the vegetables at a high temperature so they caramelize without drying out.",
+		"Rest the dough overnight in the fridge; the flavor improves and it is easier to shape.",
+	),
+	"software": (
+		"The {product} release adds faster startup and fixes a memory leak in the sync service.",
+		"Engineers migrated the {product} build to a new pipeline, cutting test time considerably.",
+		"Users of {product} can now export reports to spreadsheets directly from the dashboard.",
+	),
+}
+_FILL = {
+	"team": ["Falcons", "Harbor City FC", "Red Owls", "Northside Rangers", "Blue Comets"],
+	"verb": ["edged", "outplayed", "held off", "surprised"],
+	"size": ["sold-out", "modest", "record", "rain-soaked"],
+	"company": ["Altura Corp", "Medleigh", "Pinecrest Foods", "Norvane Energy"],
+	"move": ["climbed", "slipped", "jumped", "were flat"],
+	"lab": ["Kessler Institute", "Dunmore lab", "Polar Research Station"],
+	"city": ["Lisbon", "Valparaiso", "Split", "Hobart"],
+	"product": ["Ledgerly", "Trackside", "Nimbus Notes"],
+}
+
+# (fact sentence, question, gold answer); the first three share words with the fact, the rest paraphrase it
+_FACTS = [
+	("Final score: the Rockets beat the Hawks 112-104 after overtime in the championship game.", "Extract the final score and the teams of the championship game.", "112-104"),
+	("The merger agreement values Quellan Systems at 4.2 billion dollars, including debt.", "What is the merger agreement valuation of Quellan Systems?", "4.2 billion"),
+	("The recall covers 18,400 kettles sold under the Brisa brand because the handle can overheat.", "How many Brisa kettles does the recall cover?", "18,400"),
+	("Dr. Amara Okafor will lead the new glacier monitoring program from March.", "Who will lead the glacier monitoring program?", "Amara Okafor"),
+	("The ferry to Vis leaves from pier 7 at 06:15 on weekdays.", "When does the ferry to Vis depart on weekdays?", "06:15"),
+	("Version 5.3 removes support for the legacy XML importer.", "Which release dropped the old XML import feature?", "5.3"),
+	("Bake the loaf at 230 C for the first twenty minutes, then lower the oven.", "What oven temperature should the bread start at?", "230"),
+	("Quarterly revenue rose 14 percent to 880 million, driven by subscriptions.", "By how much did sales grow last quarter?", "14 percent"),
+]
+
+
+def _paragraph(rnd: random.Random) -> str:
+	topic = rnd.choice(list(_TOPICS))
+	sentences = [rnd.choice(_TOPICS[topic]) for _ in range(rnd.randint(3, 5))]
+	return " ".join(s.format(**{k: rnd.choice(v) for k, v in _FILL.items()}) for s in sentences)
+
+
+def build_fixtures(paragraphs: int, seed: int) -> list:
+	rnd = random.Random(seed)
+	fixtures = []
+	for i, (fact, question, gold) in enumerate(_FACTS):
+		body = [_paragraph(rnd) for _ in range(paragraphs)]
+		position = rnd.randrange(paragraphs)
+		body[position] = f"{_paragraph(rnd)} {fact} {_paragraph(rnd)}"
+		fixtures.append({"id": i, "question": question, "gold": gold, "paraphrased": i >= 3, "text": "\n\n".join(body)})
+	return fixtures
+
+
+def _live_answer(text: str, question: str, retrieval: bool) -> str:
+	from agent.tools import text_summary
+
+	agent.retrieval._RETRIEVAL_CONFIG["enabled"] = retrieval
+	try:
+		return text_summary.invoke({"text": text, "instruction": question})
+	finally:
+		agent.retrieval._RETRIEVAL_CONFIG["enabled"] = True
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--paragraphs", type=int, default=300, help="filler paragraphs per document")
+	parser.add_argument("--seed", type=int, default=7)
+	parser.add_argument("--model", default="gpt-4o", help="model name used for token counts")
+	parser.add_argument("--live", action="store_true", help="also answer each question with the configured model, both ways")
+	parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = parser.parse_args()
+
+	rows = []
+	for fixture in build_fixtures(args.paragraphs, args.seed):
+		full_tokens = count_tokens(fixture["text"], args.model)
+		started = time.perf_counter()
+		focused = focus_text(fixture["text"], fixture["question"], args.model)
+		first_ms = (time.perf_counter() - started) * 1000
+		started = time.perf_counter()
+		focus_text(fixture["text"], fixture["question"], args.model)
+		cached_ms = (time.perf_counter() - started) * 1000
+		row = {
+			"id": fixture["id"],
+			"question": fixture["question"],
+			"paraphrased": fixture["paraphrased"],
+			"tokens_full": full_tokens,
+			"tokens_focused": count_tokens(focused, args.model),
+			"answer_kept": fixture["gold"] in focused,
+			"index_ms": round(first_ms, 1),
+			"cached_ms": round(cached_ms, 1),
+		}
+		if args.live:
+			row["live_full_correct"] = fixture["gold"] in _live_answer(fixture["text"], fixture["question"], False)
+			row["live_focused_correct"] = fixture["gold"] in _live_answer(fixture["text"], fixture["question"], True)
+		rows.append(row)
+
+	total_full = sum(r["tokens_full"] for r in rows)
+	total_focused = sum(r["tokens_focused"] for r in rows)
+	summary = {
+		"fixtures": len(rows),
+		"tokens_full": total_full,
+		"tokens_focused": total_focused,
+		"saved_pct": round(100 * (1 - total_focused / max(1, total_full)), 1),
+		"answer_kept": sum(r["answer_kept"] for r in rows),
+		"answer_kept_lexical": sum(r["answer_kept"] for r in rows if not r["paraphrased"]),
+		"answer_kept_paraphrased": sum(r["answer_kept"] for r in rows if r["paraphrased"]),
+		"stats": get_retrieval_stats(),
+	}
+	if args.live:
+		summary["live_full_correct"] = sum(r["live_full_correct"] for r in rows)
+		summary["live_focused_correct"] = sum(r["live_focused_correct"] for r in rows)
+	if args.json:
+		print(json.dumps({"rows": rows, "summary": summary}, indent=2))
+		return
+
+	print(f"{'id':>2}  {'full':>7}  {'focused':>7}  {'kept':>4}  {'index':>8}  {'cached':>7}  question")
+	for r in rows:
+		kept = "yes" if r["answer_kept"] else "NO"
+		print(f"{r['id']:>2}  {r['tokens_full']:>7}  {r['tokens_focused']:>7}  {kept:>4}  {r['index_ms']:>6}ms  {r['cached_ms']:>5}ms  {r['question']}")
+	lexical = sum(not r["paraphrased"] for r in rows)
+	print(
+		f"\ntokens {total_full} -> {total_focused} ({summary['saved_pct']}% fewer); answer kept in "
+		f"{summary['answer_kept']}/{len(rows)} ({summary['answer_kept_lexical']}/{lexical} lexical, "
+		f"{summary['answer_kept_paraphrased']}/{len(rows) - lexical} paraphrased)"
+	)
+	if args.live:
+		print(f"live answers correct: {summary['live_full_correct']}/{len(rows)} full text, {summary['live_focused_correct']}/{len(rows)} with retrieval")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,114 @@
+# benchmarks/scratchpad_benchmark.py
+"""
+Measure the agent's prompt size per iteration with and without scratchpad compaction.
+
+Models are stubbed (no API keys or network needed): the agent model calls a stub tool that returns
+--observation-chars of text, one call per iteration for --iterations iterations, then answers. Prompt tokens
+of every agent-model call are recorded with PromptTokenTracker. Without compaction the prompt grows with
+every tool result; with it the curve flattens at about the configured budget.
+
+    python benchmarks/scratchpad_benchmark.py [--iterations 12] [--observation-chars 12000] [--budget 8000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+
+import agent.agent
+import agent.factory
+import agent.scratchpad
+from agent import PromptTokenTracker, build_agent
+from agent.settings import AGENT_CONFIG
+
+_OBSERVATION_CHARS = 12000
+
+
+@tool
+def fetch_report(section: int) -> str:
+	"""Return one section of a long report."""
+	line = f"Section {section}: revenue, costs and headcount by region with commentary on each quarter. "
+	return (line * (_OBSERVATION_CHARS // len(line) + 1))[:_OBSERVATION_CHARS]
+
+
+class StubChatModel(BaseChatModel):
+	"""
+	Offline agent model: requests fetch_report once per iteration until `iterations` tool results are in,
+	then answers.
+	"""
+
+	iterations: int = 12
+
+	@property
+	def _llm_type(self) -> str:
+		return "stub"
+
+	def bind_tools(self, tools, **kwargs):
+		from langchain_core.utils.function_calling import convert_to_openai_tool
+
+		return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+	def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+		done = sum(isinstance(m, ToolMessage) for m in messages)
+		if done < self.iterations:
+			calls = [{"name": "fetch_report", "args": {"section": done + 1}, "id": f"call_{done}"}]
+			message = AIMessage(content="", tool_calls=calls)
+		else:
+			message = AIMessage(content=f"Read {done} sections.")
+		return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _run(compact: bool) -> List[int]:
+	executor = build_agent(verbose=False, compact_scratchpad=compact)
+	tracker = PromptTokenTracker()
+	executor.invoke({"input": "Read the whole report and summarize it."}, config={"callbacks": [tracker]})
+	return tracker.iterations
+
+
+def main() -> None:
+	global _OBSERVATION_CHARS
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("--iterations", type=int, default=12)
+	parser.add_argument("--observation-chars", type=int, default=12000)
+	parser.add_argument("--budget", type=int, default=None, help="scratchpad budget_tokens (default: models.yaml)")
+	parser.add_argument("--json", action="store_true", help="print results as JSON")
+	args = parser.parse_args()
+
+	_OBSERVATION_CHARS = args.observation_chars
+	stub = StubChatModel(iterations=args.iterations)
+	agent.factory.init_chat_model = lambda **kwargs: stub
+	agent.agent.get_agent_tools = lambda: [fetch_report]
+	AGENT_CONFIG["rate_limits"] = {}
+	if args.budget is not None:
+		agent.scratchpad._SCRATCHPAD_CONFIG["budget_tokens"] = args.budget
+
+	baseline = _run(compact=False)
+	compacted = _run(compact=True)
+	result = {
+		"iterations": args.iterations,
+		"observation_chars": args.observation_chars,
+		"budget_tokens": agent.scratchpad._SCRATCHPAD_CONFIG.get("budget_tokens", 8000),
+		"prompt_tokens_baseline": baseline,
+		"prompt_tokens_compacted": compacted,
+		"total_baseline": sum(baseline),
+		"total_compacted": sum(compacted),
+		"saved_pct": round(100 * (1 - sum(compacted) / max(1, sum(baseline))), 1),
+	}
+	if args.json:
+		print(json.dumps(result, indent=2))
+		return
+	print(f"{'iteration':>9}  {'baseline':>9}  {'compacted':>9}")
+	for i, (before, after) in enumerate(zip(baseline, compacted), start=1):
+		print(f"{i:>9}  {before:>9}  {after:>9}")
+	print(f"{'total':>9}  {result['total_baseline']:>9}  {result['total_compacted']:>9}  ({result['saved_pct']}% fewer)")
+
+
+if __name__ == "__main__":
+	main()
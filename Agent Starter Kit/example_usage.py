@@ -1,6 +1,20 @@
+import asyncio
 import os
 
-from agent import build_agent, get_agent_tools
+from agent import StreamTiming, astream_agent, build_agent, format_metrics_summary, get_agent_tools
+
+async def stream_reply(agent, text):
+	# Print the reply as it is generated, with tool calls as they start and finish
+	timing = StreamTiming("agent")
+	async for event in astream_agent(agent, {"input": text}, timing=timing):
+		if event["event"] == "token":
+			print(event["text"], end="", flush=True)
+		elif event["event"] == "tool_start":
+			print(f"\n[tool] {event['name']}({event['input']})")
+		elif event["event"] == "tool_end":
+			print(f"[tool] {event['name']} done")
+	print()
+	print(timing)
 
 def main():
 	# Build agent, preview tools
@@ -13,6 +27,11 @@ def main():
 	print("Agent reply:", result["output"])
 	print("--------------------------------")
 
+	# Stream the reply token by token
+	print("Stream the reply with tool events")
+	asyncio.run(stream_reply(agent, "What is (7 * 6) - 2? Use safe_calculate, then explain the steps."))
+	print("--------------------------------")
+
 	# Use the read webpage tool
 	print("Use the read webpage tool")
 	query = (
@@ -66,6 +85,10 @@ def main():
 	# Give it an open-ended task that will use multiple tools
 	result = agent.invoke({"input": "Write me an aggregation of the most recent news stories about AI. Include a maximum of three stories, write a summary for each, and include sources. Be sure to read the webpage to generate your summary."})
 	print("Weekly recap:\n", result["output"]) 
+	print("--------------------------------")
+
+	# Latency, tokens and estimated cost per tool and model (see agent.metrics)
+	print(format_metrics_summary())
 
 if __name__ == "__main__":
 	main()
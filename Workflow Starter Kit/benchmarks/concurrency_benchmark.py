@@ -0,0 +1,188 @@
+# benchmarks/concurrency_benchmark.py
+"""
+Show that the async tasks in llm/tasks.py don't block the event loop: N calls awaited one after another
+against the same N calls under asyncio.gather.
+
+The model is a stub that sleeps --latency seconds per call, and analyze_webpage reads pages from a local HTTP
+server that waits --fetch-latency seconds per request, so the run is offline and repeatable. Sequential runs
+take about N times one call; concurrent runs should take about as long as the slowest call. A task whose
+concurrent run takes more than --max-ratio times its slowest sequential call is reported, and the exit status
+is 1, so a blocking call slipping back into a task fails the check.
+
+    python benchmarks/concurrency_benchmark.py [--calls 20] [--latency 0.2] [--fetch-latency 0.05] [--max-ratio 3] [--json]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import llm.factory
+from llm import tasks
+from llm.http_client import aclose_async_client
+from llm.settings import LLM_CONFIG
+
+_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "html")
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline chat model: sleeps latency seconds, then answers structured-output calls with a tool call whose
+    string fields say "stub" (and other calls with text).
+    """
+
+    latency: float = 0.2
+    model_name: str = "stub"
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _reply(self, kwargs: dict) -> ChatResult:
+        tool_calls = []
+        for tool in kwargs.get("tools") or []:
+            properties = (tool["function"].get("parameters") or {}).get("properties") or {}
+            args = {name: [] if spec.get("type") == "array" else "stub" for name, spec in properties.items()}
+            tool_calls.append({"name": tool["function"]["name"], "args": args, "id": "call_0"})
+        message = AIMessage(content="" if tool_calls else "stub", tool_calls=tool_calls)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._reply(kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._reply(kwargs)
+
+
+class _SlowHandler(SimpleHTTPRequestHandler):
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 overflows when a gather opens dozens of connections at once, and the SYN
+    # retries that follow (1s, then 3s) would be measured as task latency
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def _serve(directory: str, latency: float) -> _Server:
+    handler = type("_Handler", (_SlowHandler,), {"latency": latency})
+    server = _Server(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _scenarios(base_url: str) -> Dict[str, Callable[[int], Awaitable[object]]]:
+    # Every call gets distinct input (and URL), so nothing is collapsed or served from a cache
+    page = sorted(name for name in os.listdir(_CORPUS) if name.endswith((".html", ".htm")))[0]
+    return {
+        "analyze_text": lambda i: tasks.analyze_text(f"Report {i}: revenue grew while costs held steady across regions."),
+        "analyze_webpage": lambda i: tasks.analyze_webpage(f"{base_url}/{page}?call={i}"),
+    }
+
+
+async def _timed(call: Callable[[int], Awaitable[object]], i: int) -> float:
+    started = time.perf_counter()
+    await call(i)
+    return time.perf_counter() - started
+
+
+async def _bench(name: str, call: Callable[[int], Awaitable[object]], calls: int, counter: List[int]) -> dict:
+    start = counter[0]
+    counter[0] += 2 * calls
+    started = time.perf_counter()
+    sequential_calls = [await _timed(call, i) for i in range(start, start + calls)]
+    sequential = time.perf_counter() - started
+    started = time.perf_counter()
+    await asyncio.gather(*(_timed(call, i) for i in range(start + calls, start + 2 * calls)))
+    concurrent = time.perf_counter() - started
+    slowest = max(sequential_calls)
+    return {
+        "task": name,
+        "calls": calls,
+        "sequential_s": round(sequential, 3),
+        "concurrent_s": round(concurrent, 3),
+        "slowest_call_s": round(slowest, 3),
+        "speedup": round(sequential / concurrent, 1) if concurrent else None,
+        "concurrent_over_slowest": round(concurrent / slowest, 2) if slowest else None,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub model seconds per call")
+    parser.add_argument("--fetch-latency", type=float, default=0.05, help="seconds the local server waits per request")
+    parser.add_argument("--max-ratio", type=float, default=3.0, help="fail when a concurrent run exceeds this many slowest calls")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    stub = StubChatModel(latency=args.latency)
+    llm.factory.init_chat_model = lambda **kwargs: stub
+    # Measure the tasks, not client-side provider quotas or batch limits
+    LLM_CONFIG["rate_limits"] = {}
+    LLM_CONFIG["single_flight"] = False
+    cache_dir = tempfile.TemporaryDirectory(prefix="llm-bench-")
+    ((LLM_CONFIG.setdefault("http", {})).setdefault("fetch_cache", {}))["path"] = os.path.join(cache_dir.name, "fetch_cache")
+    LLM_CONFIG.setdefault("fetch_strategy", {})["path"] = os.path.join(cache_dir.name, "fetch_stats.json")
+
+    server = _serve(_CORPUS, args.fetch_latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    counter = [0]
+    rows = []
+    try:
+        for name, call in _scenarios(base_url).items():
+            rows.append(await _bench(name, call, args.calls, counter))
+    finally:
+        await aclose_async_client()
+        server.shutdown()
+        cache_dir.cleanup()
+    for row in rows:
+        row["blocking"] = row["concurrent_over_slowest"] is not None and row["concurrent_over_slowest"] > args.max_ratio
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        header = f"{'task':<20}{'calls':>6}{'sequential s':>14}{'concurrent s':>14}{'slowest s':>11}{'speedup':>9}  status"
+        print(header)
+        print("-" * len(header))
+        for row in rows:
+            status = "BLOCKING" if row["blocking"] else "ok"
+            print(
+                f"{row['task']:<20}{row['calls']:>6}{row['sequential_s']:>14}{row['concurrent_s']:>14}"
+                f"{row['slowest_call_s']:>11}{row['speedup']:>8}x  {status}"
+            )
+        print("-" * len(header))
+        print(f"stub model: {args.latency}s per call, fetch {args.fetch_latency}s per request")
+    sys.exit(1 if any(row["blocking"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
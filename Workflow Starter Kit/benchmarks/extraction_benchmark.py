@@ -0,0 +1,182 @@
+# benchmarks/extraction_benchmark.py
+"""
+Compare raw-HTML and extracted-markdown webpage prompts over a corpus of saved HTML pages.
+
+For each page it reports the input tokens sent to the model, the local extraction time and the end-to-end
+latency of analyze_webpage() (served from a local HTTP server). By default the model is a stub whose latency
+grows with prompt size (--base-latency + prompt tokens / --prefill-tps), so the run is offline and repeatable;
+--live uses the model configured for the analyze-webpage task instead.
+
+    python benchmarks/extraction_benchmark.py [--corpus DIR] [--max-chars 12000] [--runs 3] [--live] [--json]
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import llm.factory
+from llm.extract import html_to_text, readable_text
+from llm.settings import LLM_CONFIG
+from llm.tasks import analyze_webpage
+from llm.tokens import count_tokens, estimate_message_tokens
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline chat model: answers every structured-output call with a fixed tool call after sleeping
+    base_latency + prompt_tokens / prefill_tps seconds.
+    """
+
+    base_latency: float = 0.3
+    prefill_tps: float = 5000.0
+    model_name: str = "stub"
+    prompt_tokens: List[int] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _reply(self, messages, kwargs) -> tuple[float, ChatResult]:
+        tokens = estimate_message_tokens(messages, self.model_name)
+        self.prompt_tokens.append(tokens)
+        tool_calls = []
+        for tool in kwargs.get("tools") or []:
+            name = tool["function"]["name"]
+            tool_calls.append({"name": name, "args": {"title": "stub", "description": "stub", "key_objects": []}, "id": "call_0"})
+        message = AIMessage(content="", tool_calls=tool_calls)
+        return self.base_latency + tokens / self.prefill_tps, ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, result = self._reply(messages, kwargs)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        delay, result = self._reply(messages, kwargs)
+        await asyncio.sleep(delay)
+        return result
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    # Headers and body are separate writes; without this, delayed ACKs add ~40ms per request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 overflows when a gather opens dozens of connections at once, and the SYN
+    # retries that follow (1s, then 3s) would be measured as task latency
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def _serve(directory: str) -> _Server:
+    server = _Server(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _ms(values: List[float]) -> float:
+    return round(statistics.median(values) * 1000, 1)
+
+
+async def _bench_page(name: str, html: str, base_url: str, args: argparse.Namespace, stub: Any) -> dict:
+    model_name = ((LLM_CONFIG.get("tasks") or {}).get("analyze-webpage") or {}).get("model")
+    raw = readable_text(html, args.max_chars, raw_html=True)
+    started = time.perf_counter()
+    extracted_full = html_to_text(html)
+    extract_seconds = time.perf_counter() - started
+    extracted = extracted_full[: args.max_chars]
+    row = {
+        "page": name,
+        "html_chars": len(html),
+        "raw_tokens": count_tokens(raw, model_name),
+        "extracted_tokens": count_tokens(extracted, model_name),
+        "extracted_chars_full": len(extracted_full),
+        "extract_ms": round(extract_seconds * 1000, 2),
+    }
+    row["token_reduction"] = round(1 - row["extracted_tokens"] / max(1, row["raw_tokens"]), 3)
+    for mode, raw_html in (("raw", True), ("extracted", False)):
+        timings = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                await analyze_webpage(f"{base_url}/{name}", max_chars=args.max_chars, raw_html=raw_html)
+            timings.append(time.perf_counter() - started)
+        row[f"{mode}_e2e_ms"] = _ms(timings)
+        if stub is not None:
+            row[f"{mode}_prompt_tokens"] = stub.prompt_tokens[-1]
+    return row
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "html"))
+    parser.add_argument("--max-chars", type=int, default=12000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--base-latency", type=float, default=0.3)
+    parser.add_argument("--prefill-tps", type=float, default=5000.0)
+    parser.add_argument("--live", action="store_true", help="call the configured model instead of the stub")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    stub = None
+    if not args.live:
+        stub = StubChatModel(base_latency=args.base_latency, prefill_tps=args.prefill_tps)
+        llm.factory.init_chat_model = lambda **kwargs: stub
+        # Identical prompts across runs would otherwise collapse into one call
+        LLM_CONFIG["single_flight"] = False
+
+    server = _serve(args.corpus)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    rows = []
+    try:
+        for name in sorted(os.listdir(args.corpus)):
+            if name.endswith((".html", ".htm")):
+                with open(os.path.join(args.corpus, name), encoding="utf-8", errors="replace") as f:
+                    rows.append(await _bench_page(name, f.read(), base_url, args, stub))
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = f"{'page':<24}{'html KB':>9}{'raw tok':>9}{'ext tok':>9}{'saved':>8}{'extract ms':>12}{'raw e2e ms':>12}{'ext e2e ms':>12}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['page']:<24}{row['html_chars'] / 1024:>9.1f}{row['raw_tokens']:>9}{row['extracted_tokens']:>9}"
+            f"{row['token_reduction']:>8.0%}{row['extract_ms']:>12}{row['raw_e2e_ms']:>12}{row['extracted_e2e_ms']:>12}"
+        )
+    raw_total = sum(row["raw_tokens"] for row in rows)
+    extracted_total = sum(row["extracted_tokens"] for row in rows)
+    print("-" * len(header))
+    print(f"total input tokens: raw {raw_total}, extracted {extracted_total} ({1 - extracted_total / max(1, raw_total):.0%} fewer)")
+    print("model: " + ("live" if args.live else f"stub ({args.base_latency}s + tokens / {args.prefill_tps:g} tok/s)"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
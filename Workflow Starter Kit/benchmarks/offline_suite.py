@@ -0,0 +1,676 @@
+# benchmarks/offline_suite.py
+"""
+Offline benchmark suite for every task function in llm/tasks.py (plain and streaming).
+
+No API keys or network needed. Chat models are replaced by a local stub. The stub waits --latency seconds before
+its first token, then produces --output-tokens tokens at --tokens-per-second. A --rate-limit-probability share
+of its calls fail with a 429 (Retry-After: --retry-after), which goes through the kit's retries and rate
+limiter. Prompt caching is simulated the way OpenAI does it (prefixes from 1024 tokens, in 128-token blocks),
+and the cached part of each prompt is reported in its usage. Webpages (benchmarks/html), the image and the PDF
+(example_assets) are served from a local HTTP server, which also stands in for Jina Reader
+(analyze_webpage[jina] reads pages whose direct fetch fails). Everything else is the kit's real code: fetching
+and the fetch strategy, extraction, chunking, retrieval, image and PDF preparation, the model pool, routing and
+metrics.
+
+Each scenario runs --warmup calls, then --iterations timed calls, --concurrency at a time. It reports
+throughput, p50/p95/p99 latency (plus time to first item for streaming functions), peak RSS during the run
+and the calls' phase breakdown from llm.metrics. A separate pass of --alloc-iterations calls runs under
+tracemalloc and reports peak and retained Python allocations (it is kept out of the timings because
+tracing slows everything down).
+
+Write results with --output and compare a later run against them with --baseline. Scenarios whose p50/p95
+latency, throughput, peak RSS or allocation peak got worse by more than --threshold are listed, and the
+exit status is 1.
+
+    python benchmarks/offline_suite.py [--scenario analyze_webpage*] [--iterations 20] [--concurrency 4]
+        [--latency 0.1] [--tokens-per-second 500] [--rate-limit-probability 0.1] [--output results.json]
+        [--baseline previous.json] [--json] [--list]
+"""
+import argparse
+import asyncio
+import base64
+import fnmatch
+import functools
+import gc
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import llm.factory
+from llm import tasks
+from llm.extract import html_to_text
+from llm.http_client import aclose_async_client
+from llm.metrics import HistogramSink, add_metrics_sink
+from llm.settings import LLM_CONFIG
+
+_KIT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CORPUS = os.path.join(_KIT_DIR, "benchmarks", "html")
+_ASSETS = os.path.join(_KIT_DIR, "example_assets")
+
+# Seeded in main() so 429 injection is repeatable
+_RANDOM = random.Random(0)
+
+_FILLER = "revenue grew while costs held steady across regions and teams".split()
+
+
+# Stub chat model
+class _PrefixCache:
+    """
+    Simulated provider prompt cache: like OpenAI's, prompts of at least min_tokens are cached in 128-token
+    blocks, and a call reads back the longest prefix an earlier call (to the same model) already sent.
+    Prefixes are kept as chained sha1 digests in a bounded LRU.
+    """
+
+    def __init__(self, min_tokens: int = 1024, block_tokens: int = 128, max_entries: int = 100_000):
+        self.min_chars = min_tokens * 4
+        self.block_chars = block_tokens * 4
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[bytes, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, model: str, prompt: str) -> int:
+        """Tokens of prompt served from the cache; all of its blocks are cached for later calls."""
+        digest = hashlib.sha1(model.encode("utf-8"))
+        boundaries, start = [], 0
+        for end in range(self.min_chars, len(prompt) + 1, self.block_chars):
+            digest.update(prompt[start:end].encode("utf-8"))
+            boundaries.append((end, digest.digest()))
+            start = end
+        cached = 0
+        with self._lock:
+            for end, key in boundaries:
+                if key not in self._seen:
+                    break
+                cached = end
+            for _, key in boundaries:
+                self._seen[key] = None
+                self._seen.move_to_end(key)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+        return cached // 4
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seen.clear()
+
+
+PREFIX_CACHE = _PrefixCache()
+
+
+def _serialize(messages: list) -> str:
+    # The prompt as the provider would see it, in order; non-text blocks (images, files) are represented by a digest
+    parts = []
+    for message in messages:
+        parts.append(f"<{message.type}>")
+        content = message.content
+        blocks = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+        for block in blocks:
+            if isinstance(block, dict) and block.get("type") == "text":
+                parts.append(block.get("text") or "")
+            else:
+                parts.append(hashlib.sha1(json.dumps(block, sort_keys=True, default=str).encode("utf-8")).hexdigest())
+        if getattr(message, "tool_calls", None):
+            parts.append(json.dumps(message.tool_calls, sort_keys=True, default=str))
+    return "\n".join(parts)
+
+
+def _prompt_chars(messages: list) -> int:
+    chars = 0
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for block in content or []:
+            if isinstance(block, dict) and block.get("type") == "text":
+                chars += len(block.get("text") or "")
+    return chars
+
+
+def _fill(schema: dict, words: int) -> dict:
+    # Schema-shaped arguments: strings share the word budget, arrays get a few short items
+    properties = schema.get("properties") or {}
+    strings = [name for name, spec in properties.items() if spec.get("type", "string") == "string"]
+    per_string = max(1, words // max(1, len(strings)))
+    out: Dict[str, Any] = {}
+    for name, spec in properties.items():
+        kind = spec.get("type", "string")
+        if kind == "string":
+            out[name] = " ".join(_FILLER[i % len(_FILLER)] for i in range(per_string))
+        elif kind == "array":
+            out[name] = _FILLER[:3]
+        elif kind in ("integer", "number"):
+            out[name] = 0
+        elif kind == "boolean":
+            out[name] = False
+        else:
+            out[name] = None
+    return out
+
+
+def _rate_limit_error(retry_after: float) -> openai.RateLimitError:
+    request = httpx.Request("POST", "http://stub.invalid/v1/chat/completions")
+    response = httpx.Response(429, headers={"retry-after": str(retry_after)}, request=request)
+    return openai.RateLimitError("Rate limit reached (stub)", response=response, body=None)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline chat model. Replies after latency seconds plus output_tokens at tokens_per_second, and streams
+    at the same rate. Structured-output calls (tools bound) get a tool call with the schema's fields filled
+    in; other calls get text. rate_limit_probability of calls raise openai.RateLimitError (HTTP 429).
+    """
+
+    model_name: str = "stub"
+    latency: float = 0.1
+    tokens_per_second: float = 500.0
+    output_tokens: int = 60
+    rate_limit_probability: float = 0.0
+    retry_after: float = 0.05
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def bind_tools(self, tools, **kwargs):
+        from langchain_core.utils.function_calling import convert_to_openai_tool
+
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _check_rate_limit(self) -> None:
+        if self.rate_limit_probability and _RANDOM.random() < self.rate_limit_probability:
+            raise _rate_limit_error(self.retry_after)
+
+    def _usage(self, messages: list) -> dict:
+        prompt = _prompt_chars(messages) // 4
+        cached = min(prompt, PREFIX_CACHE.read(self.model_name, _serialize(messages)))
+        return {
+            "input_tokens": prompt,
+            "output_tokens": self.output_tokens,
+            "total_tokens": prompt + self.output_tokens,
+            "input_token_details": {"cache_read": cached},
+        }
+
+    def _reply(self, messages: list, kwargs: dict) -> AIMessage:
+        tools = kwargs.get("tools") or []
+        if tools:
+            function = tools[0]["function"]
+            args = _fill(function.get("parameters") or {}, self.output_tokens)
+            return AIMessage(content="", tool_calls=[{"name": function["name"], "args": args, "id": "call_0"}], usage_metadata=self._usage(messages))
+        text = " ".join(_FILLER[i % len(_FILLER)] for i in range(self.output_tokens))
+        return AIMessage(content=text, usage_metadata=self._usage(messages))
+
+    def _pieces(self, message: AIMessage) -> List[AIMessageChunk]:
+        # About one token per chunk: words of text, or 4-character slices of tool-call JSON
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            args = json.dumps(call["args"])
+            chunks = [AIMessageChunk(content="", tool_call_chunks=[{"name": call["name"], "args": "", "id": call["id"], "index": 0}])]
+            chunks += [AIMessageChunk(content="", tool_call_chunks=[{"args": args[i:i + 4], "index": 0}]) for i in range(0, len(args), 4)]
+        else:
+            chunks = [AIMessageChunk(content=word + " ") for word in message.content.split(" ")]
+        chunks.append(AIMessageChunk(content="", usage_metadata=message.usage_metadata))
+        return chunks
+
+    def _duration(self) -> float:
+        return self.latency + self.output_tokens / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._check_rate_limit()
+        time.sleep(self._duration())
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._check_rate_limit()
+        await asyncio.sleep(self._duration())
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check_rate_limit()
+        time.sleep(self.latency)
+        pieces = self._pieces(self._reply(messages, kwargs))
+        for piece in pieces:
+            time.sleep(self.output_tokens / self.tokens_per_second / len(pieces))
+            yield ChatGenerationChunk(message=piece)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._check_rate_limit()
+        await asyncio.sleep(self.latency)
+        pieces = self._pieces(self._reply(messages, kwargs))
+        for piece in pieces:
+            await asyncio.sleep(self.output_tokens / self.tokens_per_second / len(pieces))
+            yield ChatGenerationChunk(message=piece)
+
+
+# Local fixtures
+class _FixtureHandler(SimpleHTTPRequestHandler):
+    # Headers and body are separate writes; without this, delayed ACKs add ~40ms per request
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path.startswith("/jina/"):
+            # Jina Reader stand-in: /jina/<path> returns the readable text of the page at <path>
+            file_path = self.translate_path("/" + self.path[len("/jina/"):])
+            if not os.path.isfile(file_path):
+                self.send_error(404)
+                return
+            body = html_to_text(_read(file_path).decode("utf-8", "replace")).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _QuietServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 overflows when concurrent scenarios open many connections at once, and
+    # the SYN retries that follow (1s, then 3s) would be measured as latency
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Clients that stop reading early (streamed fetches) reset their connections; that is expected here
+        pass
+
+
+def _serve(directory: str, latency: float) -> ThreadingHTTPServer:
+    handler = type("_Handler", (_FixtureHandler,), {"latency": latency})
+    server = _QuietServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# Scenarios: each call gets a distinct index so inputs (and URLs) differ and nothing is collapsed or cached
+async def _drain(stream) -> float:
+    started = time.perf_counter()
+    first = None
+    async for _ in stream:
+        if first is None:
+            first = time.perf_counter() - started
+    return first
+
+
+def _scenarios(base_url: str) -> Dict[str, Callable[[int], Awaitable[Optional[float]]]]:
+    pages = sorted(name for name in os.listdir(_CORPUS) if name.endswith((".html", ".htm")))
+    page_texts = [html_to_text(_read(os.path.join(_CORPUS, name)).decode("utf-8", "replace")) for name in pages]
+    short_text = page_texts[0][:4000]
+    # Past the analyze-text model's context window, so it is split into chunks and combined
+    model_name = (LLM_CONFIG.get("analyze-text") or LLM_CONFIG["default"])["model_name"]
+    window = (LLM_CONFIG.get("available_models", {}).get(model_name) or {}).get("context_window", 128000)
+    corpus_text = "\n\n".join(page_texts)
+    long_text = corpus_text * (window * 5 // len(corpus_text) + 1)
+    image_url = f"{base_url}/example_assets/happy-cat.jpg"
+    image_b64 = base64.b64encode(_read(os.path.join(_ASSETS, "happy-cat.jpg"))).decode("ascii")
+    pdf_b64 = base64.b64encode(_read(os.path.join(_ASSETS, "declaration-of-independence.pdf"))).decode("ascii")
+
+    def page_url(i: int) -> str:
+        return f"{base_url}/benchmarks/html/{pages[i % len(pages)]}?i={i}"
+
+    def blocked_url(i: int) -> str:
+        # Another host name for the same server, so the fetch strategy learns it separately; /blocked is a 404
+        return f"{base_url.replace('127.0.0.1', 'localhost')}/blocked/benchmarks/html/{pages[i % len(pages)]}?i={i}"
+
+    async def call(coro) -> None:
+        await coro
+        return None
+
+    return {
+        "analyze_text": lambda i: call(tasks.analyze_text(f"{short_text}\n\n(sample {i})")),
+        "analyze_text[long]": lambda i: call(tasks.analyze_text(f"{long_text}\n\n(sample {i})")),
+        "astream_analyze_text": lambda i: _drain(tasks.astream_analyze_text(f"{short_text}\n\n(sample {i})")),
+        "analyze_webpage": lambda i: call(tasks.analyze_webpage(page_url(i))),
+        "astream_analyze_webpage": lambda i: _drain(tasks.astream_analyze_webpage(page_url(i))),
+        "analyze_webpage[jina]": lambda i: call(tasks.analyze_webpage(blocked_url(i))),
+        "analyze_image_url": lambda i: call(tasks.analyze_image_url(f"{image_url}?i={i}")),
+        "astream_analyze_image_url": lambda i: _drain(tasks.astream_analyze_image_url(f"{image_url}?i={i}")),
+        "analyze_image_base64": lambda i: call(tasks.analyze_image_base64(image_b64, "image/jpeg")),
+        "astream_analyze_image_base64": lambda i: _drain(tasks.astream_analyze_image_base64(image_b64, "image/jpeg")),
+        "analyze_pdf_base64": lambda i: call(tasks.analyze_pdf_base64(pdf_b64, instruction=f"List the grievances ({i}).")),
+        "astream_analyze_pdf_base64": lambda i: _drain(tasks.astream_analyze_pdf_base64(pdf_b64, instruction=f"List the grievances ({i}).")),
+    }
+
+
+# Measurement
+def _rss_bytes() -> Optional[int]:
+    # Current resident set size (Linux); None where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _max_rss_bytes() -> Optional[int]:
+    # Process-lifetime peak, the fallback where current RSS can't be sampled
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _RssSampler:
+    """Samples RSS every interval seconds in a background thread and keeps the peak."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.start_bytes = _rss_bytes()
+        self.peak_bytes = self.start_bytes or 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, _rss_bytes() or 0)
+
+    def __enter__(self) -> "_RssSampler":
+        if self.start_bytes is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.start_bytes is None:
+            self.peak_bytes = _max_rss_bytes() or 0
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _rss_bytes() or 0)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _distribution_ms(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    return {
+        "p50": round(_percentile(values, 0.5) * 1000, 2),
+        "p95": round(_percentile(values, 0.95) * 1000, 2),
+        "p99": round(_percentile(values, 0.99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(max(values) * 1000, 2),
+    }
+
+
+async def _run_calls(call: Callable, start: int, count: int, concurrency: int) -> tuple[List[float], List[float], List[str]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors: List[str] = []
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ttft = await call(i)
+            except Exception as e:
+                # First line only: httpx errors append a documentation link
+                errors.append(f"{type(e).__name__}: {(str(e).splitlines() or [''])[0]}")
+                return
+            latencies.append(time.perf_counter() - started)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    await asyncio.gather(*(one(i) for i in range(start, start + count)))
+    return latencies, ttfts, errors
+
+
+def _breakdown(summary: List[dict]) -> List[dict]:
+    # Per recorded call kind/name: counts and the p50 of each phase (ms)
+    rows = []
+    for row in summary:
+        phases = {name: round(value["p50"] * 1000, 2) for name, value in row.items() if isinstance(value, dict)}
+        rows.append({
+            "kind": row["kind"],
+            "name": row["name"],
+            "calls": row["calls"],
+            "errors": row["errors"],
+            "retries": row["retries"],
+            "prompt_tokens": row["prompt_tokens"],
+            "completion_tokens": row["completion_tokens"],
+            "cached_tokens": row["cached_tokens"],
+            "cache_hit_rate": row.get("cache_hit_rate", 0.0),
+            "phase_p50_ms": phases,
+        })
+    return rows
+
+
+async def _bench(name: str, call: Callable, args: argparse.Namespace, sink: HistogramSink, counter: List[int]) -> dict:
+    def indices(count: int) -> int:
+        start = counter[0]
+        counter[0] += count
+        return start
+
+    if args.warmup:
+        await _run_calls(call, indices(args.warmup), args.warmup, args.concurrency)
+    sink.reset()
+    gc.collect()
+    with _RssSampler() as rss:
+        started = time.perf_counter()
+        latencies, ttfts, errors = await _run_calls(call, indices(args.iterations), args.iterations, args.concurrency)
+        elapsed = time.perf_counter() - started
+    summary = sink.summary()
+
+    row = {
+        "scenario": name,
+        "calls": args.iterations,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": _distribution_ms(latencies),
+        "ttft_ms": _distribution_ms(ttfts),
+        "rss_start_mib": round((rss.start_bytes or 0) / 2 ** 20, 1),
+        "rss_peak_mib": round(rss.peak_bytes / 2 ** 20, 1),
+        "llm_calls": sum(r["calls"] for r in summary if r["kind"] == "llm"),
+        "retries": sum(r["retries"] for r in summary if r["kind"] == "llm"),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in summary if r["kind"] == "llm"),
+        "cached_tokens": sum(r["cached_tokens"] for r in summary if r["kind"] == "llm"),
+        "breakdown": _breakdown(summary),
+    }
+    row["cache_hit_rate"] = round(row["cached_tokens"] / row["prompt_tokens"], 4) if row["prompt_tokens"] else 0.0
+
+    if args.alloc_iterations:
+        gc.collect()
+        tracemalloc.start()
+        await _run_calls(call, indices(args.alloc_iterations), args.alloc_iterations, args.concurrency)
+        gc.collect()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        row["alloc_peak_kib"] = round(peak / 1024, 1)
+        row["alloc_retained_kib"] = round(retained / 1024, 1)
+    return row
+
+
+# Baseline comparison
+_COMPARED = (
+    ("latency p50", lambda r: (r.get("latency_ms") or {}).get("p50"), False),
+    ("latency p95", lambda r: (r.get("latency_ms") or {}).get("p95"), False),
+    ("throughput", lambda r: r.get("throughput_per_s"), True),
+    ("rss peak", lambda r: r.get("rss_peak_mib"), False),
+    ("alloc peak", lambda r: r.get("alloc_peak_kib"), False),
+)
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> List[dict]:
+    """
+    Regressions of current against baseline: metrics that got worse by more than threshold (a fraction),
+    per scenario present in both.
+    """
+    previous = {row["scenario"]: row for row in baseline.get("scenarios", [])}
+    regressions = []
+    for row in current["scenarios"]:
+        before = previous.get(row["scenario"])
+        if before is None:
+            continue
+        for metric, value_of, higher_is_better in _COMPARED:
+            old, new = value_of(before), value_of(row)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append({"scenario": row["scenario"], "metric": metric, "baseline": old, "current": new, "worse_by": round(change, 3)})
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_KIT_DIR, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _print_table(result: dict) -> None:
+    header = f"{'scenario':<32}{'calls':>6}{'err':>5}{'/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft ms':>9}{'llm':>5}{'retry':>6}{'cache%':>8}{'rss MiB':>9}{'alloc KiB':>11}"
+    print(header)
+    print("-" * len(header))
+    for row in result["scenarios"]:
+        latency = row["latency_ms"] or {}
+        ttft = (row["ttft_ms"] or {}).get("p50", "")
+        print(
+            f"{row['scenario']:<32}{row['calls']:>6}{row['errors']:>5}{row['throughput_per_s']:>8}"
+            f"{latency.get('p50', ''):>9}{latency.get('p95', ''):>9}{latency.get('p99', ''):>9}{ttft:>9}"
+            f"{row['llm_calls']:>5}{row['retries']:>6}{row['cache_hit_rate']:>8.0%}{row['rss_peak_mib']:>9}{row.get('alloc_peak_kib', ''):>11}"
+        )
+    settings = result["settings"]
+    print("-" * len(header))
+    print(
+        f"stub model: {settings['latency']}s to first token, {settings['output_tokens']} tokens at "
+        f"{settings['tokens_per_second']:g} tok/s, 429 probability {settings['rate_limit_probability']}"
+    )
+    for row in result["scenarios"]:
+        if row["first_error"]:
+            print(f"{row['scenario']}: {row['errors']} errors, first: {row['first_error']}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", default=[], help="scenario name or glob (repeatable); default: all")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--alloc-iterations", type=int, default=5, help="calls in the tracemalloc pass (0 skips it)")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--output-tokens", type=int, default=60)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="share of stub calls that return 429")
+    parser.add_argument("--retry-after", type=float, default=0.05)
+    parser.add_argument("--fetch-latency", type=float, default=0.0, help="seconds the fixture server waits per request")
+    parser.add_argument("--keep-rate-limits", action="store_true", help="keep the client-side rate limits from models.yaml")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against results written earlier with --output")
+    parser.add_argument("--threshold", type=float, default=0.15, help="regression threshold as a fraction (0.15 = 15%% worse)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    server = _serve(_KIT_DIR, args.fetch_latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    scenarios = _scenarios(base_url)
+    if args.list:
+        print("\n".join(scenarios))
+        server.shutdown()
+        return
+    if args.scenario:
+        scenarios = {name: call for name, call in scenarios.items() if any(fnmatch.fnmatchcase(name, p) for p in args.scenario)}
+
+    _RANDOM.seed(args.seed)
+    stub = dict(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        rate_limit_probability=args.rate_limit_probability,
+        retry_after=args.retry_after,
+    )
+    llm.factory.init_chat_model = lambda **kwargs: StubChatModel(model_name=kwargs["model"], **stub)
+    tasks._jina_reader_url = lambda url: f"{base_url}/jina/{url.split('/blocked/', 1)[-1]}"
+    # The image and PDF inputs repeat across calls; every call should still reach the model
+    LLM_CONFIG["single_flight"] = False
+    if not args.keep_rate_limits:
+        # Measure the kit, not client-side provider quotas
+        LLM_CONFIG["rate_limits"] = {}
+    # Keep the fetch cache and the learned fetch stats out of the kit directory
+    cache_dir = tempfile.TemporaryDirectory(prefix="llm-bench-")
+    ((LLM_CONFIG.setdefault("http", {})).setdefault("fetch_cache", {}))["path"] = os.path.join(cache_dir.name, "fetch_cache")
+    LLM_CONFIG.setdefault("fetch_strategy", {})["path"] = os.path.join(cache_dir.name, "fetch_stats.json")
+    sink = add_metrics_sink(HistogramSink())
+
+    result = {
+        "suite": "workflow",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("list", "output", "baseline", "json")},
+        "scenarios": [],
+    }
+    counter = [0]
+    try:
+        for name, call in scenarios.items():
+            result["scenarios"].append(await _bench(name, call, args, sink, counter))
+    finally:
+        await aclose_async_client()
+        server.shutdown()
+        cache_dir.cleanup()
+
+    regressions = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), result, args.threshold)
+        result["regressions"] = regressions
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_table(result)
+        if regressions is not None:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%} against {args.baseline}")
+            for r in regressions:
+                print(f"  {r['scenario']:<32}{r['metric']:<14}{r['baseline']:>10} -> {r['current']:<10} ({r['worse_by']:+.0%})")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,7 @@
 from llm.tasks import analyze_text, analyze_image_url, analyze_image_base64, analyze_webpage, analyze_pdf_base64
+from llm.tasks import astream_analyze_text, astream_analyze_webpage
+from llm.http_client import aclose_async_client
+from llm.metrics import format_metrics_summary
 import base64
 import httpx
 
@@ -17,6 +20,20 @@ async def main():
     print("Key objects:", key_objects)
     print("--------------------------------")
 
+    # Stream a text analysis as it is generated
+    async for delta in astream_analyze_text("Streaming shows the first words of a reply while the rest is generated."):
+        print(delta, end="", flush=True)
+    print()
+    print("--------------------------------")
+
+    # Stream a webpage analysis as partial objects (fields fill in as they arrive)
+    async for partial in astream_analyze_webpage(example_webpage_url):
+        print("\rTitle so far:", partial.title or "", end="", flush=True)
+    print()
+    print("Description:", partial.description)
+    print("Key objects:", partial.key_objects)
+    print("--------------------------------")
+
     # Analyze image from URL
     example_image_url = "https://catinaflat.blog/wp-content/uploads/2024/03/happy-cat.jpg"
     description, key_objects = await analyze_image_url(example_image_url)
@@ -48,6 +65,12 @@ async def main():
     description, key_objects = await analyze_pdf_base64(pdf_base64)
     print("Description:", description)
     print("Key objects:", key_objects)
+    print("--------------------------------")
+
+    # Latency, tokens and estimated cost per task and model (see llm.metrics)
+    print(format_metrics_summary())
+
+    await aclose_async_client()
 
 if __name__ == "__main__":
     import asyncio
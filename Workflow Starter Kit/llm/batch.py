@@ -0,0 +1,230 @@
+# llm/batch.py
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, List, Optional, Tuple, Union
+from llm.settings import LLM_CONFIG
+
+if TYPE_CHECKING:
+    from llm.journal import RunJournal
+
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of one batch item. Exactly one of result/error is meaningful.
+    """
+    index: int
+    input: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchStats:
+    """
+    Running counters for a batch; safe to read while the batch is still streaming.
+    """
+    concurrency: int = 0
+    submitted: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    resumed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+
+    @property
+    def completed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Completed items per second."""
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        resumed = f", {self.resumed} from journal" if self.resumed else ""
+        return (
+            f"{self.completed}/{self.submitted} done ({self.failed} failed{resumed}) "
+            f"in {self.elapsed:.1f}s, {self.throughput:.2f} items/s, concurrency={self.concurrency}"
+        )
+
+
+def _task_name_of(task_fn: Callable) -> Optional[str]:
+    # Task functions in llm/tasks.py declare their models.yaml task name as the `task` default
+    try:
+        param = inspect.signature(task_fn).parameters.get("task")
+    except (TypeError, ValueError):
+        return None
+    if param is None or param.default is inspect.Parameter.empty:
+        return None
+    return param.default
+
+
+def get_task_concurrency(task: Optional[str]) -> int:
+    """
+    Get the configured concurrency for a task (models.yaml `concurrency`), falling back to `default_concurrency`
+    """
+    default = LLM_CONFIG.get("default_concurrency", 8)
+    task_cfg = LLM_CONFIG.get(task) if task else None
+    if isinstance(task_cfg, dict):
+        return int(task_cfg.get("concurrency", default))
+    return int(default)
+
+
+def _call(task_fn: Callable[..., Awaitable[Any]], item: Any) -> Awaitable[Any]:
+    # dict -> keyword arguments, tuple -> positional arguments, anything else -> single argument
+    if isinstance(item, dict):
+        return task_fn(**item)
+    if isinstance(item, tuple):
+        return task_fn(*item)
+    return task_fn(item)
+
+
+async def _aiter_inputs(inputs: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+    if hasattr(inputs, "__aiter__"):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
+
+
+async def run_batch(
+    task_fn: Callable[..., Awaitable[Any]],
+    inputs: Union[Iterable[Any], AsyncIterable[Any]],
+    concurrency: Optional[int] = None,
+    ordered: bool = False,
+    stats: Optional[BatchStats] = None,
+    journal: Optional["RunJournal"] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Run an async task function over many inputs with bounded concurrency, streaming BatchResults.
+
+    Inputs are consumed lazily, so arbitrarily large (or async) iterables are fine. Each item is a dict of
+    keyword arguments, a tuple of positional arguments, or a single positional argument. Failures are
+    captured per item and never abort the batch. With ordered=True results are yielded in input order,
+    otherwise in completion order. Pass a BatchStats to observe progress and throughput.
+
+    With a journal (llm.journal.get_run_journal), every finished item is recorded, and items the journal
+    already has a result for are returned from it without calling the task again, so rerunning a crashed run
+    with the same run id only does the remaining and failed items.
+    """
+    if journal is not None:
+        # Imported here so batches without a journal don't load SQLAlchemy
+        from llm.journal import input_key
+    if concurrency is None:
+        concurrency = get_task_concurrency(_task_name_of(task_fn))
+    concurrency = max(1, int(concurrency))
+    stats = stats if stats is not None else BatchStats()
+    stats.concurrency = concurrency
+    stats.started_at = time.perf_counter()
+
+    # The window bounds items that are running or finished-but-not-yet-yielded, so a slow
+    # head-of-line item in ordered mode cannot make the reorder buffer grow without limit
+    window = asyncio.Semaphore(concurrency * 4)
+    results: asyncio.Queue = asyncio.Queue()
+    source = _aiter_inputs(inputs)
+    source_lock = asyncio.Lock()
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal next_index
+        while True:
+            await window.acquire()
+            async with source_lock:
+                try:
+                    item = await source.__anext__()
+                except StopAsyncIteration:
+                    window.release()
+                    return
+                index = next_index
+                next_index += 1
+                stats.submitted += 1
+            key = input_key(task_fn, item) if journal is not None else None
+            if key is not None and journal.completed(key):
+                stats.resumed += 1
+                await results.put(BatchResult(index, item, result=journal.result(key)))
+                continue
+            started = time.perf_counter()
+            try:
+                value = await _call(task_fn, item)
+                outcome = BatchResult(index, item, result=value, elapsed=time.perf_counter() - started)
+            except Exception as e:
+                outcome = BatchResult(index, item, error=e, elapsed=time.perf_counter() - started)
+            if key is not None and journal.record(key, index, outcome.result, outcome.error, outcome.elapsed):
+                await asyncio.to_thread(journal.flush)
+            await results.put(outcome)
+
+    async def supervise() -> None:
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for w in workers:
+                w.cancel()
+            raise
+        finally:
+            results.put_nowait(None)
+
+    def record(outcome: BatchResult) -> BatchResult:
+        if outcome.ok:
+            stats.succeeded += 1
+        else:
+            stats.failed += 1
+        window.release()
+        return outcome
+
+    supervisor = asyncio.ensure_future(supervise())
+    pending: dict = {}
+    expected = 0
+    try:
+        while True:
+            outcome = await results.get()
+            if outcome is None:
+                break
+            if not ordered:
+                yield record(outcome)
+                continue
+            pending[outcome.index] = outcome
+            while expected in pending:
+                yield record(pending.pop(expected))
+                expected += 1
+        # Surface errors raised by the input iterable itself
+        await supervisor
+    finally:
+        stats.finished_at = time.perf_counter()
+        if not supervisor.done():
+            supervisor.cancel()
+            try:
+                await supervisor
+            except (asyncio.CancelledError, Exception):
+                pass
+        if journal is not None:
+            await asyncio.to_thread(journal.flush)
+
+
+async def gather_batch(
+    task_fn: Callable[..., Awaitable[Any]],
+    inputs: Union[Iterable[Any], AsyncIterable[Any]],
+    concurrency: Optional[int] = None,
+    journal: Optional["RunJournal"] = None,
+) -> Tuple[List[BatchResult], BatchStats]:
+    """
+    Run a whole batch and return (results in input order, stats).
+    """
+    stats = BatchStats()
+    results = [r async for r in run_batch(task_fn, inputs, concurrency=concurrency, ordered=True, stats=stats, journal=journal)]
+    return results, stats
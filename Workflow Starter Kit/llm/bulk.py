@@ -0,0 +1,609 @@
+# llm/bulk.py
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, Optional, Union
+
+from langchain_core.messages import convert_to_messages
+from langchain_core.utils.function_calling import convert_to_openai_function
+
+from llm.batch import BatchResult, _aiter_inputs, _task_name_of, get_task_concurrency, run_batch
+from llm.factory import get_structured_llm_for
+from llm.managed import ManagedChatModel
+from llm.routing import RoutedChatModel
+from llm.settings import LLM_CONFIG
+from llm.tasks import BULK_TASKS
+
+_BULK_CONFIG = LLM_CONFIG.get("bulk") or {}
+
+# Progress of prepare/submit/poll; configure logging (e.g. logging.basicConfig(level=logging.INFO)) to see it
+_logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS = "/v1/chat/completions"
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class BulkStatus:
+    """
+    State of one submitted batch as reported by its provider: in_progress, or one of TERMINAL_STATES.
+    """
+    state: str
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+
+class BatchProvider:
+    """
+    An asynchronous batch endpoint. Request files are JSONL with one {"custom_id", "method", "url", "body"}
+    line per request; result files are JSONL with one {"custom_id", "response": {"status_code", "body"},
+    "error"} line per request (the OpenAI Batch API format).
+    """
+
+    name = "batch"
+
+    async def submit(self, path: str, endpoint: str, metadata: dict) -> str:
+        """Upload a request file and start a batch; returns the batch id."""
+        raise NotImplementedError
+
+    async def find(self, metadata: dict) -> Optional[str]:
+        """Return the id of an already submitted batch carrying this metadata, if any (resuming after a crash)."""
+        return None
+
+    async def status(self, batch_id: str) -> BulkStatus:
+        raise NotImplementedError
+
+    async def download(self, batch_id: str, path: str) -> None:
+        """Write a finished batch's results, including per-request errors, to path as JSONL."""
+        raise NotImplementedError
+
+    async def cancel(self, batch_id: str) -> None:
+        raise NotImplementedError
+
+
+class OpenAIBatchProvider(BatchProvider):
+    """
+    The OpenAI Batch API: about half the price of live calls, with results within completion_window.
+    """
+
+    name = "openai"
+
+    def __init__(self, client: Any = None, completion_window: str = "24h", find_limit: int = 500):
+        if client is None:
+            from openai import AsyncOpenAI
+
+            client = AsyncOpenAI()
+        self.client = client
+        self.completion_window = completion_window
+        self.find_limit = find_limit
+
+    async def submit(self, path: str, endpoint: str, metadata: dict) -> str:
+        with open(path, "rb") as f:
+            uploaded = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window,
+            metadata=metadata,
+        )
+        return batch.id
+
+    async def find(self, metadata: dict) -> Optional[str]:
+        # Batches are listed newest first; only recent ones can belong to an interrupted submit
+        seen = 0
+        async for batch in self.client.batches.list(limit=100):
+            if batch.metadata and all(batch.metadata.get(k) == v for k, v in metadata.items()):
+                return batch.id
+            seen += 1
+            if seen >= self.find_limit:
+                break
+        return None
+
+    async def status(self, batch_id: str) -> BulkStatus:
+        batch = await self.client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        errors = batch.errors.data if batch.errors and batch.errors.data else []
+        # validating / finalizing / cancelling are still in flight
+        state = batch.status if batch.status in TERMINAL_STATES else "in_progress"
+        return BulkStatus(
+            state,
+            counts.total if counts else 0,
+            counts.completed if counts else 0,
+            counts.failed if counts else 0,
+            "; ".join(e.message or e.code or "" for e in errors) or None,
+        )
+
+    async def download(self, batch_id: str, path: str) -> None:
+        batch = await self.client.batches.retrieve(batch_id)
+        with open(path, "wb") as out:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                last = b"\n"
+                async with self.client.files.with_streaming_response.content(file_id) as response:
+                    async for chunk in response.iter_bytes():
+                        out.write(chunk)
+                        last = chunk[-1:] or last
+                if last != b"\n":
+                    out.write(b"\n")
+
+    async def cancel(self, batch_id: str) -> None:
+        await self.client.batches.cancel(batch_id)
+
+
+class LocalBatchProvider(BatchProvider):
+    """
+    File-based stand-in for a batch endpoint, for tests and development. Batches are kept under directory and
+    survive restarts. A batch runs on the first status check at least delay_seconds after submission: each
+    request body goes to respond (default: the live chat completions endpoint of the OpenAI client, so
+    OPENAI_BASE_URL applies), concurrency at a time.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        directory: str,
+        respond: Optional[Callable[[dict], Awaitable[dict]]] = None,
+        delay_seconds: float = 0.0,
+        concurrency: int = 8,
+    ):
+        self.directory = directory
+        self.respond = respond or self._respond_live
+        self.delay_seconds = delay_seconds
+        self.concurrency = concurrency
+        self._client = None
+        os.makedirs(directory, exist_ok=True)
+
+    async def _respond_live(self, body: dict) -> dict:
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI()
+        completion = await self._client.chat.completions.create(**body)
+        return completion.model_dump()
+
+    def _path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.directory, batch_id, name)
+
+    def _load(self, batch_id: str) -> dict:
+        with open(self._path(batch_id, "state.json")) as f:
+            return json.load(f)
+
+    def _save(self, batch_id: str, state: dict) -> None:
+        path = self._path(batch_id, "state.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    async def submit(self, path: str, endpoint: str, metadata: dict) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:16]}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        await asyncio.to_thread(shutil.copyfile, path, self._path(batch_id, "input.jsonl"))
+        self._save(batch_id, {"state": "in_progress", "endpoint": endpoint, "metadata": metadata, "submitted_at": time.time()})
+        return batch_id
+
+    async def find(self, metadata: dict) -> Optional[str]:
+        for batch_id in sorted(os.listdir(self.directory)):
+            try:
+                state = self._load(batch_id)
+            except (OSError, ValueError):
+                continue
+            if all(state["metadata"].get(k) == v for k, v in metadata.items()):
+                return batch_id
+        return None
+
+    async def _answer(self, line: str, semaphore: asyncio.Semaphore) -> dict:
+        request = json.loads(line)
+        async with semaphore:
+            try:
+                body = await self.respond(request["body"])
+                return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+            except Exception as e:
+                return {"custom_id": request["custom_id"], "response": None, "error": {"code": type(e).__name__, "message": str(e)}}
+
+    async def _run(self, batch_id: str, state: dict) -> dict:
+        with open(self._path(batch_id, "input.jsonl"), encoding="utf-8") as f:
+            lines = [line for line in f if line.strip()]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        answers = await asyncio.gather(*(self._answer(line, semaphore) for line in lines))
+        output = self._path(batch_id, "output.jsonl")
+        with open(output + ".tmp", "w", encoding="utf-8") as f:
+            for answer in answers:
+                f.write(json.dumps(answer, ensure_ascii=False) + "\n")
+        os.replace(output + ".tmp", output)
+        failed = sum(answer["error"] is not None for answer in answers)
+        state = {**state, "state": "completed", "total": len(answers), "completed": len(answers) - failed, "failed": failed}
+        self._save(batch_id, state)
+        return state
+
+    async def status(self, batch_id: str) -> BulkStatus:
+        state = self._load(batch_id)
+        if state["state"] == "in_progress" and time.time() >= state["submitted_at"] + self.delay_seconds:
+            state = await self._run(batch_id, state)
+        return BulkStatus(state["state"], state.get("total", 0), state.get("completed", 0), state.get("failed", 0))
+
+    async def download(self, batch_id: str, path: str) -> None:
+        output = self._path(batch_id, "output.jsonl")
+        if os.path.exists(output):
+            await asyncio.to_thread(shutil.copyfile, output, path)
+        else:
+            open(path, "w").close()
+
+    async def cancel(self, batch_id: str) -> None:
+        state = self._load(batch_id)
+        if state["state"] == "in_progress":
+            self._save(batch_id, {**state, "state": "cancelled"})
+
+
+def get_batch_provider(provider: Optional[str] = None) -> BatchProvider:
+    """
+    Get the batch provider for a models.yaml provider name; bulk.provider overrides it ("local" runs batches
+    with LocalBatchProvider under bulk.directory)
+    """
+    provider = _BULK_CONFIG.get("provider") or provider
+    if provider == "local":
+        return LocalBatchProvider(os.path.join(_BULK_CONFIG.get("directory", ".bulk_jobs"), "_local_batches"))
+    if provider == "openai":
+        return OpenAIBatchProvider(completion_window=str(_BULK_CONFIG.get("completion_window", "24h")))
+    raise ValueError(f"No batch provider for '{provider}'; set bulk.provider in models.yaml or pass provider=")
+
+
+def _request_model(structured: Any) -> tuple[Any, dict]:
+    """
+    Return the provider chat model behind a structured-output runnable and its structured-output request kwargs
+    """
+    model = structured.first.bound
+    if isinstance(model, RoutedChatModel):
+        # Batches go to the primary model; fallbacks only apply to live calls
+        model = model.models[0]
+    if isinstance(model, ManagedChatModel):
+        model = model.model
+    kwargs = {k: v for k, v in structured.first.kwargs.items() if not k.startswith("ls_")}
+    return model, kwargs
+
+
+def _response_format(schema: type) -> dict:
+    """
+    Build the json_schema response_format for a Pydantic schema, as the OpenAI SDK sends it for live structured-output calls
+    """
+    function = convert_to_openai_function(schema, strict=True)
+    json_schema = {"name": function["name"], "schema": function["parameters"], "strict": True}
+    if function.get("description"):
+        json_schema["description"] = function["description"]
+    return {"type": "json_schema", "json_schema": json_schema}
+
+
+def parse_structured(body: dict, schema: Any) -> Any:
+    """
+    Map a chat completion response body to the schema (JSON content, or the first tool call's arguments)
+    """
+    message = body["choices"][0]["message"]
+    if message.get("refusal"):
+        raise ValueError(f"Model refused: {message['refusal']}")
+    tool_calls = message.get("tool_calls")
+    if tool_calls:
+        return schema.model_validate_json(tool_calls[0]["function"]["arguments"])
+    return schema.model_validate_json(message.get("content") or "")
+
+
+def _result_error(line: dict) -> Optional[Exception]:
+    error = line.get("error")
+    response = line.get("response") or {}
+    if error:
+        return RuntimeError(f"{error.get('code')}: {error.get('message')}")
+    if response.get("status_code") != 200:
+        body_error = (response.get("body") or {}).get("error") or {}
+        return RuntimeError(f"HTTP {response.get('status_code')}: {body_error.get('message', 'request failed')}")
+    return None
+
+
+class BulkJob:
+    """
+    A resumable bulk run of one task function (see llm.tasks.BULK_TASKS) through a provider batch API.
+
+    Inputs are prepared concurrently (fetches, and live map steps for inputs too long for one call) into JSONL
+    request shards, which are submitted as soon as they are sealed, polled until done, downloaded, and mapped
+    back to the task's schema. All state lives in directory (manifest.json, request shards, results) and is
+    checkpointed as the job runs: opening the same directory again, with the same inputs in the same order,
+    continues where the previous run stopped without re-preparing or re-submitting anything.
+    """
+
+    def __init__(self, task_fn: Callable, directory: str, provider: Optional[BatchProvider] = None, task: Optional[str] = None):
+        if task_fn not in BULK_TASKS:
+            raise ValueError(f"{getattr(task_fn, '__name__', task_fn)} has no bulk mode (see llm.tasks.BULK_TASKS)")
+        self.schema, self.build_messages = BULK_TASKS[task_fn]
+        self.task = task or _task_name_of(task_fn)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._model, self._kwargs = _request_model(get_structured_llm_for(self.task, self.schema))
+        model_name = getattr(self._model, "model_name", None) or getattr(self._model, "model", None)
+        self.manifest = self._load() or {
+            "job_id": uuid.uuid4().hex,
+            "task": self.task,
+            "function": task_fn.__name__,
+            "model": model_name,
+            "endpoint": CHAT_COMPLETIONS,
+            "prepared": 0,
+            "complete": False,
+            "partial": None,
+            "shards": [],
+        }
+        provider_name = (LLM_CONFIG.get("available_models", {}).get(model_name) or {}).get("provider")
+        self.provider = provider or get_batch_provider(provider_name)
+        self._save()
+
+    # State
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self) -> Optional[dict]:
+        try:
+            with open(self._path("manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save(self) -> None:
+        # Written atomically: the manifest is the checkpoint a resumed run starts from
+        path = self._path("manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def _request_line(self, index: int, messages: list) -> str:
+        body = self._model._get_request_payload(convert_to_messages(messages), **self._kwargs)
+        body.pop("stream", None)
+        if isinstance(body.get("response_format"), type):
+            body["response_format"] = _response_format(body["response_format"])
+        request = {"custom_id": str(index), "method": "POST", "url": self.manifest["endpoint"], "body": body}
+        return json.dumps(request, ensure_ascii=False) + "\n"
+
+    # Prepare
+    def _resume_partial(self):
+        # Reopen the shard being written, cut back to its last checkpoint
+        partial = self.manifest["partial"]
+        path = self._path(partial["file"] + ".partial")
+        f = open(path, "a+b")
+        f.truncate(partial["bytes"])
+        f.seek(partial["bytes"])
+        return f
+
+    def _new_partial(self):
+        number = len(self.manifest["shards"])
+        self.manifest["partial"] = {"file": f"requests-{number:05d}.jsonl", "first_index": self.manifest["prepared"], "count": 0, "requests": 0, "bytes": 0}
+        return open(self._path(self.manifest["partial"]["file"] + ".partial"), "wb")
+
+    def _checkpoint(self, f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+        self.manifest["partial"]["bytes"] = f.tell()
+        self._save()
+
+    def _seal(self, f) -> dict:
+        self._checkpoint(f)
+        f.close()
+        partial = self.manifest["partial"]
+        os.replace(self._path(partial["file"] + ".partial"), self._path(partial["file"]))
+        shard = {
+            "file": partial["file"],
+            "first_index": partial["first_index"],
+            "end_index": partial["first_index"] + partial["count"],
+            "requests": partial["requests"],
+            "batch_id": None,
+            "state": "prepared",
+            "results": None,
+        }
+        self.manifest["shards"].append(shard)
+        self.manifest["prepared"] = shard["end_index"]
+        self.manifest["partial"] = None
+        self._save()
+        return shard
+
+    def _record_failure(self, index: int, error: BaseException) -> None:
+        with open(self._path("failures.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps({"index": index, "error": f"{type(error).__name__}: {error}"}) + "\n")
+
+    def _drop_failures_from(self, index: int) -> None:
+        # Failures past the checkpoint are recorded again when those inputs are re-prepared
+        path = self._path("failures.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            kept = [line for line in f if line.strip() and json.loads(line)["index"] < index]
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(path + ".tmp", path)
+
+    async def prepare(self, inputs: Union[Iterable[Any], AsyncIterable[Any]], concurrency: Optional[int] = None, submit: bool = True) -> None:
+        """
+        Turn inputs (items as for llm.batch.run_batch) into request shards, skipping inputs prepared by an
+        earlier run. With submit=True each shard is submitted as soon as it is sealed.
+        """
+        if self.manifest["complete"]:
+            return
+        max_requests = int(_BULK_CONFIG.get("max_requests_per_file", 50000))
+        max_bytes = int(_BULK_CONFIG.get("max_file_bytes", 190000000))
+        checkpoint_every = int(_BULK_CONFIG.get("checkpoint_every", 1000))
+        f = self._resume_partial() if self.manifest["partial"] else self._new_partial()
+        skip = self.manifest["prepared"] + self.manifest["partial"]["count"]
+        self._drop_failures_from(skip)
+        _logger.info("[%s] Preparing bulk requests%s", self.task, f" (resuming after {skip} inputs)" if skip else "")
+
+        async def remaining() -> AsyncIterator[Any]:
+            position = 0
+            async for item in _aiter_inputs(inputs):
+                if position >= skip:
+                    yield item
+                position += 1
+
+        concurrency = concurrency or int(_BULK_CONFIG.get("prepare_concurrency") or get_task_concurrency(self.task))
+        submissions = []
+        try:
+            async for outcome in run_batch(self.build_messages, remaining(), concurrency=concurrency, ordered=True):
+                partial = self.manifest["partial"]
+                index = skip + outcome.index
+                if outcome.ok:
+                    f.write(self._request_line(index, outcome.result).encode("utf-8"))
+                    partial["requests"] += 1
+                else:
+                    self._record_failure(index, outcome.error)
+                partial["count"] += 1
+                if partial["requests"] >= max_requests or f.tell() >= max_bytes:
+                    shard = self._seal(f)
+                    if submit:
+                        submissions.append(asyncio.ensure_future(self._submit(shard)))
+                    f = self._new_partial()
+                elif partial["count"] % checkpoint_every == 0:
+                    self._checkpoint(f)
+            if self.manifest["partial"]["count"]:
+                shard = self._seal(f)
+                if submit:
+                    submissions.append(asyncio.ensure_future(self._submit(shard)))
+            else:
+                f.close()
+                os.remove(self._path(self.manifest["partial"]["file"] + ".partial"))
+                self.manifest["partial"] = None
+            self.manifest["complete"] = True
+            self._save()
+        finally:
+            if not f.closed:
+                self._checkpoint(f)
+                f.close()
+            if submissions:
+                await asyncio.gather(*submissions)
+        _logger.info("[%s] Prepared %d inputs into %d request files", self.task, self.manifest["prepared"], len(self.manifest["shards"]))
+
+    # Submit / wait
+    async def _submit(self, shard: dict) -> None:
+        if shard["batch_id"] or not shard["requests"]:
+            return
+        metadata = {"bulk_job": self.manifest["job_id"], "shard": shard["file"]}
+        # A crash between submitting and saving the id would otherwise submit (and pay for) the shard twice
+        shard["batch_id"] = await self.provider.find(metadata) or await self.provider.submit(self._path(shard["file"]), self.manifest["endpoint"], metadata)
+        shard["state"] = "submitted"
+        self._save()
+        _logger.info("[%s] Submitted %s (%d requests) as %s", self.task, shard["file"], shard["requests"], shard["batch_id"])
+
+    async def submit(self) -> None:
+        """Submit every sealed shard that has not been submitted yet."""
+        for shard in self.manifest["shards"]:
+            await self._submit(shard)
+
+    async def _collect(self, shard: dict) -> bool:
+        # Poll one shard; download its results once the batch is done. Returns True when the shard is finished
+        if shard["results"]:
+            return True
+        if not shard["batch_id"]:
+            return not shard["requests"]
+        status = await self.provider.status(shard["batch_id"])
+        shard["status"] = {"state": status.state, "total": status.total, "completed": status.completed, "failed": status.failed}
+        if not status.done:
+            return False
+        results = shard["file"].replace("requests-", "results-")
+        await self.provider.download(shard["batch_id"], self._path(results + ".tmp"))
+        os.replace(self._path(results + ".tmp"), self._path(results))
+        shard["state"] = status.state
+        shard["results"] = results
+        if status.error:
+            shard["error"] = status.error
+        self._save()
+        _logger.info("[%s] %s: %s (%d ok, %d failed)", self.task, shard["file"], status.state, status.completed, status.failed)
+        return True
+
+    async def wait(self, poll_interval: Optional[float] = None) -> None:
+        """Poll submitted shards until every batch has finished and its results are downloaded."""
+        poll_interval = float(poll_interval if poll_interval is not None else _BULK_CONFIG.get("poll_interval_seconds", 60))
+        while True:
+            finished = await asyncio.gather(*(self._collect(shard) for shard in self.manifest["shards"]))
+            self._save()
+            if all(finished):
+                return
+            await asyncio.sleep(poll_interval)
+
+    async def cancel(self) -> None:
+        """Cancel every batch still running."""
+        for shard in self.manifest["shards"]:
+            if shard["batch_id"] and not shard["results"]:
+                await self.provider.cancel(shard["batch_id"])
+
+    # Results
+    def progress(self) -> dict:
+        shards = self.manifest["shards"]
+        return {
+            "prepared": self.manifest["prepared"] + (self.manifest["partial"] or {}).get("count", 0),
+            "complete": self.manifest["complete"],
+            "shards": len(shards),
+            "submitted": sum(bool(s["batch_id"]) for s in shards),
+            "finished": sum(bool(s["results"]) for s in shards),
+        }
+
+    async def results(self) -> AsyncIterator[BatchResult]:
+        """
+        Yield a BatchResult per prepared input (index = position in inputs, result = a schema instance), in
+        no particular order. Inputs that failed to prepare or whose request failed carry the error.
+        """
+        failures = {}
+        if os.path.exists(self._path("failures.jsonl")):
+            with open(self._path("failures.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        failure = json.loads(line)
+                        failures[failure["index"]] = failure["error"]
+        for index, error in sorted(failures.items()):
+            yield BatchResult(index, None, error=RuntimeError(f"Preparing the request failed: {error}"))
+        for shard in self.manifest["shards"]:
+            seen = set()
+            if shard["results"]:
+                with open(self._path(shard["results"]), encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        item = json.loads(line)
+                        index = int(item["custom_id"])
+                        seen.add(index)
+                        error = _result_error(item)
+                        if error is None:
+                            try:
+                                yield BatchResult(index, None, result=parse_structured(item["response"]["body"], self.schema))
+                                continue
+                            except Exception as e:
+                                error = e
+                        yield BatchResult(index, None, error=error)
+            missing = f"no result in batch ({shard.get('state')})" if shard["results"] else "batch not finished"
+            for index in range(shard["first_index"], shard["end_index"]):
+                if index not in seen and index not in failures:
+                    yield BatchResult(index, None, error=RuntimeError(missing))
+
+
+async def run_bulk(
+    task_fn: Callable,
+    inputs: Union[Iterable[Any], AsyncIterable[Any]],
+    directory: Optional[str] = None,
+    provider: Optional[BatchProvider] = None,
+    poll_interval: Optional[float] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Run a task function (analyze_text, analyze_webpage, ...) over inputs through the provider's Batch API and
+    yield BatchResults whose result is the task's schema (e.g. AnalyzeWebpageSchema). Resumable: calling it
+    again with the same directory and inputs picks up after a crash. directory defaults to
+    <bulk.directory>/<task name>.
+    """
+    directory = directory or os.path.join(_BULK_CONFIG.get("directory", ".bulk_jobs"), _task_name_of(task_fn) or task_fn.__name__)
+    job = BulkJob(task_fn, directory, provider)
+    await job.prepare(inputs)
+    await job.submit()
+    await job.wait(poll_interval)
+    async for result in job.results():
+        yield result
@@ -0,0 +1,212 @@
+# llm/extract.py
+import re
+from html import unescape
+from html.parser import HTMLParser
+from typing import List
+
+from llm.settings import LLM_CONFIG
+
+_EXTRACTION_CONFIG = LLM_CONFIG.get("extraction") or {}
+
+# Elements whose content is never readable text
+_SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "canvas", "object", "embed", "head", "select", "button"}
+# Page chrome that rarely carries the main content
+_BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form", "dialog"}
+_BOILERPLATE_HINTS = re.compile(
+    r"(^|[\s_-])(nav|navbar|menu|footer|header|sidebar|breadcrumb|cookie|consent|banner|advert|ads?|promo|share|social|subscribe|newsletter|related|comments?|popup|modal)([\s_-]|$)",
+    re.IGNORECASE,
+)
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "br", "hr", "li", "ul", "ol", "table", "tr", "blockquote",
+    "pre", "h1", "h2", "h3", "h4", "h5", "h6", "figure", "figcaption", "dl", "dt", "dd",
+}
+_VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+_LINE_TAGS = {"li", "tr", "dt", "dd"}
+# Marks preformatted blocks so _tidy leaves their whitespace alone
+_PRE_MARK = "\x02"
+
+
+class _ReadableTextParser(HTMLParser):
+    def __init__(self, markdown: bool):
+        super().__init__(convert_charrefs=True)
+        self.markdown = markdown
+        self.title = ""
+        self._in_title = False
+        self._skip_depth = 0
+        self._stack: List[tuple] = []
+        # Separate buffers so <article>/<main> content can be preferred over the whole body
+        self._all: List[str] = []
+        self._main: List[str] = []
+        self._main_depth = 0
+        self._pre_depth = 0
+        self._lists: List[list] = []
+
+    def _emit(self, text: str) -> None:
+        self._all.append(text)
+        if self._main_depth:
+            self._main.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._in_title = True
+        if tag in _VOID_TAGS:
+            if tag in ("br", "hr") and not self._skip_depth:
+                self._emit("\n")
+            return
+        attributes = dict(attrs)
+        hint = f"{attributes.get('class') or ''} {attributes.get('id') or ''} {attributes.get('role') or ''}"
+        skip = (
+            tag in _SKIP_TAGS
+            or tag in _BOILERPLATE_TAGS
+            or attributes.get("aria-hidden") == "true"
+            or "hidden" in attributes
+            or bool(_BOILERPLATE_HINTS.search(hint))
+        )
+        main = tag in ("article", "main") or attributes.get("role") == "main"
+        self._stack.append((tag, skip, main))
+        if skip:
+            self._skip_depth += 1
+        if main:
+            self._main_depth += 1
+        if self._skip_depth:
+            return
+        if tag in _BLOCK_TAGS:
+            self._emit("\n" if tag in _LINE_TAGS else "\n\n")
+        if tag == "pre":
+            self._pre_depth += 1
+            self._emit(f"{_PRE_MARK}\n")
+        elif tag in ("ul", "ol"):
+            self._lists.append([tag, 0])
+        if self.markdown:
+            if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+                self._emit("#" * int(tag[1]) + " ")
+            elif tag == "li":
+                if self._lists and self._lists[-1][0] == "ol":
+                    self._lists[-1][1] += 1
+                    self._emit(f"{self._lists[-1][1]}. ")
+                else:
+                    self._emit("- ")
+            elif tag == "blockquote":
+                self._emit("> ")
+        if tag in ("td", "th"):
+            self._emit(" | ")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        if tag in _VOID_TAGS:
+            return
+        # Tolerate unclosed tags: pop back to the matching opener
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                for _, skip, main in reversed(self._stack[i:]):
+                    if skip:
+                        self._skip_depth -= 1
+                    if main:
+                        self._main_depth -= 1
+                del self._stack[i:]
+                break
+        else:
+            return
+        if self._skip_depth:
+            return
+        if tag == "pre":
+            self._pre_depth = max(0, self._pre_depth - 1)
+            self._emit(f"\n{_PRE_MARK}")
+        elif tag in ("ul", "ol") and self._lists:
+            self._lists.pop()
+        if tag in _BLOCK_TAGS and tag not in _LINE_TAGS:
+            self._emit("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+            return
+        if self._skip_depth:
+            return
+        self._emit(data if self._pre_depth else re.sub(r"\s+", " ", data))
+
+    def result(self) -> str:
+        main = _tidy("".join(self._main), self.markdown)
+        body = _tidy("".join(self._all), self.markdown)
+        # Prefer the marked-up main content unless it is implausibly small next to the page body
+        return main if main and len(main) >= 0.25 * len(body) else body
+
+
+def _tidy(text: str, markdown: bool) -> str:
+    out: List[str] = []
+    in_pre = False
+    for raw in text.split("\n"):
+        if raw.strip() == _PRE_MARK:
+            in_pre = not in_pre
+            if markdown:
+                out.append("```")
+            continue
+        if in_pre:
+            out.append(raw.replace(_PRE_MARK, "").rstrip())
+            continue
+        line = raw.replace(_PRE_MARK, "").strip()
+        if line in ("-", ">", "|") or re.fullmatch(r"#+|\d+\.", line or "x"):
+            continue
+        if not line:
+            if out and out[-1] != "":
+                out.append("")
+            continue
+        out.append(line)
+    return "\n".join(out).strip()
+
+
+def looks_like_html(text: str) -> bool:
+    """
+    Cheap sniff for HTML markup in the first few KB of a response body.
+    """
+    head = text[:4096].lower()
+    return "<html" in head or "<body" in head or "<!doctype html" in head or head.count("<div") + head.count("<p") >= 3
+
+
+def html_to_text(html: str, output: str = "markdown", include_title: bool = True) -> str:
+    """
+    Extract the readable content of an HTML page as compact markdown (or plain text).
+
+    Scripts, styles and other non-content elements are dropped, as are nav/header/footer/aside blocks and
+    elements whose class/id mark them as menus, ads, cookie banners, etc. <article>/<main> content is
+    preferred when present.
+    """
+    parser = _ReadableTextParser(markdown=(output == "markdown"))
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # html.parser is lenient, but never let extraction fail a fetch
+        pass
+    text = parser.result()
+    title = unescape(re.sub(r"\s+", " ", parser.title)).strip()
+    first_line = text.split("\n", 1)[0].lstrip("# ").strip()
+    if include_title and title and not (first_line and first_line in title):
+        text = (f"# {title}\n\n" if output == "markdown" else f"{title}\n\n") + text
+    return text
+
+
+def extraction_enabled(raw_html: bool = False) -> bool:
+    return not raw_html and bool(_EXTRACTION_CONFIG.get("enabled", True))
+
+
+def html_read_chars(max_chars: int, raw_html: bool = False) -> int:
+    """
+    How many characters of the response body to read for a page that will be cut to max_chars.
+    Extraction needs the whole document (the article often starts after long <head>/nav markup).
+    """
+    if not extraction_enabled(raw_html):
+        return max_chars
+    return max(max_chars, int(_EXTRACTION_CONFIG.get("max_html_chars", 1000000)))
+
+
+def readable_text(body: str, max_chars: int, raw_html: bool = False) -> str:
+    """
+    Return at most max_chars of model-ready text: extracted content for HTML bodies, the body itself
+    otherwise (plain text, Jina Reader output) or when raw_html is requested.
+    """
+    max_chars = max(0, max_chars)
+    if not extraction_enabled(raw_html) or not looks_like_html(body):
+        return body[:max_chars]
+    return html_to_text(body, output=_EXTRACTION_CONFIG.get("output", "markdown"))[:max_chars]
@@ -1,57 +1,185 @@
 # llm/factory.py
+import logging
 import os
+from typing import TYPE_CHECKING, Any, Callable, List
 from dotenv import load_dotenv
-from langchain.chat_models import init_chat_model
 from llm.settings import LLM_CONFIG
+from llm.pool import ModelPool
+from llm.ratelimit import get_rate_limiter
+
+if TYPE_CHECKING:
+    from llm.routing import RoutedChatModel
 
 load_dotenv()
 
-def get_llm_for(task: str = "default", **overrides):
+_logger = logging.getLogger(__name__)
+
+# Constructed models are pooled so tasks reuse provider clients and their connections
+_MODEL_POOL = ModelPool(max_size=LLM_CONFIG.get("model_pool_size", 32))
+
+# Task settings an override may change; everything else about a model comes from available_models
+_OVERRIDABLE = ("model_name", "max_retries", "fallbacks")
+
+
+def _resolve_model_config(task: str, overrides: dict) -> tuple[tuple, dict]:
     """
-    Get langchain chat model for a given task
+    Resolve a task (plus overrides) into a hashable pool key and the init_chat_model arguments
     """
-    # Get max retries
-    max_retries = LLM_CONFIG.get("max_retries", 3)
-    
+    unknown = sorted(set(overrides) - set(_OVERRIDABLE))
+    if unknown:
+        raise ValueError(f"Unsupported override(s) {unknown} for task '{task}'; supported: {list(_OVERRIDABLE)}")
+
     # Get task config
-    task_cfg = LLM_CONFIG.get(task, LLM_CONFIG["default"]).copy()    
+    task_cfg = LLM_CONFIG.get(task, LLM_CONFIG["default"]).copy()
     task_cfg.update(overrides)
     model_name = task_cfg["model_name"]
-    
+
+    # Get max retries
+    max_retries = task_cfg.get("max_retries", LLM_CONFIG.get("max_retries", 3))
+
     # Lookup provider/temperature/reasoning_effort for the task's model
-    provider = (
-        LLM_CONFIG
-        .get("available_models", {})
-        .get(model_name, {})
-        .get("provider")
-    )
-    temperature = (
-        LLM_CONFIG
-        .get("available_models", {})
-        .get(model_name, {})
-        .get("temperature")
-    )
-    reasoning_effort = (
-        LLM_CONFIG
-        .get("available_models", {})
-        .get(model_name, {})
-        .get("reasoning_effort")
-    )
+    model_cfg = LLM_CONFIG.get("available_models", {}).get(model_name, {})
+    provider = model_cfg.get("provider")
+    temperature = model_cfg.get("temperature")
+    reasoning_effort = model_cfg.get("reasoning_effort")
     assert provider is not None, f"No provider configured for model '{model_name}'"
 
-    # Return model with reasoning_effort if provided, otherwise return model without reasoning_effort (and multimodal if provided)
+    # Only pass reasoning_effort if provided
+    init_kwargs = {
+        "model_provider": provider,
+        "temperature": temperature,
+        "max_retries": max_retries,
+    }
     if reasoning_effort:
-        return init_chat_model(
-            model_name,
-            model_provider=provider,
-            reasoning_effort=reasoning_effort,
-            temperature=temperature,
-            max_retries=max_retries,
-        )
-    else:
-        return init_chat_model(
-            model_name,
-            model_provider=provider,
-            temperature=temperature,
-            max_retries=max_retries,
-        )
\ No newline at end of file
+        init_kwargs["reasoning_effort"] = reasoning_effort
+    # OpenAI-compatible models only report token usage (and its cached part) on streams when asked to
+    if provider in ("openai", "xai"):
+        init_kwargs["stream_usage"] = True
+
+    # Covers every init_chat_model argument, so equal keys build the same model (fallbacks are keyed by _resolve)
+    key = (model_name, provider, temperature, reasoning_effort, max_retries)
+    return key, {"model": model_name, **init_kwargs}
+
+
+def init_chat_model(**kwargs):
+    """
+    LangChain's init_chat_model, imported on first use since it loads the provider integration and its SDK
+    (benchmarks replace this function to swap in stub models)
+    """
+    from langchain.chat_models import init_chat_model as _init_chat_model
+
+    return _init_chat_model(**kwargs)
+
+
+def _deterministic(temperature: Any) -> bool:
+    # Only temperature-0 answers may be shared between callers (response cache, single-flight); other
+    # callers expect independent samples
+    return temperature is not None and float(temperature) == 0.0
+
+
+def _response_cache(temperature: Any):
+    # The cache module (SQLAlchemy) is only loaded when the response cache is enabled
+    if not (LLM_CONFIG.get("response_cache") or {}).get("enabled"):
+        return None
+    from llm.cache import get_response_cache
+
+    return get_response_cache(temperature)
+
+
+def _build_model(init_kwargs: dict):
+    """
+    Construct a chat model wrapped with call management (rate limiting, retries, response cache, single-flight)
+    """
+    from llm.managed import ManagedChatModel
+
+    # The wrapper owns retries so that every 429 reaches the rate limiter
+    inner = init_chat_model(**{**init_kwargs, "max_retries": 0})
+    return ManagedChatModel(
+        model=inner,
+        model_name=init_kwargs["model"],
+        limiter=get_rate_limiter(init_kwargs["model_provider"], init_kwargs["model"]),
+        max_retries=init_kwargs["max_retries"],
+        cache=_response_cache(init_kwargs["temperature"]),
+        single_flight=LLM_CONFIG.get("single_flight", True) and _deterministic(init_kwargs["temperature"]),
+    )
+
+
+def _fallback_chain(task: str, overrides: dict) -> List[str]:
+    """
+    Get the task's fallback models (models.yaml `fallbacks`, after the primary), or [] when routing is off
+    """
+    if not (LLM_CONFIG.get("routing") or {}).get("enabled", True):
+        return []
+    task_cfg = {**LLM_CONFIG.get(task, LLM_CONFIG["default"]), **overrides}
+    primary = task_cfg["model_name"]
+    return [name for name in task_cfg.get("fallbacks") or [] if name != primary]
+
+
+def _build_router(members: List[tuple]) -> "RoutedChatModel":
+    """
+    Construct a RoutedChatModel over pooled members, given as (pool key, init_kwargs) in chain order
+    """
+    from llm.routing import RoutedChatModel, routing_settings
+
+    models, built = [], []
+    for i, (key, kwargs) in enumerate(members):
+        try:
+            models.append(_MODEL_POOL.get(key, lambda kwargs=kwargs: _build_model(kwargs)))
+        except Exception as e:
+            # A fallback whose provider isn't set up (e.g. no API key) is left out rather than failing the task
+            if i == 0:
+                raise
+            _logger.warning("Fallback model '%s' is unavailable and was left out of the chain: %s", kwargs["model"], e)
+            continue
+        built.append(kwargs)
+    available = LLM_CONFIG.get("available_models", {})
+    # The router answers from any member, so it may only cache when every member is deterministic
+    deterministic = all(_deterministic(kwargs["temperature"]) for kwargs in built)
+    return RoutedChatModel(
+        models=models,
+        model_name=models[0].model_name,
+        multimodal=[(available.get(m.model_name) or {}).get("multimodal") for m in models],
+        cache=_response_cache(0.0) if deterministic else None,
+        **routing_settings(),
+    )
+
+
+def _resolve(task: str, overrides: dict) -> tuple[tuple, Callable[[], Any]]:
+    """
+    Resolve a task into a pool key and a factory: a single managed model, or a router over its fallback chain
+    """
+    key, init_kwargs = _resolve_model_config(task, overrides)
+    fallbacks = _fallback_chain(task, overrides)
+    if not fallbacks:
+        return key, lambda: _build_model(init_kwargs)
+    # Members retry less: a failing call moves on to the next model instead of waiting out backoffs
+    retries = (LLM_CONFIG.get("routing") or {}).get("member_max_retries", 1)
+    members = [
+        _resolve_model_config(task, {**overrides, "model_name": name, "max_retries": retries})
+        for name in [init_kwargs["model"], *fallbacks]
+    ]
+    return ("routed", tuple(member_key for member_key, _ in members)), lambda: _build_router(members)
+
+
+def get_llm_for(task: str = "default", **overrides):
+    """
+    Get langchain chat model for a given task (pooled by resolved model config; tasks with `fallbacks`
+    get a RoutedChatModel that hedges and fails over along the chain)
+    """
+    key, factory = _resolve(task, overrides)
+    return _MODEL_POOL.get(key, factory)
+
+
+def get_structured_llm_for(task: str, schema, **overrides):
+    """
+    Get pooled chat model for a given task wrapped with structured output for schema
+    """
+    key, factory = _resolve(task, overrides)
+    return _MODEL_POOL.get_structured(key, factory, schema)
+
+
+def get_model_pool_stats() -> dict:
+    """
+    Get hit/miss/eviction counters for the model pool
+    """
+    return _MODEL_POOL.stats()
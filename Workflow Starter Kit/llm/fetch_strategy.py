@@ -0,0 +1,366 @@
+# llm/fetch_strategy.py
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from llm.settings import LLM_CONFIG
+
+_STRATEGY_CONFIG = LLM_CONFIG.get("fetch_strategy") or {}
+
+_STATS_VERSION = 1
+
+# A fetch path: called with its timeout in seconds, returns the page text (raises, or returns "", on failure)
+AsyncFetcher = Callable[[float], Awaitable[str]]
+
+
+def domain_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+class PathStats:
+    """
+    Outcomes and latencies of one fetch path (direct, jina, ...) for one domain. Counts are halved once they
+    pass `window`, so old outcomes fade and a site that starts (or stops) blocking bots is relearned.
+    """
+
+    def __init__(self, window: int = 50, latency_samples: int = 20):
+        self.window = window
+        self.successes = 0.0
+        self.failures = 0.0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+        self.latencies: "deque[float]" = deque(maxlen=latency_samples)
+
+    def record(self, ok: bool, latency: Optional[float] = None) -> None:
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if latency is not None:
+                self.latencies.append(latency)
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_failure = time.time()
+        if self.successes + self.failures > self.window:
+            self.successes /= 2
+            self.failures /= 2
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> dict:
+        return {
+            "successes": round(self.successes, 2),
+            "failures": round(self.failures, 2),
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+            "latencies": [round(x, 4) for x in self.latencies],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, window: int = 50, latency_samples: int = 20) -> "PathStats":
+        stats = cls(window, latency_samples)
+        stats.successes = float(data.get("successes", 0))
+        stats.failures = float(data.get("failures", 0))
+        stats.consecutive_failures = int(data.get("consecutive_failures", 0))
+        stats.last_failure = float(data.get("last_failure", 0))
+        stats.latencies.extend(float(x) for x in data.get("latencies") or [])
+        return stats
+
+
+class FetchStrategy:
+    """
+    Chooses, per domain, how a webpage is fetched: directly or through a reader service such as Jina Reader.
+
+    Each path's outcomes and latencies are learned per domain. A call starts with the path known to work (the
+    fastest one when several do); a path that failed max_consecutive_failures times in a row is only tried when
+    the others fail, until retry_after_seconds have passed, when it is raced against the known-good path once
+    to check whether the site changed. With hedging, the next path is started when the first hasn't answered
+    within its observed latency percentile (hedge_delay_seconds for domains not seen yet), and the first
+    usable answer wins; the other fetch is cancelled. Stats are saved to `path` (JSON) every
+    save_interval_seconds and at exit, so they survive restarts.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        order: Tuple[str, ...] = ("direct", "jina"),
+        learn: bool = True,
+        hedge: bool = True,
+        hedge_delay_seconds: float = 2.0,
+        min_hedge_delay_seconds: float = 0.5,
+        hedge_percentile: float = 0.95,
+        min_samples: int = 5,
+        max_consecutive_failures: int = 2,
+        retry_after_seconds: float = 3600.0,
+        timeout_seconds: float = 20.0,
+        save_interval_seconds: float = 30.0,
+        max_domains: int = 2000,
+        window: int = 50,
+    ):
+        self.path = path
+        self.order = tuple(order)
+        self.learn = learn
+        self.hedge = hedge
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.min_hedge_delay_seconds = min_hedge_delay_seconds
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_consecutive_failures = max_consecutive_failures
+        self.retry_after_seconds = retry_after_seconds
+        self.timeout_seconds = timeout_seconds
+        self.save_interval_seconds = save_interval_seconds
+        self.max_domains = max_domains
+        self.window = window
+        self._domains: Dict[str, Dict[str, PathStats]] = {}
+        self._seen: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.fetches = 0
+        self.hedged = 0
+        self.fallbacks = 0
+        self.failed = 0
+        self.wins: Dict[str, int] = {}
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    # Planning
+    def _classify(self, stats: Optional[PathStats], now: float) -> str:
+        if stats is None or (stats.successes == 0 and stats.consecutive_failures == 0):
+            return "unknown"
+        if stats.consecutive_failures >= self.max_consecutive_failures:
+            return "probe" if now - stats.last_failure >= self.retry_after_seconds else "blocked"
+        return "good" if stats.successes > 0 else "unknown"
+
+    def plan(self, url: str, paths: Optional[List[str]] = None) -> List[Tuple[str, Optional[float]]]:
+        """
+        Ordered (path, start_after_seconds) for a URL; None means the path only starts once every path before it failed.
+        """
+        paths = [p for p in self.order if paths is None or p in paths] + [p for p in paths or [] if p not in self.order]
+        if not self.learn:
+            return [(p, 0.0 if i == 0 else None) for i, p in enumerate(paths)]
+        now = time.time()
+        with self._lock:
+            known = self._domains.get(domain_of(url)) or {}
+            classes = {p: self._classify(known.get(p), now) for p in paths}
+            # Working paths first, fastest (median) first; paths not tried yet keep the configured order
+            rank = {"good": 0, "unknown": 1, "probe": 2, "blocked": 3}
+            ordered = sorted(paths, key=lambda p: (rank[classes[p]], known[p].percentile(0.5) or 0.0 if classes[p] == "good" else 0.0))
+            first = known.get(ordered[0])
+            if classes[ordered[0]] == "good" and first is not None and len(first.latencies) >= self.min_samples:
+                hedge_after = max(self.min_hedge_delay_seconds, first.percentile(self.hedge_percentile))
+            else:
+                hedge_after = self.hedge_delay_seconds
+        plan = [(ordered[0], 0.0)]
+        for p in ordered[1:]:
+            if classes[p] == "blocked" or not self.hedge:
+                plan.append((p, None))
+            elif classes[p] == "probe":
+                plan.append((p, 0.0))
+            else:
+                plan.append((p, hedge_after))
+        return plan
+
+    # Learning
+    def record(self, url: str, path: str, ok: bool, latency: Optional[float] = None) -> None:
+        if not self.learn:
+            return
+        domain = domain_of(url)
+        with self._lock:
+            known = self._domains.get(domain)
+            if known is None:
+                known = self._domains[domain] = {}
+                if len(self._domains) > self.max_domains:
+                    # Forget the domain fetched longest ago
+                    oldest = min(self._seen, key=self._seen.get)
+                    self._domains.pop(oldest, None)
+                    self._seen.pop(oldest, None)
+            stats = known.get(path)
+            if stats is None:
+                stats = known[path] = PathStats(self.window)
+            stats.record(ok, latency)
+            self._seen[domain] = time.time()
+            self._dirty = True
+
+    def _won(self, path: str, position: int, raced: bool) -> None:
+        with self._lock:
+            self.fetches += 1
+            self.wins[path] = self.wins.get(path, 0) + 1
+            self.hedged += raced
+            self.fallbacks += position > 0 and not raced
+
+    def _save_due(self) -> bool:
+        return bool(self.path) and self._dirty and time.monotonic() - self._last_save >= self.save_interval_seconds
+
+    async def afetch(self, url: str, fetchers: Dict[str, AsyncFetcher]) -> Tuple[str, str]:
+        """
+        Fetch a URL through the paths in `fetchers` as planned for its domain. Returns (text, path) from the
+        first path with a non-empty answer; raises the first path's error when every path fails.
+        """
+        plan = [(p, delay) for p, delay in self.plan(url, list(fetchers)) if p in fetchers]
+        # Paths raced from the start to see whether a blocked path works again; losing counts as failing
+        probes = {p for i, (p, delay) in enumerate(plan) if i and delay == 0.0}
+        won = False
+        started = time.monotonic()
+        running: Dict[asyncio.Task, Tuple[str, int, float]] = {}
+        errors: List[BaseException] = []
+        launched = 0
+        raced = False
+
+        def launch() -> None:
+            nonlocal launched, raced
+            path, _ = plan.pop(0)
+            raced = raced or bool(running)
+            future = asyncio.ensure_future(fetchers[path](self.timeout_seconds))
+            # A loser may fail before its cancellation lands; retrieve the error so asyncio doesn't log it
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            running[future] = (path, launched, time.monotonic())
+            launched += 1
+
+        launch()
+        try:
+            while running:
+                next_start = plan[0][1] if plan else None
+                wait = None if next_start is None else max(0.0, started + next_start - time.monotonic())
+                done, _ = await asyncio.wait(running, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge: the paths started so far are slower than usual for this domain
+                    launch()
+                    continue
+                for future in done:
+                    path, position, path_started = running.pop(future)
+                    error = future.exception()
+                    text = future.result() if error is None else None
+                    if text and text.strip():
+                        self.record(url, path, True, time.monotonic() - path_started)
+                        self._won(path, position, raced)
+                        won = True
+                        return text, path
+                    self.record(url, path, False)
+                    errors.append(error or ValueError(f"No readable content at {url} ({path})"))
+                if not running and plan:
+                    # Everything started so far failed: start the next path now
+                    launch()
+        finally:
+            for future, (path, _, _) in running.items():
+                future.cancel()
+                if won and path in probes and not future.done():
+                    self.record(url, path, False)
+            if self._save_due():
+                await asyncio.to_thread(self.save)
+        with self._lock:
+            self.failed += 1
+        raise errors[0]
+
+    # Persistence
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != _STATS_VERSION:
+            return
+        for domain, entry in (data.get("domains") or {}).items():
+            try:
+                self._domains[domain] = {p: PathStats.from_dict(s, self.window) for p, s in entry["paths"].items()}
+                self._seen[domain] = float(entry.get("seen", 0))
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+
+    def save(self) -> None:
+        """Write the domain stats to `path` (atomically) if anything changed since the last save."""
+        if not self.path:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = {
+                    "version": _STATS_VERSION,
+                    "domains": {
+                        domain: {"seen": self._seen.get(domain, 0), "paths": {p: s.as_dict() for p, s in known.items()}}
+                        for domain, known in self._domains.items()
+                    },
+                }
+                self._dirty = False
+                self._last_save = time.monotonic()
+            # Stats are an optimization: a read-only or full disk only means they are relearned after a restart
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(self.path + ".tmp", self.path)
+            except OSError:
+                pass
+
+    def domain_stats(self, url_or_domain: str) -> dict:
+        """Learned stats and the current plan for one domain (a URL or a bare host name)."""
+        domain = domain_of(url_or_domain) if "://" in url_or_domain else url_or_domain.lower()
+        with self._lock:
+            known = {p: {**s.as_dict(), "p50_s": s.percentile(0.5)} for p, s in (self._domains.get(domain) or {}).items()}
+        return {"domain": domain, "paths": known, "plan": self.plan(f"http://{domain}/")}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "domains": len(self._domains),
+                "fetches": self.fetches,
+                "hedged": self.hedged,
+                "fallbacks": self.fallbacks,
+                "failed": self.failed,
+                "wins": dict(self.wins),
+            }
+
+
+_STRATEGY: Optional[FetchStrategy] = None
+_STRATEGY_LOCK = threading.Lock()
+
+
+def get_fetch_strategy() -> FetchStrategy:
+    """
+    Return the process-wide fetch strategy configured under `fetch_strategy` in models.yaml.
+    """
+    global _STRATEGY
+    with _STRATEGY_LOCK:
+        if _STRATEGY is None:
+            path = _STRATEGY_CONFIG.get("path", ".fetch_stats.json")
+            if path and not os.path.isabs(path):
+                path = os.path.join(os.path.dirname(__file__), path)
+            learn = bool(_STRATEGY_CONFIG.get("enabled", True))
+            _STRATEGY = FetchStrategy(
+                path=path if learn and path else None,
+                learn=learn,
+                hedge=bool(_STRATEGY_CONFIG.get("hedge", True)),
+                hedge_delay_seconds=float(_STRATEGY_CONFIG.get("hedge_delay_seconds", 2.0)),
+                min_hedge_delay_seconds=float(_STRATEGY_CONFIG.get("min_hedge_delay_seconds", 0.5)),
+                hedge_percentile=float(_STRATEGY_CONFIG.get("hedge_percentile", 0.95)),
+                min_samples=int(_STRATEGY_CONFIG.get("min_samples", 5)),
+                max_consecutive_failures=int(_STRATEGY_CONFIG.get("max_consecutive_failures", 2)),
+                retry_after_seconds=float(_STRATEGY_CONFIG.get("retry_after_seconds", 3600)),
+                timeout_seconds=float(_STRATEGY_CONFIG.get("timeout_seconds", 20)),
+                save_interval_seconds=float(_STRATEGY_CONFIG.get("save_interval_seconds", 30)),
+                max_domains=int(_STRATEGY_CONFIG.get("max_domains", 2000)),
+            )
+        return _STRATEGY
+
+
+def get_fetch_strategy_stats() -> dict:
+    """
+    Return how many webpage fetches were hedged, fell back or failed, and which path won how often.
+    """
+    return get_fetch_strategy().stats()
@@ -0,0 +1,213 @@
+# llm/journal.py
+import hashlib
+import importlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import Column, Float, Integer, String, Text, create_engine, delete, event, func, insert, select
+from sqlalchemy.orm import Session, declarative_base
+
+from llm.settings import LLM_CONFIG
+
+_Base = declarative_base()
+
+_JOURNAL_CONFIG = LLM_CONFIG.get("run_journal") or {}
+
+
+class _JournalRow(_Base):
+    __tablename__ = "llm_run_journal"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(128), nullable=False, index=True)
+    key = Column(String(64), nullable=False)
+    position = Column(Integer, nullable=False)
+    status = Column(String(8), nullable=False)
+    result = Column(Text)
+    error = Column(Text)
+    elapsed = Column(Float, nullable=False)
+    created_at = Column(Float, nullable=False)
+
+
+def _encode(value: Any) -> Any:
+    # JSON with type tags, so tuples and Pydantic results come back as they were returned
+    if isinstance(value, BaseModel):
+        cls = type(value)
+        return {"__model__": f"{cls.__module__}:{cls.__qualname__}", "value": value.model_dump(mode="json")}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if isinstance(value, dict):
+        if "__tuple__" in value:
+            return tuple(_decode(v) for v in value["__tuple__"])
+        if "__model__" in value:
+            module, qualname = value["__model__"].split(":")
+            cls = importlib.import_module(module)
+            for part in qualname.split("."):
+                cls = getattr(cls, part)
+            return cls.model_validate(value["value"])
+        return {k: _decode(v) for k, v in value.items()}
+    return value
+
+
+def input_key(task_fn: Callable, item: Any) -> str:
+    """
+    sha256 of the task function's name and the input, so a journal entry matches the same call on a rerun
+    """
+    name = f"{getattr(task_fn, '__module__', '')}.{getattr(task_fn, '__qualname__', repr(task_fn))}"
+    payload = json.dumps(_encode(item), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{name}\n{payload}".encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """
+    Append-only SQLite journal of one run's completed items, keyed by run id plus input hash.
+
+    Each finished item (result or error) is buffered and written in batches: every flush_every records or
+    flush_interval seconds, one transaction (and one fsync) at a time, so the journal keeps up with high
+    throughput. A crash loses at most the unflushed tail. Reopening the run loads its successful results so
+    llm.batch.run_batch(..., journal=) skips them and only retries failed or missing items. The latest
+    record for a key wins.
+    """
+
+    def __init__(self, path: str, run_id: str, flush_every: int = 100, flush_interval: float = 2.0):
+        self.run_id = run_id
+        self.flush_every = max(1, int(flush_every))
+        self.flush_interval = flush_interval
+        self._engine = create_engine(f"sqlite:///{path}")
+        # WAL: appends don't rewrite pages, and readers aren't blocked by the writer
+        event.listen(self._engine, "connect", lambda conn, _: conn.execute("PRAGMA journal_mode=WAL"))
+        _Base.metadata.create_all(self._engine)
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._done: Dict[str, str] = {}
+        self.resumed = 0
+        self.recorded = 0
+        self.flushes = 0
+        with Session(self._engine) as session:
+            rows = session.execute(
+                select(_JournalRow.key, _JournalRow.status, _JournalRow.result)
+                .where(_JournalRow.run_id == run_id)
+                .order_by(_JournalRow.id)
+            )
+            for key, status, result in rows:
+                if status == "ok":
+                    self._done[key] = result
+                else:
+                    self._done.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._done)
+
+    def completed(self, key: str) -> bool:
+        return key in self._done
+
+    def result(self, key: str) -> Any:
+        """The recorded result of a completed item."""
+        self.resumed += 1
+        return _decode(json.loads(self._done[key]))
+
+    def record(self, key: str, position: int, result: Any = None, error: Optional[BaseException] = None, elapsed: float = 0.0) -> bool:
+        """
+        Buffer one finished item. Returns True when the buffer is due to be flushed.
+        """
+        row = {
+            "run_id": self.run_id,
+            "key": key,
+            "position": position,
+            "status": "ok" if error is None else "error",
+            "result": json.dumps(_encode(result), default=str, ensure_ascii=False) if error is None else None,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "elapsed": elapsed,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._buffer.append(row)
+            self.recorded += 1
+            if error is None:
+                self._done[key] = row["result"]
+            return len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self) -> int:
+        """Write buffered records in one transaction; returns how many were written. Blocking."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not rows:
+                return 0
+            with Session(self._engine) as session:
+                session.execute(insert(_JournalRow), rows)
+                session.commit()
+            with self._lock:
+                self.flushes += 1
+            return len(rows)
+
+    def failures(self) -> List[dict]:
+        """Items whose latest record is an error: [{"key", "position", "error"}]."""
+        self.flush()
+        latest = (
+            select(func.max(_JournalRow.id))
+            .where(_JournalRow.run_id == self.run_id)
+            .group_by(_JournalRow.key)
+        )
+        with Session(self._engine) as session:
+            rows = session.execute(
+                select(_JournalRow.key, _JournalRow.position, _JournalRow.error)
+                .where(_JournalRow.id.in_(latest), _JournalRow.status == "error")
+                .order_by(_JournalRow.position)
+            )
+            return [{"key": key, "position": position, "error": error} for key, position, error in rows]
+
+    def clear(self) -> None:
+        """Forget this run."""
+        with self._lock:
+            self._buffer.clear()
+            self._done.clear()
+        with Session(self._engine) as session:
+            session.execute(delete(_JournalRow).where(_JournalRow.run_id == self.run_id))
+            session.commit()
+
+    def close(self) -> None:
+        self.flush()
+        self._engine.dispose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "completed": len(self._done),
+                "resumed": self.resumed,
+                "recorded": self.recorded,
+                "flushes": self.flushes,
+                "buffered": len(self._buffer),
+            }
+
+
+def get_run_journal(run_id: str, path: Optional[str] = None) -> RunJournal:
+    """
+    Open the journal of a run in the configured database (`run_journal` in models.yaml). Use the same run_id
+    to resume a run; a relative path is resolved next to this file.
+    """
+    path = path or _JOURNAL_CONFIG.get("path", ".llm_runs.sqlite")
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(__file__), path)
+    return RunJournal(
+        path,
+        run_id,
+        flush_every=_JOURNAL_CONFIG.get("flush_every", 100),
+        flush_interval=float(_JOURNAL_CONFIG.get("flush_interval_seconds", 2.0)),
+    )
@@ -0,0 +1,311 @@
+# llm/managed.py
+import asyncio
+import hashlib
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+from pydantic import BaseModel
+
+from llm.metrics import start_llm_call
+from llm.singleflight import SingleFlight
+from llm.tokens import estimate_message_tokens
+
+# Identical model calls in flight at the same time share one provider request
+_MODEL_CALLS = SingleFlight("model")
+
+
+# Error classification
+def _status_of(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _is_retryable(error: BaseException) -> bool:
+    status = _status_of(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, openai.APIConnectionError)
+
+
+def _backoff(attempt: int, retry_after: Optional[float]) -> float:
+    if retry_after is not None:
+        return retry_after
+    return min(30.0, 0.5 * (2 ** attempt)) * (0.5 + random.random() / 2)
+
+
+def _used_tokens(result: ChatResult) -> Optional[int]:
+    for generation in result.generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens")
+    return None
+
+
+def _usage_of(result: ChatResult) -> Optional[dict]:
+    for generation in result.generations:
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            return usage
+    return None
+
+
+def _chunk_tokens(chunk: ChatGenerationChunk) -> Optional[int]:
+    # Providers report usage on the last chunk of a stream (OpenAI with stream_usage)
+    usage = getattr(chunk.message, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class ManagedChatModel(BaseChatModel):
+    """
+    Chat model that delegates to a provider `model` and adds the kit's call management:
+    the shared provider rate limiter (optional), retries with backoff, stable response-cache keys,
+    and (with single_flight) collapsing of identical concurrent calls into one request.
+
+    The wrapper owns retries (the wrapped client is built with max_retries=0) so every 429 is seen by the
+    limiter: it shrinks concurrency, honours Retry-After for all callers, and then retries.
+    """
+
+    model: BaseChatModel
+    model_name: str
+    limiter: Any = None
+    max_retries: int = 3
+    single_flight: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return f"managed-{self.model._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.model._identifying_params
+
+    def _get_llm_string(self, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        # Schema classes only repr by name; key structured-output calls on their full JSON schema
+        response_format = kwargs.get("response_format")
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            kwargs["response_format"] = response_format.model_json_schema()
+        return super()._get_llm_string(stop=stop, **kwargs)
+
+    def _estimate(self, messages: List[BaseMessage], kwargs: dict) -> int:
+        tokens = estimate_message_tokens(messages, self.model_name, kwargs.get("tools"))
+        return tokens + int(kwargs.get("max_tokens") or getattr(self.model, "max_tokens", None) or 0)
+
+    def _release(
+        self,
+        estimated: int = 0,
+        result: Optional[ChatResult] = None,
+        error: Optional[BaseException] = None,
+        used_tokens: Optional[int] = None,
+    ) -> bool:
+        """
+        Return the limiter slot and settle the estimated token reservation. Only a call without error counts as a
+        success for the adaptive concurrency; a 429 also throttles the limiter, other errors (5xx, timeouts,
+        cancellation) are neutral. Returns True if the error was a 429.
+        """
+        throttled = error is not None and _status_of(error) == 429
+        if self.limiter is None:
+            return throttled
+        if throttled:
+            # The pause applies to every caller of this limiter, so callers don't sleep again
+            self.limiter.throttle(_backoff(0, _retry_after(error)))
+        used = _used_tokens(result) if result is not None else used_tokens
+        self.limiter.release(estimated, used, success=error is None)
+        return throttled
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        return hashlib.sha256(f"{self._get_llm_string(stop=stop, **kwargs)}\n{dumps(messages)}".encode("utf-8")).hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if not self.single_flight:
+            return self._generate_managed(messages, stop, run_manager, **kwargs)
+        return _MODEL_CALLS.do(
+            self._flight_key(messages, stop, kwargs),
+            lambda: self._generate_managed(messages, stop, run_manager, **kwargs),
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if not self.single_flight:
+            return await self._agenerate_managed(messages, stop, run_manager, **kwargs)
+        return await _MODEL_CALLS.ado(
+            self._flight_key(messages, stop, kwargs),
+            lambda: self._agenerate_managed(messages, stop, run_manager, **kwargs),
+        )
+
+    def _generate_managed(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        estimated = self._estimate(messages, kwargs) if self.limiter is not None else 0
+        call = start_llm_call(self.model_name, run_manager)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                with call.phase("queue"):
+                    self.limiter.acquire(estimated)
+            call.begin()
+            try:
+                result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                call.end()
+                throttled = self._release(estimated, error=e)
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    call.finish(e)
+                    raise
+                if not (throttled and self.limiter is not None):
+                    time.sleep(_backoff(attempt, _retry_after(e)))
+                attempt += 1
+                call.retried()
+                continue
+            self._release(estimated, result)
+            call.usage(_usage_of(result))
+            call.finish()
+            return result
+
+    async def _agenerate_managed(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        estimated = self._estimate(messages, kwargs) if self.limiter is not None else 0
+        call = start_llm_call(self.model_name, run_manager)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                with call.phase("queue"):
+                    await self.limiter.aacquire(estimated)
+            call.begin()
+            try:
+                result = await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except asyncio.CancelledError as e:
+                self._release(estimated, error=e)
+                call.finish(e)
+                raise
+            except Exception as e:
+                call.end()
+                throttled = self._release(estimated, error=e)
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    call.finish(e)
+                    raise
+                if not (throttled and self.limiter is not None):
+                    await asyncio.sleep(_backoff(attempt, _retry_after(e)))
+                attempt += 1
+                call.retried()
+                continue
+            self._release(estimated, result)
+            call.usage(_usage_of(result))
+            call.finish()
+            return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        estimated = self._estimate(messages, kwargs) if self.limiter is not None else 0
+        call = start_llm_call(self.model_name, run_manager)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                with call.phase("queue"):
+                    self.limiter.acquire(estimated)
+            call.begin()
+            started = False
+            used = None
+            try:
+                for chunk in self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    call.token()
+                    call.usage(getattr(chunk.message, "usage_metadata", None))
+                    used = _chunk_tokens(chunk) or used
+                    yield chunk
+            except Exception as e:
+                call.end()
+                throttled = self._release(estimated, error=e, used_tokens=used)
+                # Retry transparently only while nothing has been yielded to the caller
+                if started or attempt >= self.max_retries or not _is_retryable(e):
+                    call.finish(e)
+                    raise
+                if not (throttled and self.limiter is not None):
+                    time.sleep(_backoff(attempt, _retry_after(e)))
+                attempt += 1
+                call.retried()
+                continue
+            except BaseException as e:
+                # Consumer stopped early (GeneratorExit) or the run was interrupted
+                self._release(estimated, error=e, used_tokens=used)
+                call.finish(e)
+                raise
+            self._release(estimated, used_tokens=used)
+            call.finish()
+            return
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        estimated = self._estimate(messages, kwargs) if self.limiter is not None else 0
+        call = start_llm_call(self.model_name, run_manager)
+        attempt = 0
+        while True:
+            if self.limiter is not None:
+                with call.phase("queue"):
+                    await self.limiter.aacquire(estimated)
+            call.begin()
+            started = False
+            used = None
+            try:
+                async for chunk in self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    call.token()
+                    call.usage(getattr(chunk.message, "usage_metadata", None))
+                    used = _chunk_tokens(chunk) or used
+                    yield chunk
+            except Exception as e:
+                call.end()
+                throttled = self._release(estimated, error=e, used_tokens=used)
+                # Retry transparently only while nothing has been yielded to the caller
+                if started or attempt >= self.max_retries or not _is_retryable(e):
+                    call.finish(e)
+                    raise
+                if not (throttled and self.limiter is not None):
+                    await asyncio.sleep(_backoff(attempt, _retry_after(e)))
+                attempt += 1
+                call.retried()
+                continue
+            except BaseException as e:
+                # Consumer stopped early (GeneratorExit), or the task was cancelled
+                self._release(estimated, error=e, used_tokens=used)
+                call.finish(e)
+                raise
+            self._release(estimated, used_tokens=used)
+            call.finish()
+            return
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs) -> bool:
+        return self.model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def bind_tools(self, tools, **kwargs):
+        # Let the provider format the tools, then bind the same kwargs to this wrapper
+        bound = self.model.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        # Keep the provider's native structured-output mode by re-pointing its chain at this wrapper
+        runnable = self.model.with_structured_output(schema, **kwargs)
+        if isinstance(runnable, RunnableSequence):
+            first = runnable.first
+            if isinstance(first, RunnableBinding) and first.bound is self.model:
+                return RunnableSequence(self.bind(**first.kwargs), *runnable.steps[1:])
+        return super().with_structured_output(schema, **kwargs)
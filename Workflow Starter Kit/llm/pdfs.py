@@ -0,0 +1,244 @@
+# llm/pdfs.py
+import base64
+import hashlib
+import importlib.util
+import io
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from llm.retrieval import BM25Index
+from llm.settings import LLM_CONFIG
+from llm.tokens import count_tokens
+
+# pypdf is optional (without it PDFs are sent whole, as files) and is imported on first use
+_HAVE_PYPDF = importlib.util.find_spec("pypdf") is not None
+
+_PDF_CONFIG = LLM_CONFIG.get("pdf_processing") or {}
+
+
+def is_pdf(data: bytes) -> bool:
+    """
+    True if the bytes look like a PDF (the %PDF- header may follow up to 1 KB of junk).
+    """
+    return b"%PDF-" in data[:1024]
+
+
+class PdfPages:
+    """
+    The text layer of a PDF, one string per page. Pages with less than min_page_chars characters of text
+    (scans, figures) count as scanned.
+    """
+
+    def __init__(self, texts: List[str], min_page_chars: int = 40):
+        self.texts = texts
+        self.min_page_chars = min_page_chars
+
+    @property
+    def page_count(self) -> int:
+        return len(self.texts)
+
+    def is_scanned(self, index: int) -> bool:
+        return len(self.texts[index].strip()) < self.min_page_chars
+
+
+def parse_page_ranges(spec: str, page_count: int) -> List[int]:
+    """
+    Parse 1-based page ranges such as "1-3, 7, 10-" into sorted 0-based page indexes (clipped to the document).
+    """
+    pages = set()
+    for part in re.split(r"[,;\s]+", spec.strip()):
+        if not part:
+            continue
+        match = re.fullmatch(r"(\d*)\s*-\s*(\d*)|(\d+)", part)
+        if match is None:
+            raise ValueError(f"Invalid page range: {part!r}")
+        if match.group(3):
+            start = stop = int(match.group(3))
+        else:
+            start = int(match.group(1) or 1)
+            stop = int(match.group(2) or page_count)
+        pages.update(range(max(1, start) - 1, min(stop, page_count)))
+    return sorted(pages)
+
+
+def format_page_ranges(pages: List[int]) -> str:
+    """
+    Format sorted 0-based page indexes as 1-based ranges, e.g. [0, 1, 2, 6] -> "1-3, 7".
+    """
+    ranges = []
+    for page in pages:
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ", ".join(str(a + 1) if a == b else f"{a + 1}-{b + 1}" for a, b in ranges)
+
+
+def _open(data: bytes):
+    from pypdf import PdfReader
+
+    reader = PdfReader(io.BytesIO(data))
+    if reader.is_encrypted:
+        # Many PDFs are "encrypted" with an empty user password only to set permissions
+        reader.decrypt("")
+    return reader
+
+
+def _extract_range(data: bytes, start: int, stop: int) -> List[str]:
+    # Runs in worker processes: extract the text of pages [start, stop)
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    reader = _open(data)
+    texts = []
+    for index in range(start, stop):
+        try:
+            texts.append(reader.pages[index].extract_text() or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _workers() -> int:
+    return int(_PDF_CONFIG.get("workers") or os.cpu_count() or 1)
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=_workers())
+        return _POOL
+
+
+_PAGES_CACHE: "OrderedDict[str, PdfPages]" = OrderedDict()
+_PAGES_CACHE_LOCK = threading.Lock()
+
+
+def extract_pdf_pages(data: bytes) -> Optional[PdfPages]:
+    """
+    Extract a PDF's text layer page by page, or return None when pypdf is missing, processing is disabled or
+    the file can't be read. Documents of process_pool_min_pages pages or more are split across a process
+    pool. Results are cached by content hash. Blocking: call it from a thread in async code.
+    """
+    if not _HAVE_PYPDF or not _PDF_CONFIG.get("enabled", True) or not is_pdf(data):
+        return None
+    key = hashlib.sha256(data).hexdigest()
+    with _PAGES_CACHE_LOCK:
+        if key in _PAGES_CACHE:
+            _PAGES_CACHE.move_to_end(key)
+            return _PAGES_CACHE[key]
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    try:
+        page_count = len(_open(data).pages)
+        workers = min(_workers(), page_count)
+        if workers > 1 and page_count >= int(_PDF_CONFIG.get("process_pool_min_pages", 24)):
+            step = math.ceil(page_count / workers)
+            futures = [_pool().submit(_extract_range, data, start, min(start + step, page_count)) for start in range(0, page_count, step)]
+            texts = [text for future in futures for text in future.result()]
+        else:
+            texts = _extract_range(data, 0, page_count)
+    except Exception:
+        return None
+    pages = PdfPages(texts, int(_PDF_CONFIG.get("min_page_chars", 40)))
+    with _PAGES_CACHE_LOCK:
+        _PAGES_CACHE[key] = pages
+        while len(_PAGES_CACHE) > int(_PDF_CONFIG.get("cache_entries", 32)):
+            _PAGES_CACHE.popitem(last=False)
+    return pages
+
+
+def relevant_pages(texts: List[str], candidates: List[int], instruction: str, max_tokens: int, model_name: Optional[str] = None) -> List[int]:
+    """
+    Pick the candidate pages that best match the instruction (BM25, see retrieval.BM25Index) until max_tokens
+    of text is reached; returned in document order. If no page matches, all candidates are returned.
+    """
+    index = BM25Index([texts[i] for i in candidates], model_name)
+    chosen = index.select(instruction, max_tokens)
+    return [candidates[i] for i in chosen] if chosen else candidates
+
+
+def pdf_subset(data: bytes, pages: List[int]) -> bytes:
+    """
+    Return a PDF containing only the given 0-based pages.
+    """
+    from pypdf import PdfWriter
+
+    reader = _open(data)
+    writer = PdfWriter()
+    for index in pages:
+        writer.add_page(reader.pages[index])
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+class PreparedPdf:
+    """
+    What to send for a PDF: the text of its text pages (text) and, for pages without a text layer, a PDF of
+    just those pages (file_data; the whole file when it couldn't be processed). pages are the 0-based pages
+    sent and scanned those among them sent as a file.
+    """
+
+    def __init__(self, text: str = "", file_data: Optional[bytes] = None, page_count: int = 0, pages: Optional[List[int]] = None, scanned: Optional[List[int]] = None):
+        self.text = text
+        self.file_data = file_data
+        self.page_count = page_count
+        self.pages = pages or []
+        self.scanned = scanned or []
+
+    def file_base64(self) -> Optional[str]:
+        return None if self.file_data is None else base64.b64encode(self.file_data).decode("ascii")
+
+    def note(self) -> str:
+        """A line telling the model which pages it is given, or "" when it gets the whole document as-is."""
+        if not self.page_count:
+            return ""
+        parts = []
+        if len(self.pages) < self.page_count:
+            parts.append(f"Only pages {format_page_ranges(self.pages)} of {self.page_count} are included.")
+        if self.scanned and self.text:
+            parts.append(f"Pages {format_page_ranges(self.scanned)} have no text layer and are attached as a PDF; the rest is extracted text.")
+        return " ".join(parts)
+
+
+def prepare_pdf(data: bytes, instruction: Optional[str] = None, pages: Optional[str] = None, model_name: Optional[str] = None) -> PreparedPdf:
+    """
+    Decide what to send for a PDF. Text pages are sent as extracted text, marked "[Page N]"; only pages without
+    a text layer go as a (smaller) PDF. pages ("1-3, 7") limits the document to those pages; otherwise, when
+    an instruction is given and the text exceeds relevance_max_tokens, only the pages relevant to it are kept.
+    Raises ValueError for page ranges that select nothing. Without pypdf, or for files it can't read, the whole file is sent as before. Blocking: call it from a
+    thread in async code.
+    """
+    extracted = extract_pdf_pages(data)
+    if extracted is None:
+        return PreparedPdf(file_data=data)
+    selected = parse_page_ranges(pages, extracted.page_count) if pages else list(range(extracted.page_count))
+    if not selected:
+        raise ValueError(f"No pages selected by {pages!r}; the document has {extracted.page_count} pages")
+    if not pages and instruction and _PDF_CONFIG.get("relevance", True):
+        text_pages = [i for i in selected if not extracted.is_scanned(i)]
+        budget = int(_PDF_CONFIG.get("relevance_max_tokens", 60000))
+        if sum(count_tokens(extracted.texts[i], model_name) for i in text_pages) > budget:
+            scanned = [i for i in selected if extracted.is_scanned(i)]
+            selected = sorted(relevant_pages(extracted.texts, text_pages, instruction, budget, model_name) + scanned)
+    scanned = [i for i in selected if extracted.is_scanned(i)]
+    text = "\n\n".join(f"[Page {i + 1}]\n{extracted.texts[i].strip()}" for i in selected if not extracted.is_scanned(i))
+    if not scanned:
+        file_data = None
+    elif len(scanned) == extracted.page_count:
+        file_data = data
+    else:
+        try:
+            file_data = pdf_subset(data, scanned)
+        except Exception:
+            file_data = data
+    return PreparedPdf(text, file_data, extracted.page_count, selected, scanned)
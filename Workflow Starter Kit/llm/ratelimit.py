@@ -0,0 +1,232 @@
+# llm/ratelimit.py
+import asyncio
+import threading
+import time
+from typing import List, Optional
+
+from llm.settings import LLM_CONFIG
+
+
+# Token buckets and adaptive concurrency
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at rate_per_minute.
+
+    reserve() always succeeds and returns how long the caller must wait before using the reservation,
+    so waiters are served in arrival order without polling. The balance may go negative.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, delta: float) -> None:
+        """Refund (positive) or debit (negative) tokens once the real cost of a call is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+
+def _wake_future(fut: "asyncio.Future") -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit adjusted by AIMD: +1 slot per window of successes, multiplicative decrease on throttling.
+    Usable from threads (acquire) and coroutines (aacquire), including several event loops at once.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32, decrease: float = 0.5):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.limit = float(min(max(int(initial), self.minimum), self.maximum))
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: set = set()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake(self) -> None:
+        self._cond.notify_all()
+        for loop, fut in list(self._async_waiters):
+            loop.call_soon_threadsafe(_wake_future, fut)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while not self._try_acquire():
+                self._cond.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.add(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+
+    def release(self, success: bool = True) -> None:
+        """Free a slot; a success counts toward the additive increase, anything else is neutral."""
+        with self._cond:
+            self.in_flight -= 1
+            if success:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            self._wake()
+
+    def throttle(self, cooldown: float = 1.0) -> None:
+        """Multiplicative decrease; concurrent 429s within cooldown count as one signal."""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= cooldown:
+                self.limit = max(float(self.minimum), self.limit * self.decrease)
+                self._last_decrease = now
+
+
+class ProviderRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets plus AIMD concurrency for one provider/model.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 32,
+    ):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, min_concurrency, max_concurrency)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.completed = 0
+        self.wait_seconds = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        waits = [self._paused_until - time.monotonic()]
+        if self.requests is not None:
+            waits.append(self.requests.reserve(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.reserve(tokens))
+        wait = max(0.0, *waits)
+        with self._lock:
+            self.wait_seconds += wait
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        self.concurrency.acquire()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        await self.concurrency.aacquire()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                if self.tokens is not None:
+                    self.tokens.adjust(tokens)
+                self.concurrency.release(success=False)
+                raise
+
+    def release(self, estimated_tokens: int = 0, used_tokens: Optional[int] = None, success: bool = True) -> None:
+        """
+        Return a concurrency slot and settle the token reservation: reconciled with the tokens used when they are
+        known, refunded when a failed or interrupted call reports none. Only successes grow the concurrency
+        limit; failures leave it as it is (429s shrink it through throttle()).
+        """
+        if self.tokens is not None:
+            if used_tokens is not None:
+                self.tokens.adjust(estimated_tokens - used_tokens)
+            elif not success:
+                self.tokens.adjust(estimated_tokens)
+        with self._lock:
+            self.completed += 1
+        self.concurrency.release(success=success)
+
+    def throttle(self, retry_after: Optional[float] = None) -> None:
+        """Record a 429: shrink concurrency and pause new requests until Retry-After has passed."""
+        with self._lock:
+            self.throttled += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self.concurrency.throttle(cooldown=retry_after or 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+# Shared limiters, one per provider/model
+_LIMITERS: dict = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def _rate_limit_config(provider: str, model_name: str) -> dict:
+    cfg = dict(LLM_CONFIG.get("rate_limits", {}).get(provider) or {})
+    cfg.update(LLM_CONFIG.get("available_models", {}).get(model_name, {}).get("rate_limit") or {})
+    return cfg
+
+
+def get_rate_limiter(provider: str, model_name: str) -> Optional[ProviderRateLimiter]:
+    """
+    Return the shared limiter for a provider/model, or None if no rate limits are configured for it.
+    """
+    key = (provider, model_name)
+    with _LIMITERS_LOCK:
+        if key not in _LIMITERS:
+            cfg = _rate_limit_config(provider, model_name)
+            _LIMITERS[key] = ProviderRateLimiter(
+                f"{provider}:{model_name}",
+                requests_per_minute=cfg.get("requests_per_minute"),
+                tokens_per_minute=cfg.get("tokens_per_minute"),
+                initial_concurrency=cfg.get("initial_concurrency", 4),
+                min_concurrency=cfg.get("min_concurrency", 1),
+                max_concurrency=cfg.get("max_concurrency", 32),
+            ) if cfg else None
+        return _LIMITERS[key]
+
+
+def get_rate_limiter_stats() -> List[dict]:
+    with _LIMITERS_LOCK:
+        return [limiter.stats() for limiter in _LIMITERS.values() if limiter is not None]
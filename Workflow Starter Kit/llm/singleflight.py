@@ -0,0 +1,109 @@
+# llm/singleflight.py
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable, List
+
+
+class _LeaderCancelled(Exception):
+    """Raised to followers when the coroutine executing a shared call was cancelled."""
+
+
+class SingleFlight:
+    """
+    Collapse concurrent identical calls into one execution whose result is shared by every caller.
+
+    The shared result lives in a concurrent.futures.Future, so callers can be threads (do) or coroutines
+    on any event loop (ado), mixed freely. Only calls that overlap in time are collapsed; nothing is cached
+    after the leader finishes. If a coroutine leader is cancelled, waiting callers retry and one takes over.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+        _GROUPS.append(self)
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.collapsed += 1
+                return future, False
+            future = Future()
+            # Running futures cannot be cancelled by a follower giving up
+            future.set_running_or_notify_cancel()
+            self._inflight[key] = future
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn() unless an identical call is in flight, in which case wait for and share its result."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return future.result()
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = fn()
+            except BaseException as e:
+                self._finish(key, future)
+                future.set_exception(e)
+                raise
+            self._finish(key, future)
+            future.set_result(result)
+            return result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of do(); fn is called with no arguments and must return an awaitable."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return await asyncio.wrap_future(future)
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self._finish(key, future)
+                future.set_exception(_LeaderCancelled())
+                raise
+            except BaseException as e:
+                self._finish(key, future)
+                future.set_exception(e)
+                raise
+            self._finish(key, future)
+            future.set_result(result)
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "calls": self.calls,
+                "executions": self.executions,
+                "collapsed": self.collapsed,
+                "in_flight": len(self._inflight),
+            }
+
+
+_GROUPS: List[SingleFlight] = []
+
+
+def get_singleflight_stats() -> List[dict]:
+    """
+    Return call/execution/collapsed counters for every single-flight group.
+    """
+    return [group.stats() for group in _GROUPS]
@@ -0,0 +1,122 @@
+# llm/streaming.py
+import time
+from typing import Any, AsyncIterator, Optional, Type
+
+from pydantic import BaseModel
+
+from llm.chunking import text_of
+
+
+class StreamTiming:
+    """
+    Timing of one streamed response, measured from construction: time to first token (ttft_s) and total
+    latency (total_s). Create it before any work the caller waits on (fetches, map steps) so both include it.
+    """
+
+    def __init__(self, label: str = "stream"):
+        self.label = label
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.chunks = 0
+
+    def token(self) -> None:
+        self.chunks += 1
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self) -> None:
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def ttft_s(self) -> Optional[float]:
+        return None if self.first_token_at is None else self.first_token_at - self.started
+
+    @property
+    def total_s(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "ttft_s": None if self.ttft_s is None else round(self.ttft_s, 3),
+            "total_s": round(self.total_s, 3),
+            "chunks": self.chunks,
+        }
+
+    def __str__(self) -> str:
+        ttft = "no tokens" if self.ttft_s is None else f"first token after {self.ttft_s:.2f}s"
+        return f"[{self.label}] {ttft}, done after {self.total_s:.2f}s ({self.chunks} chunks)"
+
+
+async def astream_text(llm: Any, messages: list, timing: Optional[StreamTiming] = None) -> AsyncIterator[str]:
+    """
+    Stream a chat model's reply as text deltas.
+    """
+    timing = timing or StreamTiming()
+    try:
+        async for chunk in llm.astream(messages):
+            text = text_of(chunk)
+            if text:
+                timing.token()
+                yield text
+    finally:
+        timing.finish()
+
+
+def _json_delta(chunk: Any) -> str:
+    # Tool-calling structured output streams JSON in tool-call args; json_schema mode streams it as content
+    tool_chunks = getattr(chunk, "tool_call_chunks", None)
+    if tool_chunks:
+        return "".join(c.get("args") or "" for c in tool_chunks if c.get("index", 0) in (0, None))
+    return text_of(chunk)
+
+
+def _partial(schema: Type[BaseModel], data: dict) -> BaseModel:
+    # Unvalidated instance; fields the model has not produced yet are None
+    return schema.model_construct(**{name: data.get(name) for name in schema.model_fields})
+
+
+async def astream_structured(
+    structured: Any,
+    schema: Type[BaseModel],
+    messages: list,
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[BaseModel]:
+    """
+    Stream a structured-output runnable (see get_structured_llm_for) as partial schema objects.
+    Each partial is yielded when the streamed JSON gains a field or a field grows; fields not filled in yet
+    are None. The last object yielded is the fully validated result.
+    """
+    # Imported here: by the time anything streams, the model (and LangChain) is loaded anyway
+    from langchain_core.runnables import RunnableBinding, RunnableSequence
+    from langchain_core.utils.json import parse_partial_json
+
+    timing = timing or StreamTiming()
+    model_step = None
+    if isinstance(structured, RunnableSequence) and isinstance(structured.first, RunnableBinding):
+        model_step = structured.first
+    try:
+        if model_step is None:
+            # Unknown chain shape: pass on whatever its output parser emits
+            async for value in structured.astream(messages):
+                timing.token()
+                yield value
+            return
+        parts = []
+        last = None
+        async for chunk in model_step.astream(messages):
+            delta = _json_delta(chunk)
+            if not delta:
+                continue
+            timing.token()
+            parts.append(delta)
+            data = parse_partial_json("".join(parts))
+            if isinstance(data, dict) and data and data != last:
+                last = data
+                yield _partial(schema, data)
+        yield schema.model_validate_json("".join(parts))
+    finally:
+        timing.finish()
+
@@ -1,77 +1,131 @@
 # llm/tasks.py
-from typing import List
-import httpx
-from llm.factory import get_llm_for
+import asyncio
+import base64
+from typing import AsyncIterator, List, Optional
+from llm.chunking import MAX_INPUT_CHARS, amap_reduce_messages, map_prompt, reduce_prompt, split_for_model
+from llm.extract import html_read_chars, readable_text
+from llm.factory import get_llm_for, get_structured_llm_for
+from llm.fetch_strategy import get_fetch_strategy
+from llm.http_client import afetch_text
+from llm.images import prepare_image_base64
+from llm.metrics import annotate, instrumented, phase
+from llm.pdfs import PreparedPdf, prepare_pdf
+from llm.retrieval import focus_text
+from llm.singleflight import SingleFlight
+from llm.streaming import StreamTiming, astream_structured, astream_text
+from llm.tokens import count_tokens
 from pydantic import BaseModel, Field
 
-async def analyze_text (
-    text: str,
-    task: str = "analyze-text",
-) -> str:
+# Structured output schemas (module-level so pooled structured runnables are reused across calls)
+class AnalyzeTextSchema(BaseModel):
+    analysis: str = Field(description="A concise analysis of the text")
+
+class AnalyzeWebpageSchema(BaseModel):
+    title: str = Field(description="The title of the webpage")
+    description: str = Field(description="A clear, concise description of the webpage contents and relationships")
+    key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the webpage")
+
+class AnalyzeImageSchema(BaseModel):
+    description: str = Field(description="A clear, concise description of the image contents and relationships")
+    key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the image")
+
+class AnalyzePdfSchema(BaseModel):
+    description: str = Field(description="A clear, concise description of the PDF contents and relationships")
+    key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the PDF")
+
+# Concurrent fetches of the same URL share one download
+_FETCHES = SingleFlight("fetch")
+
+def _jina_reader_url(url: str) -> str:
+    # Transform any http/https url into Jina Reader endpoint
+    stripped = url.split("://", 1)[-1]
+    return f"https://r.jina.ai/http://{stripped}"
+
+async def _fetch_webpage_text(url: str, max_chars: int, raw_html: bool = False) -> str:
     """
-    Analyze text.
+    Fetch a webpage and return at most max_chars of its readable content as markdown (or of the raw
+    HTML when raw_html). The page is read directly or through Jina Reader, whichever works for its domain
+    (see llm.fetch_strategy). Concurrent calls for the same URL share a single fetch.
     """
-    print(f"[{task}] Analyzing text...")
+    async def direct(timeout: float) -> str:
+        headers = {
+            "User-Agent": (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+            )
+        }
+        # Streamed: reading stops once enough text has been decoded for extraction
+        with phase("fetch"):
+            body = await afetch_text(url, html_read_chars(max_chars, raw_html), headers=headers, timeout=timeout)
+        # Parsing a large page is CPU work; keep it off the event loop
+        with phase("preprocess"):
+            return await asyncio.to_thread(readable_text, body, max_chars, raw_html)
 
-    # Define structured output
-    class AnalyzeTextSchema(BaseModel):
-        analysis: str = Field(description="A concise analysis of the text")
+    async def jina(timeout: float) -> str:
+        # Jina Reader already returns readable text
+        with phase("fetch"):
+            return await afetch_text(_jina_reader_url(url), max_chars, timeout=timeout)
 
-    # Built prompt and invoke LLM
-    llm = get_llm_for(task).with_structured_output(AnalyzeTextSchema)
-    messages = [
+    async def fetch() -> tuple[str, str]:
+        return await get_fetch_strategy().afetch(url, {"direct": direct, "jina": jina})
+    text, source = await _FETCHES.ado(("text", url, max_chars, raw_html), fetch)
+    annotate(fetch_source=source)
+    return text
+
+async def _chunked_final_messages(task: str, system: str, instruction: str, text: str, label: str) -> Optional[list]:
+    """
+    Prepare text too long for one call: per-chunk notes run concurrently, then are reduced (in a tree for
+    very long inputs) until one call remains. Returns that call's messages, or None if the text fits in one call.
+    """
+    llm = get_llm_for(task)
+    overhead = count_tokens(system + instruction, llm.model_name)
+    # tiktoken over a long document is CPU work; keep it off the event loop
+    with phase("preprocess"):
+        chunks = await asyncio.to_thread(split_for_model, text, llm.model_name, overhead)
+    if len(chunks) <= 1:
+        return None
+    annotate(chunks=len(chunks))
+    system_message = {"role": "system", "content": system}
+    return await amap_reduce_messages(
+        llm,
+        chunks,
+        lambda chunk, i, n: [system_message, {"role": "user", "content": [{"type": "text", "text": map_prompt(instruction, chunk, i, n, label)}]}],
+        lambda partials: [system_message, {"role": "user", "content": [{"type": "text", "text": reduce_prompt(instruction, partials)}]}],
+        overhead_tokens=overhead,
+    )
+
+# Prompts (shared by the one-shot, streaming and bulk variants of each task). Each puts what stays the same
+# first (system prompt, then the document or image) and the instruction last: providers cache prompt
+# prefixes, so the same input analyzed again, or with another instruction, is mostly served from the cache
+_TEXT_SYSTEM = "You are an expert in analyzing text. Given a text, return a concise analysis of the text."
+_TEXT_INSTRUCTION = "Respond with a concise analysis of the text."
+_WEBPAGE_SYSTEM = "You are an expert web assistant. Analyze webpages and describe key details clearly."
+_IMAGE_SYSTEM = "You are an expert vision assistant. Analyze images and describe key details clearly."
+_PDF_SYSTEM = "You are an expert PDF assistant. Analyze PDFs and describe key details clearly."
+_PDF_INSTRUCTION = "Describe the PDF in detail."
+
+def _text_messages(text: str) -> list:
+    return [
         {
             "role": "system",
-            "content": "You are an expert in analyzing text. Given a text, return a concise analysis of the text.",
+            "content": _TEXT_SYSTEM,
         },
         {
             "role": "user",
             "content": [
                 {
                     "type": "text",
-                    "text": f"Text:\n{text}\n\n Respond with a concise analysis of the text."
+                    "text": f"Text:\n{text}\n\n {_TEXT_INSTRUCTION}"
                 },
             ],
         }
     ]
-    result = llm.invoke(messages)
-    return result.analysis
-
-async def analyze_webpage (
-	webpage_url: str,
-    max_chars: int = 12000,
-	task: str = "analyze-webpage",
-) -> str:    
-    """
-    Analyze a webpage for information. Webpage text is truncated to max_chars to ensure token limits are not exceeded.
-    """
-    print(f"[{task}] Analyzing webpage...")
 
-    # Fetch webpage text
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
-        )
-    }
-    with httpx.Client(headers=headers, timeout=20.0, follow_redirects=True) as client:
-        r = client.get(webpage_url)
-        r.raise_for_status()
-        text = r.text
-        webpage_text = text[:max(0, max_chars)]
-    
-    # Define structured output
-    class AnalyzeWebpageSchema(BaseModel):
-        title: str = Field(description="The title of the webpage")
-        description: str = Field(description="A clear, concise description of the webpage contents and relationships")
-        key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the webpage")
-
-    # Built prompt and invoke LLM
-    llm = get_llm_for(task).with_structured_output(AnalyzeWebpageSchema)
-    messages = [
+def _webpage_messages(webpage_text: str) -> list:
+    return [
         {
             "role": "system",
-            "content": "You are an expert web assistant. Analyze webpages and describe key details clearly.",
+            "content": _WEBPAGE_SYSTEM,
         },
         {
             "role": "user",
@@ -83,48 +137,210 @@ async def analyze_webpage (
             ],
         }
     ]
-    result = llm.invoke(messages)
-    return result.title, result.description, result.key_objects
 
-async def analyze_image_url (
-    image_url: str,
-    task: str = "analyze-image-url",
-) -> str:
-    """
-    Analyze an image given by a public URL using a multimodal chat model.
-    """
-    print(f"[{task}] Analyzing image via URL...")
-
-    # Define structured output
-    class AnalyzeImageSchema(BaseModel):
-        description: str = Field(description="A clear, concise description of the image contents and relationships")
-        key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the image")
-
-    # Built prompt and invoke LLM
-    llm = get_llm_for(task).with_structured_output(AnalyzeImageSchema)
-    messages = [
+def _image_messages(image_block: dict) -> list:
+    return [
         {
             "role": "system",
-            "content": "You are an expert vision assistant. Analyze images and describe key details clearly.",
+            "content": _IMAGE_SYSTEM,
         },
         {
             "role": "user",
             "content": [
+                image_block,
                 {
                     "type": "text",
-                    "text": "Describe the image in detail:",
-                },
-                {
-                    "type": "image",
-                    "source_type": "url",
-                    "url": image_url,
+                    "text": "Describe the image in detail.",
                 },
             ],
         }
     ]
-    result = llm.invoke(messages)
+
+def _pdf_file_block(pdf: PreparedPdf) -> dict:
+    return {
+        "type": "file",
+        "source_type": "base64",
+        "mime_type": "application/pdf",
+        "data": pdf.file_base64(),
+        "filename": "my-pdf"
+    }
+
+def _pdf_messages(pdf: PreparedPdf, instruction: Optional[str] = None) -> list:
+    content = []
+    if pdf.text:
+        content.append({"type": "text", "text": f"PDF text:\n{pdf.text}"})
+    if pdf.file_data is not None:
+        content.append(_pdf_file_block(pdf))
+    text = instruction or _PDF_INSTRUCTION
+    if pdf.note():
+        text = f"{pdf.note()}\n\n{text}"
+    content.append({"type": "text", "text": text})
+    return [
+        {
+            "role": "system",
+            "content": _PDF_SYSTEM,
+        },
+        {
+            "role": "user",
+            "content": content,
+        }
+    ]
+
+async def _prepare_pdf_messages(task: str, pdf_base64: str, pages: Optional[str], instruction: Optional[str]) -> list:
+    """
+    Extract the PDF's text locally (see llm.pdfs): text pages are sent as text (narrowed to the passages that
+    match an instruction), chunked and reduced when long, and only pages without a text layer are attached as
+    a PDF (to the final call).
+    """
+    model_name = get_llm_for(task).model_name
+    # Decoding and text extraction (in a process pool for long documents) are CPU work; keep them off the event loop
+    with phase("preprocess"):
+        data = await asyncio.to_thread(base64.b64decode, pdf_base64)
+        pdf = await asyncio.to_thread(prepare_pdf, data, instruction, pages, model_name)
+        if pdf.text and instruction:
+            # A narrow instruction only needs the passages that match it (see llm.retrieval)
+            pdf.text = await asyncio.to_thread(focus_text, pdf.text, instruction, model_name)
+    if pdf.page_count:
+        annotate(pdf_pages=pdf.page_count, pages_as_text=len(pdf.pages) - len(pdf.scanned), pages_as_file=len(pdf.scanned))
+    messages = None
+    if pdf.text:
+        messages = await _chunked_final_messages(task, _PDF_SYSTEM, instruction or _PDF_INSTRUCTION, pdf.text, "PDF text")
+    if messages is None:
+        return _pdf_messages(pdf, instruction)
+    if pdf.file_data is not None:
+        # The scanned pages go ahead of the final call's text, which ends with the instruction
+        *head, last = messages
+        messages = [*head, {**last, "content": [_pdf_file_block(pdf), *last["content"]]}]
+    return messages
+
+async def _analyze_text_messages(text: str, task: str = "analyze-text") -> list:
+    """
+    Messages for analyze_text's final call; text too long for one call is mapped over chunks first.
+    """
+    messages = await _chunked_final_messages(task, _TEXT_SYSTEM, _TEXT_INSTRUCTION, text, "Text")
+    return messages or _text_messages(text)
+
+async def _analyze_webpage_messages(
+    webpage_url: str,
+    max_chars: Optional[int] = None,
+    task: str = "analyze-webpage",
+    raw_html: bool = False,
+) -> list:
+    """
+    Fetch a webpage and build analyze_webpage's final call; long pages are mapped over chunks first.
+    """
+    webpage_text = await _fetch_webpage_text(webpage_url, max_chars or MAX_INPUT_CHARS, raw_html)
+    messages = await _chunked_final_messages(
+        task,
+        _WEBPAGE_SYSTEM,
+        f"Analyze the webpage text in detail (URL: {webpage_url}).",
+        webpage_text,
+        "Webpage text",
+    )
+    return messages or _webpage_messages(webpage_text)
+
+@instrumented()
+async def analyze_text (
+    text: str,
+    task: str = "analyze-text",
+) -> str:
+    """
+    Analyze text. Text too long for one call is analyzed in parallel chunks and combined.
+    """
+    # Built prompt (long input: map over token-budgeted chunks first) and invoke LLM
+    messages = await _analyze_text_messages(text, task)
+    llm = get_structured_llm_for(task, AnalyzeTextSchema)
+    result = await llm.ainvoke(messages)
+    return result.analysis
+
+@instrumented()
+async def astream_analyze_text (
+    text: str,
+    task: str = "analyze-text",
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of analyze_text: yields the analysis as text deltas as the model produces them.
+    For long text only the final combine step streams. Pass a StreamTiming to read time-to-first-token.
+    """
+    timing = timing or StreamTiming(task)
+
+    # Long input: map the chunks first, then stream the final combine step
+    messages = await _analyze_text_messages(text, task)
+    async for delta in astream_text(get_llm_for(task), messages, timing):
+        yield delta
+
+@instrumented()
+async def analyze_webpage (
+	webpage_url: str,
+    max_chars: Optional[int] = None,
+	task: str = "analyze-webpage",
+    raw_html: bool = False,
+) -> str:    
+    """
+    Analyze a webpage for information. The page's main content is extracted as markdown (raw_html=True
+    sends the HTML instead). Long pages are analyzed in parallel chunks and combined; max_chars optionally
+    caps how much text is read (default: chunking.max_input_chars).
+    """
+    # Fetch webpage text and build the prompt (long page: map over token-budgeted chunks first)
+    messages = await _analyze_webpage_messages(webpage_url, max_chars, task, raw_html)
+
+    # Invoke LLM
+    llm = get_structured_llm_for(task, AnalyzeWebpageSchema)
+    result = await llm.ainvoke(messages)
+    return result.title, result.description, result.key_objects
+
+@instrumented()
+async def astream_analyze_webpage (
+    webpage_url: str,
+    max_chars: Optional[int] = None,
+    task: str = "analyze-webpage",
+    raw_html: bool = False,
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[AnalyzeWebpageSchema]:
+    """
+    Streaming variant of analyze_webpage: yields partial AnalyzeWebpageSchema objects as fields fill in
+    (unfilled fields are None); the last one is complete. Time to first token includes the fetch.
+    """
+    timing = timing or StreamTiming(task)
+
+    # Fetch webpage text; long page: map the chunks first, then stream the final combine step
+    messages = await _analyze_webpage_messages(webpage_url, max_chars, task, raw_html)
+    llm = get_structured_llm_for(task, AnalyzeWebpageSchema)
+    async for partial in astream_structured(llm, AnalyzeWebpageSchema, messages, timing):
+        yield partial
+
+@instrumented()
+async def analyze_image_url (
+    image_url: str,
+    task: str = "analyze-image-url",
+) -> str:
+    """
+    Analyze an image given by a public URL using a multimodal chat model.
+    """
+    # Built prompt and invoke LLM
+    llm = get_structured_llm_for(task, AnalyzeImageSchema)
+    messages = _image_messages({"type": "image", "source_type": "url", "url": image_url})
+    result = await llm.ainvoke(messages)
     return result.description, result.key_objects
 
+@instrumented()
+async def astream_analyze_image_url (
+    image_url: str,
+    task: str = "analyze-image-url",
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[AnalyzeImageSchema]:
+    """
+    Streaming variant of analyze_image_url: yields partial AnalyzeImageSchema objects; the last one is complete.
+    """
+    timing = timing or StreamTiming(task)
+
+    llm = get_structured_llm_for(task, AnalyzeImageSchema)
+    messages = _image_messages({"type": "image", "source_type": "url", "url": image_url})
+    async for partial in astream_structured(llm, AnalyzeImageSchema, messages, timing):
+        yield partial
+
+@instrumented()
 async def analyze_image_base64 (
 	image_base64: str,
 	mime_type: str, # e.g., "image/jpeg"
@@ -132,78 +348,76 @@ async def analyze_image_base64 (
 ) -> str:
 	"""
 	Analyze an image given by a base64 string using a multimodal chat model.
+	The image is downscaled and recompressed for the model first (see llm.images); mime_type is only a fallback.
 	"""
-	print(f"[{task}] Analyzing image via base64...")
-
-	# Define structured output
-	class AnalyzeImageSchema(BaseModel):
-		description: str = Field(description="A clear, concise description of the image contents and relationships")
-		key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the image")
+	# Sniff the real format and downscale for the task's model (CPU work, off the event loop)
+	with phase("preprocess"):
+		image_base64, mime_type = await asyncio.to_thread(prepare_image_base64, image_base64, get_llm_for(task).model_name, mime_type)
 
 	# Built prompt and invoke LLM
-	llm = get_llm_for(task).with_structured_output(AnalyzeImageSchema)
-	messages = [
-		{
-			"role": "system",
-			"content": "You are an expert vision assistant. Analyze images and describe key details clearly.",
-		},
-		{
-			"role": "user",
-			"content": [
-				{
-					"type": "text",
-					"text": "Describe the image in detail:",
-				},
-				{
-					"type": "image",
-					"source_type": "base64",
-					"data": image_base64,
-					"mime_type": mime_type,
-				}
-			],
-		}
-	]
-	result = llm.invoke(messages)
+	llm = get_structured_llm_for(task, AnalyzeImageSchema)
+	messages = _image_messages({"type": "image", "source_type": "base64", "data": image_base64, "mime_type": mime_type})
+	result = await llm.ainvoke(messages)
 	return result.description, result.key_objects
 
+@instrumented()
+async def astream_analyze_image_base64 (
+    image_base64: str,
+    mime_type: str, # e.g., "image/jpeg"
+    task: str = "analyze-image-base64",
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[AnalyzeImageSchema]:
+    """
+    Streaming variant of analyze_image_base64: yields partial AnalyzeImageSchema objects; the last one is complete.
+    """
+    timing = timing or StreamTiming(task)
+
+    with phase("preprocess"):
+        image_base64, mime_type = await asyncio.to_thread(prepare_image_base64, image_base64, get_llm_for(task).model_name, mime_type)
+    llm = get_structured_llm_for(task, AnalyzeImageSchema)
+    messages = _image_messages({"type": "image", "source_type": "base64", "data": image_base64, "mime_type": mime_type})
+    async for partial in astream_structured(llm, AnalyzeImageSchema, messages, timing):
+        yield partial
+
+@instrumented()
 async def analyze_pdf_base64 (
 	pdf_base64: str,
 	task: str = "analyze-pdf-base64",
+	pages: Optional[str] = None, # e.g., "1-3, 7"
+	instruction: Optional[str] = None,
 ) -> str:
 	"""
 	Analyze a PDF given by a base64 string using a multimodal chat model.
+	Its text layer is extracted locally and sent as text; only scanned pages are sent as a PDF. pages limits
+	the analysis to page ranges; an instruction steers it, and for very long documents picks the relevant pages.
 	"""
-	print(f"[{task}] Analyzing PDF via base64...")
-
-	# Define structured output
-	class AnalyzePdfSchema(BaseModel):
-		description: str = Field(description="A clear, concise description of the PDF contents and relationships")
-		key_objects: List[str] = Field(default_factory=list, description="A list of notable objects/entities detected in the PDF")
-
 	# Built prompt and invoke LLM
-	llm = get_llm_for(task).with_structured_output(AnalyzePdfSchema)
-	messages = [
-		{
-			"role": "system",
-			"content": "You are an expert PDF assistant. Analyze PDFs and describe key details clearly.",
-		},
-		{
-			"role": "user",
-			"content": [
-				{
-					"type": "text",
-					"text": "Describe the PDF in detail:",
-				},
-				{
-					"type": "file",
-					"source_type": "base64",
-                    "mime_type": "application/pdf",
-					"data": pdf_base64,
-                    "filename": "my-pdf"
-				}
-			],
-		}
-	]
-	result = llm.invoke(messages)
+	messages = await _prepare_pdf_messages(task, pdf_base64, pages, instruction)
+	llm = get_structured_llm_for(task, AnalyzePdfSchema)
+	result = await llm.ainvoke(messages)
 	return result.description, result.key_objects
 
+@instrumented()
+async def astream_analyze_pdf_base64 (
+    pdf_base64: str,
+    task: str = "analyze-pdf-base64",
+    pages: Optional[str] = None,
+    instruction: Optional[str] = None,
+    timing: Optional[StreamTiming] = None,
+) -> AsyncIterator[AnalyzePdfSchema]:
+    """
+    Streaming variant of analyze_pdf_base64: yields partial AnalyzePdfSchema objects; the last one is complete.
+    """
+    timing = timing or StreamTiming(task)
+
+    messages = await _prepare_pdf_messages(task, pdf_base64, pages, instruction)
+    llm = get_structured_llm_for(task, AnalyzePdfSchema)
+    async for partial in astream_structured(llm, AnalyzePdfSchema, messages, timing):
+        yield partial
+
+# Bulk mode (see llm.bulk): the structured-output schema and final-call prompt builder behind each task
+# function. A builder takes the task function's arguments and returns the messages of its final call.
+BULK_TASKS = {
+    analyze_text: (AnalyzeTextSchema, _analyze_text_messages),
+    analyze_webpage: (AnalyzeWebpageSchema, _analyze_webpage_messages),
+}